@@ -6,14 +6,16 @@ API REST FastAPI para processamento de comprovantes financeiros.
 Reutiliza as funções existentes do CLI para manter consistência.
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import os
 import shutil
 import glob
 import re
 import time
+import json
+import asyncio
 from typing import Optional, List
 from pathlib import Path
 from .env import ATTR_FIN_DIR_INPUT, ATTR_FIN_DIR_DOCS
@@ -21,6 +23,8 @@ from .app import (
     processar_incremental,
     fix_entry
 )
+from .jobs import FilaJobs, STATUS_CONCLUIDO
+from .eventos import barramento, etapa, ETAPA_RENDER
 
 import signal
 import os
@@ -30,6 +34,12 @@ import sys
 _force_reload = False
 _last_update_time = time.time()
 _connection_manager = None
+_loop_api = None
+
+# Eventos de progresso pendentes por cliente SSE; clientes lentos perdem os eventos excedentes
+MAX_EVENTOS_SSE_PENDENTES = 100
+# Comentário enviado periodicamente para manter a conexão SSE aberta em proxies
+INTERVALO_KEEPALIVE_SSE = 15
 
 def trigger_server_reload():
     """Força o reload do servidor uvicorn"""
@@ -77,6 +87,70 @@ class ConnectionManager:
 # Inicializa o gerenciador de conexões
 _connection_manager = ConnectionManager()
 
+# Filas dos clientes conectados em GET /events (fallback SSE do WebSocket)
+_filas_sse = set()
+
+def _distribuir_evento_sse(evento: dict):
+    for fila in list(_filas_sse):
+        try:
+            fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            pass
+
+def _encaminhar_evento(evento: dict):
+    """Assinante do barramento: leva os eventos de progresso do pipeline (thread do job) aos
+    clientes WebSocket e SSE, agendando a entrega no event loop da API."""
+    loop = _loop_api
+    if loop is None or loop.is_closed():
+        return
+    if _connection_manager.active_connections:
+        asyncio.run_coroutine_threadsafe(_connection_manager.broadcast(json.dumps(evento)), loop)
+    if _filas_sse:
+        loop.call_soon_threadsafe(_distribuir_evento_sse, evento)
+
+barramento.assinar(_encaminhar_evento)
+
+def _registrar_loop_api():
+    global _loop_api
+    _loop_api = asyncio.get_running_loop()
+
+# Fila de jobs: o pipeline roda fora do event loop, que segue atendendo as demais requisições
+_fila_jobs = FilaJobs()
+
+def _submeter_job(tipo: str, funcao, parametros: dict, mensagem: str) -> JSONResponse:
+    """Enfileira o job e responde 202 com o endereço para acompanhar o status.
+
+    Ao final, publica o status do job (evento "job") aos clientes WebSocket e SSE; com sucesso,
+    atualiza o timestamp e envia "reload", agendando o broadcast no event loop da API a partir
+    da thread do job."""
+    _registrar_loop_api()
+    loop = _loop_api
+
+    def ao_concluir(job):
+        _encaminhar_evento({"type": "job", "job": job.como_dict()})
+        if job.status != STATUS_CONCLUIDO:
+            return
+        update_last_modified()
+        try:
+            asyncio.run_coroutine_threadsafe(_connection_manager.broadcast("reload"), loop)
+        except Exception as e:
+            print(f"Erro ao enviar notificação WebSocket: {e}")
+
+    job = _fila_jobs.submeter(tipo, funcao, parametros, ao_concluir=ao_concluir)
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "message": mensagem,
+            "data": {
+                **parametros,
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.id}"
+            }
+        }
+    )
+
 app = FastAPI(
     title="WA Fin Ctrl API",
     description="API REST para processamento de comprovantes financeiros do WhatsApp",
@@ -117,7 +191,9 @@ async def root():
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """Endpoint WebSocket para notificações em tempo real"""
+    """Endpoint WebSocket para notificações em tempo real: "reload" ao fim de um job e eventos de
+    progresso do pipeline em JSON ({"type": "progress", "stage": ..., "done": ..., "total": ...})"""
+    _registrar_loop_api()
     await _connection_manager.connect(websocket)
     try:
         while True:
@@ -131,6 +207,34 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"Erro no WebSocket: {e}")
         _connection_manager.disconnect(websocket)
 
+@app.get("/events")
+async def events(request: Request):
+    """
+    Fallback SSE do WebSocket: transmite os eventos de progresso do pipeline (etapa, itens
+    concluídos e total, vazão e ETA) e o status final dos jobs como text/event-stream.
+    """
+    _registrar_loop_api()
+    fila = asyncio.Queue(maxsize=MAX_EVENTOS_SSE_PENDENTES)
+    _filas_sse.add(fila)
+
+    async def transmitir():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    evento = await asyncio.wait_for(fila.get(), timeout=INTERVALO_KEEPALIVE_SSE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {evento.get('type', 'message')}\ndata: {json.dumps(evento)}\n\n"
+        finally:
+            _filas_sse.discard(fila)
+
+    return StreamingResponse(
+        transmitir(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/status")
 async def get_status():
     """
@@ -157,51 +261,35 @@ async def fix(
     """
     Corrige uma entrada específica em todos os arquivos CSV.
     Equivalente ao comando: make fix
+    Executa em segundo plano; acompanhe o resultado em GET /jobs/{job_id}.
     """
     try:
-        # Chama a função existente do app.py
-        sucesso = fix_entry(
-            data_hora=find,
-            novo_valor=value if value else None,
-            nova_descricao=desc if desc else None,
-            nova_classificacao=class_ if class_ else None,
-            dismiss=dismiss,
-            rotate=rotate if rotate else None,
-            ia=ia
-        )
-        
-        if sucesso:
-            # Atualiza timestamp
-            update_last_modified()
-            
-            # Notifica clientes via WebSocket
-            try:
-                await _connection_manager.broadcast("reload")
-            except Exception as e:
-                print(f"Erro ao enviar notificação WebSocket: {e}")
-            
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "success": True,
-                    "message": f"Entrada {find} corrigida com sucesso",
-                    "data": {
-                        "find": find,
-                        "value": value,
-                        "desc": desc,
-                        "class": class_,
-                        "rotate": rotate,
-                        "ia": ia,
-                        "dismiss": dismiss,
-                        "last_update": _last_update_time
-                    }
-                }
-            )
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Falha ao corrigir entrada {find}"
+        # Chama a função existente do app.py na fila de jobs
+        def executar():
+            return fix_entry(
+                data_hora=find,
+                novo_valor=value if value else None,
+                nova_descricao=desc if desc else None,
+                nova_classificacao=class_ if class_ else None,
+                dismiss=dismiss,
+                rotate=rotate if rotate else None,
+                ia=ia
             )
+        
+        return _submeter_job(
+            "fix",
+            executar,
+            {
+                "find": find,
+                "value": value,
+                "desc": desc,
+                "class": class_,
+                "rotate": rotate,
+                "ia": ia,
+                "dismiss": dismiss
+            },
+            f"Correção da entrada {find} enfileirada"
+        )
             
     except Exception as e:
         raise HTTPException(
@@ -217,31 +305,15 @@ async def process(
     """
     Processa arquivos incrementalmente.
     Equivalente ao comando: make process
+    Executa em segundo plano; acompanhe o resultado em GET /jobs/{job_id}.
     """
     try:
-        # Chama a função existente do app.py
-        processar_incremental(force=force, backup=backup)
-        
-        # Atualiza timestamp
-        update_last_modified()
-        
-        # Notifica clientes via WebSocket
-        try:
-            await _connection_manager.broadcast("reload")
-        except Exception as e:
-            print(f"Erro ao enviar notificação WebSocket: {e}")
-        
-        return JSONResponse(
-            status_code=200,
-            content={
-                "success": True,
-                "message": "Processamento concluído com sucesso",
-                "data": {
-                    "force": force,
-                    "backup": backup,
-                    "last_update": _last_update_time
-                }
-            }
+        # Chama a função existente do app.py na fila de jobs
+        return _submeter_job(
+            "process",
+            lambda: processar_incremental(force=force, backup=backup),
+            {"force": force, "backup": backup},
+            "Processamento enfileirado"
         )
         
     except Exception as e:
@@ -413,7 +485,7 @@ async def generate_reports(
     Gera relatórios HTML sob demanda.
     """
     try:
-        from .reporter import gerar_relatorio_html, gerar_relatorios_mensais_html
+        from .reporter import gerar_relatorio_html, gerar_relatorios_mensais_html, ReportContext
         from .env import ATTR_FIN_ARQ_CALCULO
         
         # Verifica se o arquivo de cálculo existe
@@ -423,21 +495,22 @@ async def generate_reports(
                 detail="Arquivo de cálculo não encontrado. Execute o processamento primeiro."
             )
         
-        # Gera relatórios
-        gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO, backup=backup)
-        gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO, backup=backup)
+        # Gera relatórios (planilha, OCR e imagens carregados uma única vez) na fila de jobs
+        def executar():
+            contexto = ReportContext(ATTR_FIN_ARQ_CALCULO)
+            with etapa(ETAPA_RENDER) as progresso:
+                gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO, backup=backup, contexto=contexto)
+                gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO, backup=backup, contexto=contexto, progresso=progresso)
         
-        return JSONResponse(
-            status_code=200,
-            content={
-                "success": True,
-                "message": "Relatórios gerados com sucesso",
-                "data": {
-                    "force": force,
-                    "backup": backup,
-                    "calculation_file": ATTR_FIN_ARQ_CALCULO
-                }
-            }
+        return _submeter_job(
+            "reports",
+            executar,
+            {
+                "force": force,
+                "backup": backup,
+                "calculation_file": ATTR_FIN_ARQ_CALCULO
+            },
+            "Geração de relatórios enfileirada"
         )
         
     except HTTPException:
@@ -448,6 +521,34 @@ async def generate_reports(
             detail=f"Erro ao gerar relatórios: {str(e)}"
         )
 
+@app.get("/jobs")
+async def list_jobs():
+    """
+    Lista os jobs em segundo plano, do mais antigo ao mais recente.
+    """
+    return {"jobs": [job.como_dict() for job in _fila_jobs.listar()]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status de um job: pendente, executando, concluido, falhou ou cancelado.
+    """
+    job = _fila_jobs.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job não encontrado: {job_id}")
+    return job.como_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Cancela um job: se ainda está na fila não chega a executar; em execução, para no próximo
+    ponto de verificação do pipeline.
+    """
+    job = _fila_jobs.cancelar(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job não encontrado: {job_id}")
+    return JSONResponse(status_code=202, content=job.como_dict())
+
 @app.get("/api/info")
 async def api_info():
     """
@@ -461,10 +562,14 @@ async def api_info():
             "GET /api/info": "Informações da API",
             "GET /api/reports": "Lista todos os relatórios disponíveis (JSON)",
             "GET /reports/{filename}": "Serve um relatório HTML específico",
-            "POST /fix": "Corrige uma entrada específica",
-            "POST /process": "Processa arquivos incrementalmente",
+            "POST /fix": "Corrige uma entrada específica (job em segundo plano)",
+            "POST /process": "Processa arquivos incrementalmente (job em segundo plano)",
             "POST /upload": "Faz upload de arquivo ZIP",
-            "POST /reports/generate": "Gera relatórios HTML sob demanda"
+            "POST /reports/generate": "Gera relatórios HTML sob demanda (job em segundo plano)",
+            "GET /events": "Eventos de progresso do pipeline (SSE; também enviados pelo WebSocket /ws)",
+            "GET /jobs": "Lista os jobs em segundo plano",
+            "GET /jobs/{job_id}": "Status de um job",
+            "POST /jobs/{job_id}/cancel": "Cancela um job"
         }
     }
 
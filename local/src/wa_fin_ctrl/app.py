@@ -1,91 +1,47 @@
 # app.py
 # Caminho relativo ao projeto: app.py
 # Módulo principal de processamento de comprovantes financeiros com suporte a OCR e IA
+# OpenCV, Tesseract, PIL e o cliente OpenAI são importados apenas nas funções que os usam,
+# para que comandos leves (dismiss, verificar, history) não paguem o custo de carregá-los
 import pandas as pd
-from openpyxl import load_workbook
 import sys
 import re
 import os
+import io
 import shutil
 import zipfile
-from PIL import Image
-import pytesseract
-import cv2
-import numpy as np
-from openai import OpenAI
-import base64
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import json
-from .reporter import gerar_relatorio_html, gerar_relatorios_mensais_html, gerar_html_impressao
-# Adiciona imports para PDF
-try:
-    import pdfplumber
-    from pdf2image import convert_from_path
-except ImportError:
-    pdfplumber = None
-    convert_from_path = None
-
-from .ocr import registrar_ocr_xml, process_image_ocr
+from .reporter import gerar_relatorio_html, gerar_relatorios_mensais_html, gerar_html_impressao, ReportContext, NOMES_MESES
+from .ocr import registrar_ocr_xml, process_image_ocr, compactar_ocr, executar_ocr_em_lote
 from .env import *
-from .helper import convert_to_brazilian_format
+from .helper import convert_to_brazilian_format, converter_serie_para_float
+from .chat import carregar_mensagens_chat, agrupar_mensagens_chat, ler_mensagens_chat, mesclar_mensagens_chat, escrever_mensagens_chat
+from .valores import extrair_valor_monetario
+from .db import obter_banco, gravar_planilha
+from .jobs import verificar_cancelamento
+from .eventos import etapa, ETAPA_UNZIP, ETAPA_PARSE, ETAPA_OCR, ETAPA_IA, ETAPA_TOTAIS, ETAPA_RENDER
+from .ia import (
+    extract_total_value_with_chatgpt,
+    generate_payment_description_with_chatgpt,
+    classify_transaction_type_with_chatgpt,
+    extrair_dados_comprovante_com_chatgpt,
+    extrair_dados_comprovantes_em_lote,
+    process_image_with_ai_for_value,
+    processar_imagens_com_ia_em_lote
+)
+
+# Colunas reaproveitadas do calculo.csv existente para anexos já processados
+COLUNAS_RECUPERADAS = ['OCR', 'VALOR', 'DESCRICAO', 'CLASSIFICACAO', 'RICARDO', 'RAFAEL', 'VALIDADE']
 
 def extract_value_from_ocr(ocr_text):
-    """Extrai valor monetário do texto OCR usando expressões regulares"""
+    """Extrai valor monetário do texto OCR (retorna o maior valor encontrado, geralmente o total)"""
     if not ocr_text:
         return ""
-    
-    # Padrões para encontrar valores no texto OCR
-    padroes_valor = [
-        r'R\$\s*([0-9.,]+)',  # R$ 123,45
-        r'valor\s*R\$\s*([0-9.,]+)',  # valor R$ 123,45
-        r'([0-9.,]+)\s*reais',  # 123,45 reais
-        r'total\s*R\$\s*([0-9.,]+)',  # total R$ 123,45
-        r'pago\s*R\$\s*([0-9.,]+)',  # pago R$ 123,45
-        r'R\$\s*([0-9.,]+)\s*dados',  # R$ 123,45 dados
-        r'valor\s*:\s*R\$\s*([0-9.,]+)',  # valor: R$ 123,45
-        r'([0-9.,]+)\s*via\s*celular',  # 123,45 via celular
-        r'([0-9.,]+)\s*realizado',  # 123,45 realizado
-        r'VALOR\s*TOTAL\s*R\$\s*([0-9.,]+)',  # VALOR TOTAL R$ 123,45
-        r'VALOR\s*A\s*PAGAR\s*R\$\s*([0-9.,]+)',  # VALOR A PAGAR R$ 123,45
-        r'R\$\s*([0-9.,]+)\s*realizado',  # R$ 123,45 realizado
-        r'valor\s*R\$\s*([0-9.,]+)\s*realizado',  # valor R$ 123,45 realizado
-        r'([0-9.,]+)\s*R\$',  # 123,45 R$
-        r'R\$\s*([0-9.,]+)\s*R\$',  # R$ 123,45 R$
-    ]
-    
-    valores_encontrados = []
-    
-    for padrao in padroes_valor:
-        matches = re.findall(padrao, ocr_text, re.IGNORECASE)
-        for match in matches:
-            if match:
-                # Limpa o valor encontrado
-                valor_limpo = match.strip()
-                # Remove caracteres não numéricos exceto vírgula e ponto
-                valor_limpo = re.sub(r'[^\d,.]', '', valor_limpo)
-                if valor_limpo:
-                    valores_encontrados.append(valor_limpo)
-    
-    if not valores_encontrados:
-        return ""
-    
-    # Se encontrou múltiplos valores, retorna o maior (geralmente o total)
-    valores_float = []
-    for valor in valores_encontrados:
-        try:
-            from .helper import normalize_value_to_brazilian_format
-            valor_brasileiro = normalize_value_to_brazilian_format(valor)
-            valor_float = float(valor_brasileiro.replace(',', '.'))
-            valores_float.append(valor_float)
-        except ValueError:
-            continue
-    
-    if not valores_float:
-        return ""
-    
-    # Retorna o maior valor encontrado
-    maior_valor = max(valores_float)
-    return f"{maior_valor:.2f}".replace('.', ',')
+    return extrair_valor_monetario(ocr_text, 'maior')
 
 
 def is_financial_receipt(ocr_text):
@@ -111,218 +67,81 @@ def is_financial_receipt(ocr_text):
     return matches >= 2
 
 
-def extract_total_value_with_chatgpt(ocr_text):
-    """Usa a API do ChatGPT para identificar o valor total da compra no texto OCR"""
-    try:
-        # Verifica se a chave da API está disponível
-        api_key = ATTR_FIN_OPENAI_API_KEY
-        if not api_key:
-            return ""
-        
-        # Verifica se há texto para processar
-        if not ocr_text or ocr_text in ["Arquivo não encontrado", "Erro ao carregar imagem", "Nenhum texto detectado"]:
-            return ""
-        
-        # Inicializa o cliente OpenAI
-        client = OpenAI(api_key=api_key)
-        
-        # Prompt para o ChatGPT
-        prompt = f"""
-        Analise o seguinte texto extraído de um comprovante financeiro e identifique APENAS o valor total da transação.
-        
-        Texto: {ocr_text}
-        
-        Instruções:
-        - Retorne APENAS o valor numérico (ex: 29.90 ou 1533.27 ou 29,90)
-        - Se houver múltiplos valores, retorne o valor da transação principal
-        - Se não conseguir identificar um valor, retorne "NENHUM"
-        - Não inclua "R$" ou outros símbolos
-        - Não retorne explicações, apenas o número
-        
-        Valor total:
-        """
-        
-        # Chama a API do ChatGPT
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Você é um especialista em análise de comprovantes financeiros. Extraia apenas o valor total das transações."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=50,
-            temperature=0.1
-        )
-        
-        # Extrai a resposta
-        valor = response.choices[0].message.content.strip()
-        
-        # Limpa a resposta removendo caracteres indesejados
-        valor = re.sub(r'[^\d,.]', '', valor)
-        
-        # Se não encontrou valor válido, retorna vazio
-        if not valor or valor.upper() == "NENHUM" or len(valor) == 0:
-            return ""
-        
-        # Converte para formato brasileiro padronizado
-        from .helper import normalize_value_to_brazilian_format
-        valor_brasileiro = normalize_value_to_brazilian_format(valor)
-        
-        return valor_brasileiro
-        
-    except Exception as e:
-        return ""
+def enriquecer_anexos(itens):
+    """Etapa de IA em lote: recebe uma lista de (caminho, ocr_text) e retorna, na
+    mesma ordem, dicionários com VALOR, DESCRICAO, CLASSIFICACAO, comprovante e ai_check.
 
-def generate_payment_description_with_chatgpt(ocr_text):
-    """Usa a API do ChatGPT para gerar uma descrição do pagamento baseado no texto OCR"""
-    try:
-        # Verifica se a chave da API está disponível
-        api_key = ATTR_FIN_OPENAI_API_KEY
-        if not api_key:
-            return ""
-        
-        # Verifica se há texto para processar
-        if not ocr_text or ocr_text in ["Arquivo não encontrado", "Erro ao carregar imagem", "Nenhum texto detectado"]:
-            return ""
-        
-        # Inicializa o cliente OpenAI
-        client = OpenAI(api_key=api_key)
-        
-        # Prompt para o ChatGPT
-        prompt = f"""
-        Analise o seguinte texto extraído de um comprovante financeiro e crie uma descrição concisa do pagamento.
-        
-        Texto: {ocr_text}
-        
-        Instruções:
-        - Identifique o tipo de estabelecimento (padaria, farmácia, supermercado, etc.)
-        - Identifique o nome do estabelecimento se possível
-        - Identifique o tipo de transação (compra, recarga, transferência, etc.)
-        - Crie uma descrição de 3-5 palavras máximo
-        - Use formato: "Tipo - Estabelecimento" (ex: "Compra - Padaria Bonanza", "Medicamentos - Drogaria", "Recarga celular")
-        - Se não conseguir identificar, retorne "Pagamento"
-        
-        Descrição:
-        """
-        
-        # Chama a API do ChatGPT
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Você é um especialista em análise de comprovantes financeiros. Crie descrições concisas e úteis para categorizações de gastos."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=30,
-            temperature=0.3
-        )
-        
-        # Extrai a resposta
-        descricao = response.choices[0].message.content.strip()
-        
-        # Remove aspas e caracteres especiais desnecessários
-        descricao = re.sub(r'["\']', '', descricao)
-        
-        # Se a descrição estiver vazia ou muito genérica, retorna "Pagamento"
-        if not descricao or len(descricao.strip()) == 0:
-            return "Pagamento"
-        
-        return descricao.strip()
-        
-    except Exception as e:
-        return "Pagamento"
+    O valor vem primeiro do regex no OCR, depois da extração estruturada e, por último, da IA
+    com imagem; as chamadas à IA de todos os anexos são feitas de forma concorrente."""
+    itens = list(itens)
+    with etapa(ETAPA_IA, total=len(itens)) as progresso:
+        return _enriquecer_anexos(itens, progresso)
 
-def classify_transaction_type_with_chatgpt(ocr_text):
-    """Usa a API do ChatGPT para classificar o tipo de transação (Pagamento ou Transferência)"""
-    try:
-        # Verifica se a chave da API está disponível
-        api_key = ATTR_FIN_OPENAI_API_KEY
-        if not api_key:
-            return ""
-        
-        # Verifica se há texto para processar
-        if not ocr_text or ocr_text in ["Arquivo não encontrado", "Erro ao carregar imagem", "Nenhum texto detectado"]:
-            return ""
-        
-        # Inicializa o cliente OpenAI
-        client = OpenAI(api_key=api_key)
-        
-        # Prompt para o ChatGPT
-        prompt = f"""
-        Analise o seguinte texto extraído de um comprovante financeiro e classifique o tipo de transação.
-        
-        Texto: {ocr_text}
-        
-        Instruções:
-        - Se for uma transferência PIX, TED, DOC ou transferência entre contas, retorne "Transferência"
-        - Se for um pagamento por débito, crédito, compra direta em estabelecimento comercial, retorne "Pagamento"
-        - Retorne APENAS uma das duas opções: "Transferência" ou "Pagamento"
-        - Não retorne explicações, apenas a classificação
-        
-        Classificação:
-        """
-        
-        # Chama a API do ChatGPT
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Você é um especialista em análise de comprovantes financeiros. Classifique transações como Transferência ou Pagamento."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=10,
-            temperature=0.1
-        )
-        
-        # Extrai a resposta
-        classificacao = response.choices[0].message.content.strip()
-        
-        # Remove aspas e caracteres especiais desnecessários
-        classificacao = re.sub(r'["\']', '', classificacao)
-        
-        # Normaliza a classificação
-        if "transferência" in classificacao.lower():
-            return "Transferência"
-        elif "pagamento" in classificacao.lower():
-            return "Pagamento"
-        else:
-            # Fallback baseado no conteúdo do texto
-            if any(palavra in ocr_text.lower() for palavra in ["pix", "transferência", "ted", "doc"]):
-                return "Transferência"
-            else:
-                return "Pagamento"
-        
-    except Exception as e:
-        return "Pagamento"
+def _enriquecer_anexos(itens, progresso):
+    dados_ia = extrair_dados_comprovantes_em_lote([ocr_text for _, ocr_text in itens], progresso=progresso)
+    resultados = []
+    pendentes_imagem = []
+    for posicao, ((caminho, ocr_text), dados) in enumerate(zip(itens, dados_ia)):
+        resultado = {
+            'VALOR': "",
+            'DESCRICAO': dados['descricao'],
+            'CLASSIFICACAO': dados['classificacao'],
+            'comprovante': is_financial_receipt(ocr_text),
+            'ai_check': False
+        }
+        if resultado['comprovante']:
+            # Primeiro tenta extrair valor via regex do OCR; se não encontrar, usa o da IA
+            resultado['VALOR'] = extract_value_from_ocr(ocr_text)
+            if not resultado['VALOR']:
+                resultado['VALOR'] = dados['valor']
+                resultado['ai_check'] = True
+            # Se ainda não encontrou valor, tenta com a imagem + OCR
+            if not resultado['VALOR']:
+                pendentes_imagem.append(posicao)
+        resultados.append(resultado)
+    
+    if pendentes_imagem:
+        print(f"  - Tentando processamento com imagem + OCR via IA para {len(pendentes_imagem)} anexos...")
+        progresso.definir_total(len(itens) + len(pendentes_imagem))
+        respostas = processar_imagens_com_ia_em_lote([itens[p] for p in pendentes_imagem], progresso=progresso)
+        for posicao, (valor_total, classificacao_final) in zip(pendentes_imagem, respostas):
+            # Sem valor a IA com imagem classifica como desconhecido
+            resultados[posicao]['VALOR'] = valor_total
+            resultados[posicao]['CLASSIFICACAO'] = classificacao_final if valor_total else "desconhecido"
+    return resultados
 
-def txt_to_csv(input_file, output_file):
-    """Funcionalidade original - extrai todos os dados das mensagens"""
-    # Lê cada linha completa do arquivo de chat
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    df = pd.DataFrame(lines, columns=['raw'])
+def executar_ocr_com_progresso(caminhos, workers=None):
+    """executar_ocr_em_lote publicando o progresso da etapa de OCR no barramento de eventos"""
+    with etapa(ETAPA_OCR) as progresso:
+        return executar_ocr_em_lote(caminhos, workers, progresso=progresso)
 
-    # Padrão mais flexível para capturar linhas com caracteres invisíveis
-    pattern = r'.*?\[([\d]{2}/[\d]{2}/\d{4}), (\d{2}:\d{2}:\d{2})\] ([^:]+): (.*)$'
-    df[['data', 'hora', 'remetente', 'mensagem']] = df['raw'].str.extract(pattern)
-    
-    # Extrai o nome do arquivo de anexo, se houver
-    df['anexo'] = df['mensagem'].str.extract(r'<anexado:\s*([^>]+)>', expand=False).str.strip()
-    df['anexo'] = df['anexo'].fillna('')
-    
-    # Adiciona coluna para dados do OCR
-    df['OCR'] = ''
-    # Adiciona coluna para validade
-    df['VALIDADE'] = ''
+def txt_to_csv(input_file, output_file, workers=None, mensagens=None):
+    """Funcionalidade original - extrai todos os dados das mensagens
+
+    `mensagens` é o DataFrame de carregar_mensagens_chat já lido do mesmo arquivo; se omitido,
+    o chat é lido aqui."""
+    if mensagens is None:
+        mensagens = carregar_mensagens_chat(input_file)
+    # Adiciona colunas para dados do OCR e para validade (sem alterar o DataFrame compartilhado)
+    df = mensagens.assign(OCR='', VALIDADE='')
     
     # Processa OCR apenas para anexos que existem no diretório input/
     input_dir = ATTR_FIN_DIR_INPUT
     print("Processando OCR das imagens novas...")
+    # Etapa de OCR: extrai em paralelo as imagens novas de input/ antes de montar o DataFrame
+    caminhos_ocr = {
+        idx: os.path.join(input_dir, anexo)
+        for idx, anexo in df['anexo'].items()
+        if anexo.endswith(('.jpg', '.jpeg', '.png')) and os.path.exists(os.path.join(input_dir, anexo))
+    }
+    resultados_ocr = dict(zip(caminhos_ocr, executar_ocr_com_progresso(caminhos_ocr.values(), workers)))
     for idx, row in df.iterrows():
         if row['anexo'] and (row['anexo'].endswith('.jpg') or row['anexo'].endswith('.jpeg') or row['anexo'].endswith('.png')):
             # Verifica se o arquivo existe em input/ (imagens novas)
             caminho_input = os.path.join(input_dir, row['anexo'])
             if os.path.exists(caminho_input):
                 print(f"Processando OCR: {row['anexo']}")
-                ocr_result = process_image_ocr(caminho_input)
-                df.at[idx, 'OCR'] = ocr_result
+                df.at[idx, 'OCR'] = resultados_ocr[idx]
             else:
                 # Se não está em input/, verifica se está em imgs/ (já processado)
                 caminho_imgs = os.path.join(ATTR_FIN_DIR_IMGS, row['anexo'])
@@ -331,9 +150,6 @@ def txt_to_csv(input_file, output_file):
                     # Não processa OCR novamente para economizar tempo
                     df.at[idx, 'OCR'] = "Já processado anteriormente"
     
-    # Remove a coluna bruta
-    df.drop(columns=['raw'], inplace=True)
-    
     # Incrementa o CSV em vez de sobrescrever
     incrementar_csv(df, output_file)
     
@@ -472,10 +288,11 @@ def incrementar_csv(novo_df, arquivo_csv):
             print(f"CSV {arquivo_csv} mantido inalterado - nenhum registro novo encontrado")
     else:
         df_combinado = novo_df
+        novos_registros = novo_df
         print(f"CSV {arquivo_csv} criado com {len(novo_df)} registros")
     
-    # Salva o arquivo combinado
-    df_combinado.to_csv(arquivo_csv, index=False, quoting=1)
+    # Grava no banco apenas os novos registros e exporta o arquivo combinado
+    gravar_planilha(df_combinado, arquivo_csv, novos=novos_registros, quoting=1)
     
     return df_combinado
 
@@ -498,17 +315,6 @@ def adicionar_totalizacao_mensal(df):
     from datetime import datetime, timedelta
     import calendar
     
-    # Função auxiliar para converter valores para float
-    def convert_to_float(value):
-        if pd.isna(value) or value == '':
-            return 0.0
-        try:
-            from .helper import normalize_value_to_brazilian_format
-            valor_brasileiro = normalize_value_to_brazilian_format(value)
-            return float(valor_brasileiro.replace(',', '.'))
-        except:
-            return 0.0
-    
     # Converte DATA para datetime para facilitar ordenação e agrupamento
     df['DATA_DT'] = pd.to_datetime(df['DATA'], format='%d/%m/%Y', errors='coerce')
     
@@ -526,39 +332,41 @@ def adicionar_totalizacao_mensal(df):
     meses_unicos = df_sem_totais['MES_ANO'].dropna().unique()
     
     # Para cada mês, calcula totais e adiciona linha de totalização
-    for mes_periodo in sorted(meses_unicos):
-        # Filtra dados do mês (excluindo totalizações)
-        dados_mes = df_sem_totais[df_sem_totais['MES_ANO'] == mes_periodo]
-        
-        # Calcula totais do mês
-        total_ricardo = dados_mes['RICARDO'].apply(convert_to_float).sum()
-        total_rafael = dados_mes['RAFAEL'].apply(convert_to_float).sum()
-        
-        # Se há valores a totalizar
-        if total_ricardo > 0 or total_rafael > 0:
-            # Calcula último dia do mês
-            ano = mes_periodo.year
-            mes = mes_periodo.month
-            ultimo_dia = calendar.monthrange(ano, mes)[1]
+    with etapa(ETAPA_TOTAIS, total=len(meses_unicos)) as progresso:
+        for mes_periodo in sorted(meses_unicos):
+            # Filtra dados do mês (excluindo totalizações)
+            dados_mes = df_sem_totais[df_sem_totais['MES_ANO'] == mes_periodo]
+        
+            # Calcula totais do mês
+            total_ricardo = converter_serie_para_float(dados_mes['RICARDO']).sum()
+            total_rafael = converter_serie_para_float(dados_mes['RAFAEL']).sum()
+        
+            # Se há valores a totalizar
+            if total_ricardo > 0 or total_rafael > 0:
+                # Calcula último dia do mês
+                ano = mes_periodo.year
+                mes = mes_periodo.month
+                ultimo_dia = calendar.monthrange(ano, mes)[1]
             
-            # Cria linha de totalização
-            linha_total = {
-                'DATA': f'{ultimo_dia:02d}/{mes:02d}/{ano}',
-                'HORA': '23:59:00',
-                'REMETENTE': 'TOTAL MÊS',
-                'CLASSIFICACAO': 'TOTAL',
-                'RICARDO': f'{total_ricardo:.2f}' if total_ricardo > 0 else '',
-                'RAFAEL': f'{total_rafael:.2f}' if total_rafael > 0 else '',
-                'ANEXO': f'TOTAL_{mes:02d}_{ano}',
-                'DESCRICAO': f'Total do mês {mes:02d}/{ano}',
-                'VALOR': '',
-                'OCR': '',
-                'VALIDADE': '',
-                'DATA_DT': datetime(ano, mes, ultimo_dia, 23, 59),
-                'MES_ANO': mes_periodo
-            }
+                # Cria linha de totalização
+                linha_total = {
+                    'DATA': f'{ultimo_dia:02d}/{mes:02d}/{ano}',
+                    'HORA': '23:59:00',
+                    'REMETENTE': 'TOTAL MÊS',
+                    'CLASSIFICACAO': 'TOTAL',
+                    'RICARDO': f'{total_ricardo:.2f}' if total_ricardo > 0 else '',
+                    'RAFAEL': f'{total_rafael:.2f}' if total_rafael > 0 else '',
+                    'ANEXO': f'TOTAL_{mes:02d}_{ano}',
+                    'DESCRICAO': f'Total do mês {mes:02d}/{ano}',
+                    'VALOR': '',
+                    'OCR': '',
+                    'VALIDADE': '',
+                    'DATA_DT': datetime(ano, mes, ultimo_dia, 23, 59),
+                    'MES_ANO': mes_periodo
+                }
             
-            linhas_totalizacao.append(linha_total)
+                linhas_totalizacao.append(linha_total)
+            progresso.avancar()
     
     # Adiciona as linhas de totalização ao DataFrame sem totais
     if linhas_totalizacao:
@@ -576,8 +384,11 @@ def adicionar_totalizacao_mensal(df):
     
     return df_combinado
 
-def txt_to_csv_anexos_only(input_file=None, output_file=None, filter=None):
-    """Nova funcionalidade - extrai apenas dados de anexos (DATA/HORA, remetente, anexos e OCR) com valor total via ChatGPT"""
+def txt_to_csv_anexos_only(input_file=None, output_file=None, filter=None, workers=None, mensagens=None):
+    """Nova funcionalidade - extrai apenas dados de anexos (DATA/HORA, remetente, anexos e OCR) com valor total via ChatGPT
+
+    `mensagens` é o DataFrame de carregar_mensagens_chat já lido do mesmo arquivo; se omitido,
+    o chat é lido aqui."""
     
     # Se não foi fornecido input_file, usa o arquivo de chat padrão
     if input_file is None:
@@ -593,35 +404,22 @@ def txt_to_csv_anexos_only(input_file=None, output_file=None, filter=None):
     if output_file is None:
         output_file = ATTR_FIN_ARQ_CALCULO
     
-    # Lê cada linha completa do arquivo de chat
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    df = pd.DataFrame(lines, columns=['raw'])
-
-    # Padrão mais flexível para capturar linhas com caracteres invisíveis
-    pattern = r'.*?\[([\d]{2}/[\d]{2}/\d{4}), (\d{2}:\d{2}:\d{2})\] ([^:]+): (.*)$'
-    df[['data', 'hora', 'remetente', 'mensagem']] = df['raw'].str.extract(pattern)
-    
-    # Extrai o nome do arquivo de anexo, se houver
-    df['anexo'] = df['mensagem'].str.extract(r'<anexado:\s*([^>]+)>', expand=False).str.strip()
-    df['anexo'] = df['anexo'].fillna('')
+    if mensagens is None:
+        mensagens = carregar_mensagens_chat(input_file)
     
-    # Filtra apenas linhas que têm anexos (remove mensagens de texto)
-    df_anexos = df[df['anexo'] != ''].copy()
+    # Filtra apenas mensagens que têm anexos (a coluna mensagem não é necessária aqui)
+    df_anexos = mensagens.loc[mensagens['anexo'] != '', ['data', 'hora', 'remetente', 'anexo']].copy()
     
     # Aplica filtro por tipo de arquivo se especificado
     if filter == 'pdf':
-        df_anexos = df_anexos[df_anexos['anexo'].str.lower().endswith('.pdf')].copy()
+        df_anexos = df_anexos[df_anexos['anexo'].str.lower().str.endswith('.pdf')].copy()
         print(f"Filtro aplicado: apenas PDFs ({len(df_anexos)} arquivos)")
     elif filter == 'img':
-        df_anexos = df_anexos[df_anexos['anexo'].str.lower().endswith(('.jpg','.jpeg','.png'))].copy()
+        df_anexos = df_anexos[df_anexos['anexo'].str.lower().str.endswith(('.jpg','.jpeg','.png'))].copy()
         print(f"Filtro aplicado: apenas imagens ({len(df_anexos)} arquivos)")
     else:
         print(f"Processando todos os anexos ({len(df_anexos)} arquivos)")
     
-    # Remove a coluna mensagem pois não precisamos dela
-    df_anexos.drop(columns=['mensagem'], inplace=True)
-    
     # Normaliza os nomes dos remetentes
     df_anexos['remetente'] = df_anexos['remetente'].apply(normalize_sender)
     
@@ -643,94 +441,61 @@ def txt_to_csv_anexos_only(input_file=None, output_file=None, filter=None):
     # Adiciona coluna para validade
     df_anexos['VALIDADE'] = ''
     
-    # 1) carrega CSV existente para recuperação de dados
+    # 1) carrega CSV existente indexado por ANEXO (primeira ocorrência) para recuperação de dados
     if os.path.exists(output_file):
         df_existente = pd.read_csv(output_file)
-        processed = set(df_existente['ANEXO'].astype(str))
+        df_existente['ANEXO'] = df_existente['ANEXO'].astype(str)
+        anteriores = df_existente.drop_duplicates('ANEXO').set_index('ANEXO').reindex(columns=COLUNAS_RECUPERADAS)
     else:
-        df_existente = pd.DataFrame()
-        processed = set()
+        anteriores = pd.DataFrame(columns=COLUNAS_RECUPERADAS)
+    processed = anteriores.index
+    
+    # 2) anexos já processados antes: recupera os valores numa única atribuição e pula chamadas de API
+    ja_processados = df_anexos['ANEXO'].astype(str).isin(processed)
+    if ja_processados.any():
+        chaves = df_anexos.loc[ja_processados, 'ANEXO'].astype(str)
+        df_anexos.loc[ja_processados, COLUNAS_RECUPERADAS] = anteriores.loc[chaves].to_numpy()
+        # Se foi marcado com ai-check, pula a tentativa de identificação de valor
+        for anexo in df_anexos.loc[ja_processados & (df_anexos['VALIDADE'] == 'ai-check'), 'ANEXO']:
+            print(f"  - Pulado (ai-check): {anexo}")
     
     # Processa OCR e extração de valor apenas para anexos que são imagens novas
     input_dir = ATTR_FIN_DIR_INPUT
     print("Processando OCR das imagens novas (apenas anexos)...")
-    for idx, row in df_anexos.iterrows():
-        # 2) se já processado antes, recupera valores e pula chamadas de API
-        anexo = str(row['ANEXO'])
-        if anexo in processed:
-            prev = df_existente[df_existente['ANEXO'] == anexo].iloc[0]
-            for col in ['OCR','VALOR','DESCRICAO','CLASSIFICACAO','RICARDO','RAFAEL','VALIDADE']:
-                df_anexos.at[idx, col] = prev[col]
-            
-            # Se foi marcado com ai-check, pula a tentativa de identificação de valor
-            if prev.get('VALIDADE', '') == 'ai-check':
-                print(f"  - Pulado (ai-check): {row['ANEXO']}")
-            
+    # Etapa de OCR: extrai em paralelo os anexos novos antes das chamadas de IA
+    caminhos_ocr = {}
+    for idx, anexo in df_anexos.loc[~ja_processados, 'ANEXO'].items():
+        anexo = str(anexo)
+        if not anexo.lower().endswith(('.jpg', '.jpeg', '.png', '.pdf')):
             continue
-            
+        caminho_input = os.path.join(input_dir, anexo)
+        if not os.path.exists(caminho_input):
+            caminho_input = os.path.join(ATTR_FIN_DIR_IMGS, anexo)
+        if os.path.exists(caminho_input):
+            caminhos_ocr[idx] = caminho_input
+    resultados_ocr = dict(zip(caminhos_ocr, executar_ocr_com_progresso(caminhos_ocr.values(), workers)))
+    # Etapa de IA: enriquece em lote (chamadas concorrentes) os anexos novos, mantendo a ordem das linhas
+    itens_ia = [(caminho, resultados_ocr[idx]) for idx, caminho in caminhos_ocr.items()]
+    resultados_ia = dict(zip(caminhos_ocr, enriquecer_anexos(itens_ia)))
+    for idx, row in df_anexos[~ja_processados].iterrows():
         # Trata imagens e PDFs da mesma forma
         if row['ANEXO'] and row['ANEXO'].lower().endswith(('.jpg', '.jpeg', '.png', '.pdf')):
-            # Tenta localizar no diretório input, senão imgs
-            caminho_input = os.path.join(input_dir, row['ANEXO'])
-            if not os.path.exists(caminho_input):
-                caminho_input = os.path.join(ATTR_FIN_DIR_IMGS, row['ANEXO'])
-            
-            if os.path.exists(caminho_input):
+            if idx in resultados_ia:
                 print(f"Processando OCR: {row['ANEXO']}")
-                ocr_result = process_image_ocr(caminho_input)
-                df_anexos.at[idx, 'OCR'] = ocr_result
-                
-                # Verifica se é um comprovante financeiro
-                is_receipt = is_financial_receipt(ocr_result)
-                
-                # Extrai valor total - primeiro tenta OCR, depois IA como fallback
-                valor_total = ""
-                ai_used = False
-                classificacao_final = ""
+                df_anexos.at[idx, 'OCR'] = resultados_ocr[idx]
+                resultado = resultados_ia[idx]
                 
-                if is_receipt:
-                    # Primeiro tenta extrair valor via regex do OCR
-                    valor_total = extract_value_from_ocr(ocr_result)
-                    
-                    # Se não encontrou valor via OCR, usa IA como fallback
-                    if not valor_total:
-                        valor_total = extract_total_value_with_chatgpt(ocr_result)
-                        ai_used = True
-                        print(f"  - IA usada para extração de valor (OCR não encontrou)")
-                    
-                    # Se ainda não encontrou valor, tenta com a imagem + OCR
-                    if not valor_total:
-                        print(f"  - Tentando processamento com imagem + OCR via IA...")
-                        valor_total, classificacao_final = process_image_with_ai_for_value(caminho_input, ocr_result)
-                        ai_used = True
-                        if valor_total:
-                            print(f"  - Valor identificado via IA com imagem: {valor_total}")
-                        else:
-                            print(f"  - IA não conseguiu identificar valor, classificando como desconhecido")
-                            classificacao_final = "desconhecido"
-                    
-                    # Marca na coluna VALIDADE se IA foi usada
-                    if ai_used:
-                        df_anexos.at[idx, 'VALIDADE'] = "ai-check"
-                else:
+                if not resultado['comprovante']:
                     print(f"  - Não identificado como comprovante financeiro")
+                elif resultado['ai_check']:
+                    # Marca na coluna VALIDADE se IA foi usada
+                    print(f"  - IA usada para extração de valor (OCR não encontrou)")
+                    df_anexos.at[idx, 'VALIDADE'] = "ai-check"
                 
+                valor_total = resultado['VALOR']
+                classificacao = resultado['CLASSIFICACAO']
                 df_anexos.at[idx, 'VALOR'] = valor_total
-                
-                # Gera descrição do pagamento usando ChatGPT
-                print(f"Gerando descrição: {row['ANEXO']}")
-                descricao = generate_payment_description_with_chatgpt(ocr_result)
-                df_anexos.at[idx, 'DESCRICAO'] = descricao
-                
-                # Classifica o tipo de transação usando ChatGPT
-                print(f"Classificando transação: {row['ANEXO']}")
-                if classificacao_final:
-                    # Usa a classificação retornada pela IA com imagem
-                    classificacao = classificacao_final
-                    print(f"  - Classificação definida pela IA com imagem: {classificacao}")
-                else:
-                    # Usa a classificação padrão do ChatGPT
-                    classificacao = classify_transaction_type_with_chatgpt(ocr_result)
+                df_anexos.at[idx, 'DESCRICAO'] = resultado['DESCRICAO']
                 df_anexos.at[idx, 'CLASSIFICACAO'] = classificacao
                 
                 # Adiciona o valor à coluna do remetente correspondente APENAS para transferências
@@ -748,9 +513,6 @@ def txt_to_csv_anexos_only(input_file=None, output_file=None, filter=None):
     print("DEBUG df_anexos Preview:")
     print(df_anexos[['ANEXO','DESCRICAO','VALOR','CLASSIFICACAO']].head(10))
     
-    # Remove a coluna bruta e reordena as colunas conforme especificado
-    df_anexos.drop(columns=['raw'], inplace=True)
-    
     # Adiciona linhas de totalização mensal
     df_anexos = adicionar_totalizacao_mensal(df_anexos)
     
@@ -762,18 +524,8 @@ def txt_to_csv_anexos_only(input_file=None, output_file=None, filter=None):
     df_final = incrementar_csv(df_anexos, output_file)
     
     # Calcula e exibe totais por remetente apenas dos novos dados
-    def convert_to_float(value):
-        if pd.isna(value) or value == '':
-            return 0.0
-        try:
-            from .helper import normalize_value_to_brazilian_format
-            valor_brasileiro = normalize_value_to_brazilian_format(value)
-            return float(valor_brasileiro.replace(',', '.'))
-        except:
-            return 0.0
-    
-    ricardo_values = df_anexos['RICARDO'].apply(convert_to_float)
-    rafael_values = df_anexos['RAFAEL'].apply(convert_to_float)
+    ricardo_values = converter_serie_para_float(df_anexos['RICARDO'])
+    rafael_values = converter_serie_para_float(df_anexos['RAFAEL'])
     
     total_ricardo = ricardo_values.sum()
     total_rafael = rafael_values.sum()
@@ -792,20 +544,10 @@ def verificar_totais(csv_file):
             return
             
         df = pd.read_csv(csv_file)
-        
-        def convert_to_float(value):
-            if pd.isna(value) or value == '':
-                return 0.0
-            try:
-                from .helper import normalize_value_to_brazilian_format
-                valor_brasileiro = normalize_value_to_brazilian_format(value)
-                return float(valor_brasileiro.replace(',', '.'))
-            except:
-                return 0.0
 
-        ricardo_total = df['RICARDO'].apply(convert_to_float).sum()
-        rafael_total = df['RAFAEL'].apply(convert_to_float).sum()
-        valor_total = df['VALOR'].apply(convert_to_float).sum()
+        ricardo_total = converter_serie_para_float(df['RICARDO']).sum()
+        rafael_total = converter_serie_para_float(df['RAFAEL']).sum()
+        valor_total = converter_serie_para_float(df['VALOR']).sum()
 
         print('=== TOTAIS FINANCEIROS ===')
         print(f'Total RICARDO (transferências): R$ {ricardo_total:.2f}')
@@ -819,9 +561,9 @@ def verificar_totais(csv_file):
         pagamentos = df[df['CLASSIFICACAO'] == 'Pagamento']
         desconhecidos = df[df['CLASSIFICACAO'] == 'desconhecido']
 
-        transferencia_total = transferencias['VALOR'].apply(convert_to_float).sum()
-        pagamento_total = pagamentos['VALOR'].apply(convert_to_float).sum()
-        desconhecido_total = desconhecidos['VALOR'].apply(convert_to_float).sum()
+        transferencia_total = converter_serie_para_float(transferencias['VALOR']).sum()
+        pagamento_total = converter_serie_para_float(pagamentos['VALOR']).sum()
+        desconhecido_total = converter_serie_para_float(desconhecidos['VALOR']).sum()
 
         print(f'Total em Transferências: R$ {transferencia_total:.2f}')
         print(f'Total em Pagamentos: R$ {pagamento_total:.2f}')
@@ -874,7 +616,15 @@ def diagnostico_erro_ocr(image_path, ocr_result):
         return "Falha no OCR"
     return "Sem diagnóstico detalhado"
 
-def processar_incremental(force=False, entry=None, backup=False):
+def _consolidar_ocr():
+    """Consolida o journal de OCR no snapshot XML ao final de um lote de processamento."""
+    try:
+        total = compactar_ocr()
+        print(f"📄 OCR consolidado em {ATTR_FIN_ARQ_OCR_XML}: {total} registros")
+    except Exception as e:
+        print(f"❌ Erro ao consolidar OCR: {e}")
+
+def processar_incremental(force=False, entry=None, backup=False, workers=None):
     """Função principal para processamento incremental ou forçado, agora com filtro opcional de entry (DATA HORA)"""
     print("=== INICIANDO PROCESSAMENTO {} ===".format("FORÇADO" if force else "INCREMENTAL"))
     if entry:
@@ -894,11 +644,12 @@ def processar_incremental(force=False, entry=None, backup=False):
     if edits_json:
         print(f"Edições encontradas em arquivos JSON de {ATTR_FIN_DIR_INPUT}/: aplicando após confirmação.")
     print("\n=== VERIFICANDO ARQUIVOS ZIP ===")
-    if not descomprimir_zip_se_existir():
+    if not descomprimir_zip_se_existir(workers):
         print("❌ Erro na descompressão de arquivo ZIP. Processamento interrompido.")
         return
     print("\n=== VERIFICANDO SUBDIRETÓRIOS ===")
     organizar_subdiretorios_se_necessario()
+    verificar_cancelamento()
     input_dir = ATTR_FIN_DIR_INPUT
     if force:
         arquivos = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f)) and f.lower().endswith((".jpg", ".jpeg", ".png", ".pdf"))]
@@ -907,13 +658,17 @@ def processar_incremental(force=False, entry=None, backup=False):
         else:
             print(f"Arquivos a reprocessar: {arquivos}")
             registros = []
-            for arquivo in arquivos:
-                caminho = os.path.join(input_dir, arquivo)
+            caminhos = [os.path.join(input_dir, arquivo) for arquivo in arquivos]
+            resultados_ocr = executar_ocr_com_progresso(caminhos, workers)
+            verificar_cancelamento()
+            # Extração por IA em lote (chamadas concorrentes), na mesma ordem dos arquivos
+            with etapa(ETAPA_IA, total=len(resultados_ocr)) as progresso:
+                resultados_ia = extrair_dados_comprovantes_em_lote(resultados_ocr, progresso=progresso)
+            for arquivo, caminho, ocr_result, dados_ia in zip(arquivos, caminhos, resultados_ocr, resultados_ia):
                 print(f"Processando arquivo (forçado): {arquivo}")
-                ocr_result = process_image_ocr(caminho)
-                valor_total = extract_total_value_with_chatgpt(ocr_result)
-                descricao = generate_payment_description_with_chatgpt(ocr_result)
-                classificacao = classify_transaction_type_with_chatgpt(ocr_result)
+                valor_total = dados_ia['valor']
+                descricao = dados_ia['descricao']
+                classificacao = dados_ia['classificacao']
                 motivo_erro = ""
                 if not valor_total and not descricao and not classificacao:
                     motivo_erro = diagnostico_erro_ocr(caminho, ocr_result)
@@ -937,21 +692,30 @@ def processar_incremental(force=False, entry=None, backup=False):
                 else:
                     print("Colunas DATA/HORA não encontradas para filtro --entry.")
                     return
-            df_diag.to_csv(ATTR_FIN_ARQ_DIAGNOSTICO, index=False)
+            gravar_planilha(df_diag, ATTR_FIN_ARQ_DIAGNOSTICO)
             print(f"Reprocessamento forçado concluído. Diagnóstico salvo em {ATTR_FIN_ARQ_DIAGNOSTICO}.")
     else:
         tem_arquivos, chat_file = gerenciar_arquivos_incrementais()
         if not tem_arquivos:
             print("Nenhum arquivo novo para processar.")
             print("\n=== GERANDO RELATÓRIO HTML ===")
-            gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO, backup=backup)
-            gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO, backup=backup)
+            contexto = ReportContext(ATTR_FIN_ARQ_CALCULO) if os.path.exists(ATTR_FIN_ARQ_CALCULO) else None
+            with etapa(ETAPA_RENDER) as progresso:
+                gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO, backup=backup, contexto=contexto)
+                gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO, backup=backup, contexto=contexto, progresso=progresso)
             return
         print(f"\n=== PROCESSANDO DADOS DE {chat_file} ===")
+        # Lê o chat uma única vez para as duas extrações
+        with etapa(ETAPA_PARSE) as progresso:
+            mensagens = carregar_mensagens_chat(chat_file)
+            progresso.definir_total(len(mensagens))
+            progresso.avancar(len(mensagens))
+        verificar_cancelamento()
         print("=== PROCESSANDO DADOS COMPLETOS ===")
-        df_completo = txt_to_csv(chat_file, ATTR_FIN_ARQ_MENSAGENS)
+        df_completo = txt_to_csv(chat_file, ATTR_FIN_ARQ_MENSAGENS, workers=workers, mensagens=mensagens)
+        verificar_cancelamento()
         print("\n=== PROCESSANDO APENAS ANEXOS ===")
-        df_anexos = txt_to_csv_anexos_only(chat_file, ATTR_FIN_ARQ_CALCULO)
+        df_anexos = txt_to_csv_anexos_only(chat_file, ATTR_FIN_ARQ_CALCULO, workers=workers, mensagens=mensagens)
         if entry:
             # Filtra apenas a linha correspondente
             if 'DATA' in df_anexos.columns and 'HORA' in df_anexos.columns:
@@ -960,7 +724,7 @@ def processar_incremental(force=False, entry=None, backup=False):
                 if df_anexos.empty:
                     print(f"Nenhuma linha encontrada para --entry {entry}.")
                     return
-                df_anexos.to_csv(ATTR_FIN_ARQ_CALCULO, index=False)
+                gravar_planilha(df_anexos, ATTR_FIN_ARQ_CALCULO)
             else:
                 print("Colunas DATA/HORA não encontradas para filtro --entry.")
                 return
@@ -980,7 +744,7 @@ def processar_incremental(force=False, entry=None, backup=False):
                 else:
                     motivos.append("")
             df_anexos['MOTIVO_ERRO'] = motivos
-            df_anexos.to_csv(ATTR_FIN_ARQ_CALCULO, index=False)
+            gravar_planilha(df_anexos, ATTR_FIN_ARQ_CALCULO)
         print("\n=== MOVENDO ARQUIVOS PROCESSADOS ===")
         arquivos_movidos = mover_arquivos_processados()
         try:
@@ -993,6 +757,7 @@ def processar_incremental(force=False, entry=None, backup=False):
             print(f"✅ Diretório {input_dir}/ está vazio - processamento concluído")
         else:
             print(f"⚠️  Arquivos restantes em {input_dir}/: {arquivos_restantes}")
+        _consolidar_ocr()
         print("\n=== PROCESSAMENTO INCREMENTAL CONCLUÍDO ===")
         if edits_json:
             resposta = input(f"Deseja aplicar as edições do JSON em {ATTR_FIN_ARQ_CALCULO} antes de gerar relatórios? (s/n): ").strip().lower()
@@ -1003,32 +768,28 @@ def processar_incremental(force=False, entry=None, backup=False):
                     for campo, valor in campos.items():
                         if campo.upper() in df_calc.columns:
                             df_calc.at[idx, campo.upper()] = valor
-                df_calc.to_csv(ATTR_FIN_ARQ_CALCULO, index=False, quoting=1)
+                gravar_planilha(df_calc, ATTR_FIN_ARQ_CALCULO, quoting=1)
                 print(f"Edições aplicadas em {ATTR_FIN_ARQ_CALCULO}.")
     if not os.path.exists(ATTR_FIN_ARQ_CALCULO):
         print(f"❌ Planilha de cálculos não encontrada: {ATTR_FIN_ARQ_CALCULO}. Geração de relatórios ignorada.")
         return
+    verificar_cancelamento()
 
-    print("\n=== GERANDO RELATÓRIO HTML ===")
-    gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO, backup=backup)
-    print("\n=== GERANDO RELATÓRIOS MENSAIS ===")
-    gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO, backup=backup)
-    df_all = pd.read_csv(ATTR_FIN_ARQ_CALCULO)
-    df_all['DATA_DT'] = pd.to_datetime(df_all['DATA'], format='%d/%m/%Y', errors='coerce')
-    df_all['ANO_MES'] = df_all['DATA_DT'].dt.to_period('M')
-    nomes_meses = {
-        1: 'Janeiro', 2: 'Fevereiro', 3: 'Marco', 4: 'Abril',
-        5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
-        9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
-    }
-    for periodo, dados_mes in df_all.groupby('ANO_MES'):
+    # Planilha, OCR e imagens são carregados uma única vez para toda a geração
+    contexto = ReportContext(ATTR_FIN_ARQ_CALCULO)
+    with etapa(ETAPA_RENDER) as progresso:
+        print("\n=== GERANDO RELATÓRIO HTML ===")
+        gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO, backup=backup, contexto=contexto)
+        print("\n=== GERANDO RELATÓRIOS MENSAIS ===")
+        gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO, backup=backup, contexto=contexto, progresso=progresso)
+    for periodo, dados_mes in contexto.particoes_mensais():
         ano = periodo.year
         mes = periodo.month
-        nome_mes = nomes_meses.get(mes, str(mes))
+        nome_mes = NOMES_MESES.get(mes, str(mes))
         nome_arquivo_impressao = os.path.join(ATTR_FIN_DIR_DOCS, f"impressao-{ano}-{mes:02d}-{nome_mes}.html")
         print(f"✅ HTML de impressão gerado: {nome_arquivo_impressao}")
 
-def processar_pdfs(force=False, entry=None, backup=False):
+def processar_pdfs(force=False, entry=None, backup=False, workers=None):
     """Processa apenas arquivos .pdf no diretório input/."""
     print("=== INICIANDO PROCESSAMENTO DE PDFs {} ===".format("FORÇADO" if force else "INCREMENTAL"))
     if entry:
@@ -1059,73 +820,31 @@ def processar_pdfs(force=False, entry=None, backup=False):
     
     print(f"Encontrados {len(arquivos_pdf)} arquivos PDF para processar")
     
-    # Processa cada PDF
-    for pdf_path in arquivos_pdf:
+    # Extrai texto via OCR em paralelo (o registro no XML é feito em lote)
+    textos_ocr = executar_ocr_com_progresso([str(p) for p in arquivos_pdf], workers)
+    # Enriquece com IA em lote (chamadas concorrentes), na mesma ordem dos arquivos
+    resultados_ia = enriquecer_anexos(
+        (str(p), ocr_text) for p, ocr_text in zip(arquivos_pdf, textos_ocr)
+    )
+    for pdf_path, resultado in zip(arquivos_pdf, resultados_ia):
         print(f"Processando PDF: {pdf_path.name}")
-        
-        # Extrai texto via OCR
-        ocr_text = process_image_ocr(str(pdf_path))
-        
-        # Registra no XML (usar só o nome do arquivo)
-        registrar_ocr_xml(os.path.basename(str(pdf_path)), ocr_text)
-        
-        # Verifica se é um comprovante financeiro
-        is_receipt = is_financial_receipt(ocr_text)
-        
-        # Extrai valor total - primeiro tenta OCR, depois IA como fallback
-        valor_total = ""
-        ai_used = False
-        classificacao_final = ""
-        
-        if is_receipt:
-            # Primeiro tenta extrair valor via regex do OCR
-            valor_total = extract_value_from_ocr(ocr_text)
-            
-            # Se não encontrou valor via OCR, usa IA como fallback
-            if not valor_total:
-                valor_total = extract_total_value_with_chatgpt(ocr_text)
-                ai_used = True
-                print(f"  - IA usada para extração de valor (OCR não encontrou)")
-            
-            # Se ainda não encontrou valor, tenta com a imagem + OCR
-            if not valor_total:
-                print(f"  - Tentando processamento com imagem + OCR via IA...")
-                valor_total, classificacao_final = process_image_with_ai_for_value(str(pdf_path), ocr_text)
-                ai_used = True
-                if valor_total:
-                    print(f"  - Valor identificado via IA com imagem: {valor_total}")
-                else:
-                    print(f"  - IA não conseguiu identificar valor, classificando como desconhecido")
-                    classificacao_final = "desconhecido"
-        else:
+        if not resultado['comprovante']:
             print(f"  - Não identificado como comprovante financeiro")
-        
-        # Gera descrição do pagamento usando ChatGPT
-        descricao = generate_payment_description_with_chatgpt(ocr_text)
-        
-        # Classifica o tipo de transação usando ChatGPT
-        if classificacao_final:
-            # Usa a classificação retornada pela IA com imagem
-            classificacao = classificacao_final
-            print(f"  - Classificação definida pela IA com imagem: {classificacao}")
-        else:
-            # Usa a classificação padrão do ChatGPT
-            classificacao = classify_transaction_type_with_chatgpt(ocr_text)
-        
-        print(f"  - Valor: {valor_total}")
-        print(f"  - Descrição: {descricao}")
-        print(f"  - Classificação: {classificacao}")
-        print(f"  - IA usada: {'Sim' if ai_used else 'Não'}")
+        print(f"  - Valor: {resultado['VALOR']}")
+        print(f"  - Descrição: {resultado['DESCRICAO']}")
+        print(f"  - Classificação: {resultado['CLASSIFICACAO']}")
+        print(f"  - IA usada: {'Sim' if resultado['ai_check'] else 'Não'}")
     
     # Atualiza {ATTR_FIN_ARQ_CALCULO} apenas com PDFs
     print("\n=== ATUALIZANDO CSV APENAS COM PDFs ===")
-    txt_to_csv_anexos_only(filter='pdf', output_file=ATTR_FIN_ARQ_CALCULO)
+    txt_to_csv_anexos_only(filter='pdf', output_file=ATTR_FIN_ARQ_CALCULO, workers=workers)
     # Também atualizar o CSV de mensagens apenas com PDFs
-    txt_to_csv_anexos_only(filter='pdf', output_file=ATTR_FIN_ARQ_MENSAGENS)
+    txt_to_csv_anexos_only(filter='pdf', output_file=ATTR_FIN_ARQ_MENSAGENS, workers=workers)
     
+    _consolidar_ocr()
     print("✅ Processamento de PDFs concluído!")
 
-def processar_imgs(force=False, entry=None, backup=False):
+def processar_imgs(force=False, entry=None, backup=False, workers=None):
     """Processa apenas arquivos de imagem (.jpg, .png, .jpeg) no diretório input/."""
     print("=== INICIANDO PROCESSAMENTO DE IMAGENS {} ===".format("FORÇADO" if force else "INCREMENTAL"))
     if entry:
@@ -1157,74 +876,38 @@ def processar_imgs(force=False, entry=None, backup=False):
     
     print(f"Encontradas {len(imagens)} imagens para processar")
     
-    # Processa cada imagem
-    for img_path in imagens:
+    # Extrai texto via OCR em paralelo (o registro no XML é feito em lote)
+    textos_ocr = executar_ocr_com_progresso([str(p) for p in imagens], workers)
+    # Enriquece com IA em lote (chamadas concorrentes), na mesma ordem dos arquivos
+    resultados_ia = enriquecer_anexos(
+        (str(p), ocr_text) for p, ocr_text in zip(imagens, textos_ocr)
+    )
+    for img_path, resultado in zip(imagens, resultados_ia):
         print(f"Processando imagem: {img_path.name}")
-        
-        # Extrai texto via OCR
-        ocr_text = process_image_ocr(str(img_path))
-        
-        # Registra no XML (usar só o nome do arquivo)
-        registrar_ocr_xml(os.path.basename(str(img_path)), ocr_text)
-        
-        # Verifica se é um comprovante financeiro
-        is_receipt = is_financial_receipt(ocr_text)
-        
-        # Extrai valor total - primeiro tenta OCR, depois IA como fallback
-        valor_total = ""
-        ai_used = False
-        classificacao_final = ""
-        
-        if is_receipt:
-            # Primeiro tenta extrair valor via regex do OCR
-            valor_total = extract_value_from_ocr(ocr_text)
-            
-            # Se não encontrou valor via OCR, usa IA como fallback
-            if not valor_total:
-                valor_total = extract_total_value_with_chatgpt(ocr_text)
-                ai_used = True
-                print(f"  - IA usada para extração de valor (OCR não encontrou)")
-            
-            # Se ainda não encontrou valor, tenta com a imagem + OCR
-            if not valor_total:
-                print(f"  - Tentando processamento com imagem + OCR via IA...")
-                valor_total, classificacao_final = process_image_with_ai_for_value(str(img_path), ocr_text)
-                ai_used = True
-                if valor_total:
-                    print(f"  - Valor identificado via IA com imagem: {valor_total}")
-                else:
-                    print(f"  - IA não conseguiu identificar valor, classificando como desconhecido")
-                    classificacao_final = "desconhecido"
-        else:
+        if not resultado['comprovante']:
             print(f"  - Não identificado como comprovante financeiro")
-        
-        # Gera descrição do pagamento usando ChatGPT
-        descricao = generate_payment_description_with_chatgpt(ocr_text)
-        
-        # Classifica o tipo de transação usando ChatGPT
-        if classificacao_final:
-            # Usa a classificação retornada pela IA com imagem
-            classificacao = classificacao_final
-            print(f"  - Classificação definida pela IA com imagem: {classificacao}")
-        else:
-            # Usa a classificação padrão do ChatGPT
-            classificacao = classify_transaction_type_with_chatgpt(ocr_text)
-        
-        print(f"  - Valor: {valor_total}")
-        print(f"  - Descrição: {descricao}")
-        print(f"  - Classificação: {classificacao}")
-        print(f"  - IA usada: {'Sim' if ai_used else 'Não'}")
+        print(f"  - Valor: {resultado['VALOR']}")
+        print(f"  - Descrição: {resultado['DESCRICAO']}")
+        print(f"  - Classificação: {resultado['CLASSIFICACAO']}")
+        print(f"  - IA usada: {'Sim' if resultado['ai_check'] else 'Não'}")
     
     # Atualiza {ATTR_FIN_ARQ_CALCULO} apenas com imagens
     print("\n=== ATUALIZANDO CSV APENAS COM IMAGENS ===")
-    txt_to_csv_anexos_only(filter='img', output_file=ATTR_FIN_ARQ_CALCULO)
+    txt_to_csv_anexos_only(filter='img', output_file=ATTR_FIN_ARQ_CALCULO, workers=workers)
     # Também atualizar o CSV de mensagens apenas com imagens
-    txt_to_csv_anexos_only(filter='img', output_file=ATTR_FIN_ARQ_MENSAGENS)
+    txt_to_csv_anexos_only(filter='img', output_file=ATTR_FIN_ARQ_MENSAGENS, workers=workers)
     
+    _consolidar_ocr()
     print("✅ Processamento de imagens concluído!")
 
-def descomprimir_zip_se_existir():
-    """Verifica se existe apenas um arquivo ZIP em input/ e o descomprime"""
+def descomprimir_zip_se_existir(workers=None):
+    """Extrai as entradas novas de todos os arquivos ZIP em input/, em paralelo.
+    
+    Várias exportações (por exemplo, uma por mês) são ingeridas na mesma execução: os chats são
+    lidos direto dos ZIPs e mesclados em um único input/_chat.txt, em ordem de data/hora e sem
+    mensagens repetidas, e cada anexo é extraído uma única vez, de modo que OCR, IA e relatórios
+    rodam uma vez para o conjunto. Retorna False se algum ZIP não pôde ser lido; os demais
+    são ingeridos e removidos normalmente."""
     input_dir = ATTR_FIN_DIR_INPUT
     
     # Verifica se o diretório input existe
@@ -1232,57 +915,125 @@ def descomprimir_zip_se_existir():
         print(f"Diretório {ATTR_FIN_DIR_INPUT}/ não encontrado!")
         return False
     
-    # Lista todos os arquivos no diretório input/
-    todos_arquivos = os.listdir(input_dir)
-    
-    # Filtra apenas arquivos ZIP
-    arquivos_zip = [f for f in todos_arquivos if f.lower().endswith('.zip')]
+    # Filtra apenas arquivos ZIP, em ordem para que a mescla seja determinística
+    arquivos_zip = sorted(f for f in os.listdir(input_dir) if f.lower().endswith('.zip'))
     
-    # Verifica se existe apenas um arquivo ZIP
     if len(arquivos_zip) == 0:
         print(f"Nenhum arquivo ZIP encontrado em {ATTR_FIN_DIR_INPUT}/")
         return True  # Não é erro, apenas não há ZIP para processar
     
-    if len(arquivos_zip) > 1:
-        print(f"Encontrados {len(arquivos_zip)} arquivos ZIP em {ATTR_FIN_DIR_INPUT}/. Deve haver apenas um.")
-        print(f"Arquivos ZIP encontrados: {arquivos_zip}")
-        return False
-    
-    # Se chegou aqui, existe exatamente um arquivo ZIP
-    arquivo_zip = arquivos_zip[0]
-    caminho_zip = os.path.join(input_dir, arquivo_zip)
+    print(f"Encontrados {len(arquivos_zip)} arquivo(s) ZIP: {arquivos_zip}")
+    print("Descomprimindo arquivos ZIP...")
     
-    print(f"Encontrado arquivo ZIP: {arquivo_zip}")
-    print("Descomprimindo arquivo ZIP...")
+    sucesso = True
+    reservados = set()
+    lock = threading.Lock()
+    with ExitStack() as pilha:
+        # Abre todos antes de extrair: o índice de cada ZIP dá o total de entradas para o progresso
+        abertos = []
+        for arquivo_zip in arquivos_zip:
+            try:
+                zip_ref = pilha.enter_context(zipfile.ZipFile(os.path.join(input_dir, arquivo_zip), 'r'))
+                abertos.append((arquivo_zip, zip_ref, zip_ref.infolist()))
+            except zipfile.BadZipFile:
+                print(f"❌ Erro: {arquivo_zip} não é um arquivo ZIP válido")
+                sucesso = False
+            except Exception as e:
+                print(f"❌ Erro ao abrir {arquivo_zip}: {str(e)}")
+                sucesso = False
+        
+        fontes = {}
+        ingeridos = []
+        workers = max(1, min(workers or ATTR_FIN_OCR_WORKERS, len(abertos) or 1))
+        with etapa(ETAPA_UNZIP, total=sum(len(membros) for _, _, membros in abertos)) as progresso:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wa-fin-unzip') as executor:
+                futuros = {
+                    executor.submit(extrair_entradas_zip, zip_ref, membros, input_dir, progresso, reservados, lock): arquivo_zip
+                    for arquivo_zip, zip_ref, membros in abertos
+                }
+                for futuro in as_completed(futuros):
+                    arquivo_zip = futuros[futuro]
+                    try:
+                        extraidos, ignorados, mensagens = futuro.result()
+                    except Exception as e:
+                        print(f"❌ Erro ao descomprimir {arquivo_zip}: {str(e)}")
+                        sucesso = False
+                        continue
+                    print(f"✅ {arquivo_zip}: {extraidos} itens extraídos para {input_dir}/ ({ignorados} já processados ou fora do escopo foram ignorados)")
+                    if mensagens is not None:
+                        fontes[arquivo_zip] = mensagens
+                    ingeridos.append(arquivo_zip)
     
-    try:
-        # Descomprime o arquivo ZIP
-        with zipfile.ZipFile(caminho_zip, 'r') as zip_ref:
-            # Lista o conteúdo do ZIP antes de extrair
-            lista_arquivos = zip_ref.namelist()
-            print(f"Arquivos no ZIP: {len(lista_arquivos)} itens")
-            
-            # Extrai todos os arquivos para o diretório input/
-            zip_ref.extractall(input_dir)
-            
-            print(f"✅ Arquivo ZIP descomprimido com sucesso!")
-            print(f"Extraídos {len(lista_arquivos)} itens para {input_dir}/")
-        
-        # Remove o arquivo ZIP após descompressão bem-sucedida
-        os.remove(caminho_zip)
+    if fontes:
+        chat_file = os.path.join(input_dir, ATTR_FIN_ARQ_CHAT)
+        # Um chat já extraído em input/ (de uma execução interrompida) entra na mescla
+        existente = [list(ler_mensagens_chat(chat_file))] if os.path.exists(chat_file) else []
+        mensagens = mesclar_mensagens_chat(existente + [fontes[nome] for nome in sorted(fontes)])
+        escrever_mensagens_chat(mensagens, chat_file)
+        total_lidas = sum(len(f) for f in existente) + sum(len(f) for f in fontes.values())
+        print(f"💬 {len(mensagens)} mensagens em {ATTR_FIN_ARQ_CHAT} ({total_lidas - len(mensagens)} duplicadas descartadas)")
+    
+    # Remove os arquivos ZIP ingeridos com sucesso
+    for arquivo_zip in ingeridos:
+        os.remove(os.path.join(input_dir, arquivo_zip))
         print(f"Arquivo ZIP {arquivo_zip} removido após descompressão")
-        
-        # Organiza arquivos extraídos - move tudo para input/ diretamente
-        organizar_arquivos_extraidos()
-        
-        return True
-        
-    except zipfile.BadZipFile:
-        print(f"❌ Erro: {arquivo_zip} não é um arquivo ZIP válido")
-        return False
-    except Exception as e:
-        print(f"❌ Erro ao descomprimir {arquivo_zip}: {str(e)}")
-        return False
+    
+    return sucesso
+
+def extrair_entradas_zip(zip_ref, membros, input_dir, progresso=None, reservados=None, lock=None):
+    """Extrai as entradas do ZIP uma a uma, sem passar pelo disco antes do destino final.
+    
+    Cada entrada é gravada diretamente em input/ com o nome sem subdiretórios (o que
+    organizar_arquivos_extraidos fazia depois do extractall). São ignoradas sem ler o conteúdo:
+    diretórios, __MACOSX, extensões que o pipeline não processa, anexos que já estão em imgs/,
+    que gerenciar_arquivos_incrementais descartaria como duplicatas, e anexos já reservados em
+    `reservados` por outro ZIP da mesma execução (protegido por `lock`). O chat não é gravado:
+    suas mensagens são lidas direto do ZIP. Retorna (extraídos, ignorados, mensagens do chat ou None)."""
+    extensoes_validas = ('.jpg', '.jpeg', '.png', '.pdf', '.txt')
+    extensoes_imagem = ('.jpg', '.jpeg', '.png', '.pdf')
+    ja_processados = set(os.listdir(ATTR_FIN_DIR_IMGS)) if os.path.isdir(ATTR_FIN_DIR_IMGS) else set()
+    reservados = set() if reservados is None else reservados
+    lock = lock or threading.Lock()
+    
+    extraidos = 0
+    ignorados = 0
+    mensagens = None
+    for membro in membros:
+        arquivo = os.path.basename(membro.filename.rstrip('/'))
+        saida = None
+        if (membro.is_dir() or membro.filename.startswith('__MACOSX') or arquivo.startswith('._')
+                or not arquivo.lower().endswith(extensoes_validas)):
+            ignorados += 1
+        elif arquivo == ATTR_FIN_ARQ_CHAT:
+            with zip_ref.open(membro) as origem:
+                mensagens = list(agrupar_mensagens_chat(io.TextIOWrapper(origem, encoding='utf-8')))
+        elif arquivo.lower().endswith(extensoes_imagem) and arquivo in ja_processados:
+            print(f"Ignorada duplicata: {arquivo}")
+            ignorados += 1
+        else:
+            with lock:
+                if arquivo.lower().endswith(extensoes_imagem) and arquivo in reservados:
+                    # Exportações sobrepostas trazem o mesmo anexo, com o mesmo nome
+                    ignorados += 1
+                else:
+                    reservados.add(arquivo)
+                    destino = os.path.join(input_dir, arquivo)
+                    
+                    # Se já existe arquivo com mesmo nome, adiciona sufixo
+                    contador = 1
+                    while os.path.exists(destino):
+                        nome, ext = os.path.splitext(arquivo)
+                        destino = os.path.join(input_dir, f"{nome}_{contador}{ext}")
+                        contador += 1
+                    # Criado ainda sob o lock, para que outro ZIP não escolha o mesmo destino
+                    saida = open(destino, 'xb')
+        if saida is not None:
+            with zip_ref.open(membro) as origem, saida:
+                shutil.copyfileobj(origem, saida)
+            extraidos += 1
+        if progresso is not None:
+            progresso.avancar()
+    return extraidos, ignorados, mensagens
 
 def organizar_arquivos_extraidos():
     """Move arquivos de subdiretórios para input/ diretamente e remove diretórios desnecessários"""
@@ -1537,7 +1288,7 @@ def corrigir_totalizadores_duplicados(csv_file):
         df_corrigido = adicionar_totalizacao_mensal(df)
         
         # Salva o arquivo corrigido
-        df_corrigido.to_csv(csv_file, index=False, quoting=1)
+        gravar_planilha(df_corrigido, csv_file, quoting=1)
         
         print(f"✅ Arquivo {csv_file} corrigido com sucesso!")
         return True
@@ -1546,6 +1297,36 @@ def corrigir_totalizadores_duplicados(csv_file):
         print(f"❌ Erro ao corrigir totalizadores: {str(e)}")
         return False
 
+def _banco_para_planilha(arquivo_csv):
+    """Retorna o banco quando o arquivo é a planilha de cálculo (sincronizada com o CSV), ou None."""
+    if os.path.abspath(arquivo_csv) != os.path.abspath(ATTR_FIN_ARQ_CALCULO):
+        return None
+    try:
+        banco = obter_banco()
+        banco.sincronizar_calculo(arquivo_csv)
+        return banco
+    except Exception as e:
+        print(f"⚠️  Banco de dados indisponível ({e}); usando {os.path.basename(arquivo_csv)}")
+        return None
+
+def _localizar_entrada(data, hora, arquivos_csv):
+    """Retorna {arquivo: [linhas]} das planilhas (exceto a de cálculo, servida pelo banco) que contêm
+    a data/hora, pelo índice de localizações; None se o índice estiver indisponível."""
+    demais = [a for a in arquivos_csv if os.path.abspath(a) != os.path.abspath(ATTR_FIN_ARQ_CALCULO)]
+    try:
+        return obter_banco().localizar_entrada(data, hora, demais)
+    except Exception as e:
+        print(f"⚠️  Índice de localização indisponível ({e}); verificando todos os arquivos")
+        return None
+
+def _gravar_planilha_corrigida(df, arquivo_csv, **opcoes_csv):
+    """Grava um CSV corrigido; as posições (DATA, HORA) não mudam, então só a assinatura do índice é renovada."""
+    df.to_csv(arquivo_csv, index=False, **opcoes_csv)
+    try:
+        obter_banco().atualizar_assinatura_planilha(arquivo_csv)
+    except Exception as e:
+        print(f"⚠️  Erro ao atualizar índice de {os.path.basename(arquivo_csv)}: {e}")
+
 def fix_entry(data_hora, novo_valor=None, nova_classificacao=None, nova_descricao=None, dismiss=False, rotate=None, ia=False):
     """Corrige uma entrada específica em todos os arquivos CSV do diretório mensagens/"""
     try:
@@ -1576,7 +1357,7 @@ def fix_entry(data_hora, novo_valor=None, nova_classificacao=None, nova_descrica
             from .helper import parse_value_from_input
             novo_valor = parse_value_from_input(novo_valor)
             try:
-                float(novo_valor)
+                float(novo_valor.replace(',', '.'))
             except ValueError:
                 print("❌ Valor inválido")
                 return False
@@ -1607,16 +1388,20 @@ def fix_entry(data_hora, novo_valor=None, nova_classificacao=None, nova_descrica
         
         entrada_encontrada = False
         arquivo_anexo = None
+        localizacoes = _localizar_entrada(data, hora, arquivos_csv)
         
         # Processa cada arquivo CSV
         for arquivo_csv in arquivos_csv:
             if not os.path.exists(arquivo_csv):
                 continue
+            
+            # Planilha de cálculo: busca apenas as linhas da data/hora pelo índice do banco
+            banco = _banco_para_planilha(arquivo_csv)
+            if not banco and localizacoes is not None and arquivo_csv not in localizacoes:
+                continue
                 
             print(f"🔍 Procurando em {os.path.basename(arquivo_csv)}...")
-            
-            # Lê o CSV
-            df = pd.read_csv(arquivo_csv)
+            df = banco.buscar_calculo(data, hora) if banco else pd.read_csv(arquivo_csv)
             
             # Procura pela entrada com data e hora exatas
             # Verifica se as colunas existem (pode ser DATA/HORA ou data/hora)
@@ -1785,10 +1570,15 @@ def fix_entry(data_hora, novo_valor=None, nova_classificacao=None, nova_descrica
                     else:
                         print(f"ℹ️  Nenhuma alteração aplicada")
                 
-                # Salva o arquivo CSV atualizado
-                df.to_csv(arquivo_csv, index=False)
+                # Salva as linhas alteradas (no banco, exportando o CSV) ou o arquivo CSV inteiro
+                if banco:
+                    banco.atualizar_calculo(df)
+                    banco.exportar_calculo_csv(arquivo_csv)
+                else:
+                    _gravar_planilha_corrigida(df, arquivo_csv)
                 print(f" Arquivo {os.path.basename(arquivo_csv)} atualizado")
         
+        verificar_cancelamento()
         # Processa rotação e re-submissão para IA se solicitado
         if arquivo_anexo and (rotate or ia):
             print(f"\n🔄 Processando rotação/re-submissão para arquivo: {arquivo_anexo}")
@@ -1817,13 +1607,16 @@ def fix_entry(data_hora, novo_valor=None, nova_classificacao=None, nova_descrica
         print(" Gerando relatórios atualizados...")
         
         # Regenera os relatórios
+        verificar_cancelamento()
         try:
-            from .reporter import gerar_relatorio_html, gerar_relatorios_mensais_html
+            from .reporter import gerar_relatorio_html, gerar_relatorios_mensais_html, ReportContext
             from .env import ATTR_FIN_ARQ_CALCULO
-            print(f"🔄 Regenerando relatório principal...")
-            gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO)
-            print(f"🔄 Regenerando relatórios mensais...")
-            gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO)
+            contexto = ReportContext(ATTR_FIN_ARQ_CALCULO)
+            with etapa(ETAPA_RENDER) as progresso:
+                print(f"🔄 Regenerando relatório principal...")
+                gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO, contexto=contexto)
+                print(f"🔄 Regenerando relatórios mensais...")
+                gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO, contexto=contexto, progresso=progresso)
             print("✅ Relatórios regenerados com sucesso!")
         except Exception as e:
             print(f"⚠️  Erro ao regenerar relatórios: {str(e)}")
@@ -1871,13 +1664,17 @@ def dismiss_entry(data_hora):
             return False
         
         entradas_encontradas = 0
+        localizacoes = _localizar_entrada(data, hora, [os.path.join(mensagens_dir, f) for f in arquivos_csv])
         
         for arquivo_csv in arquivos_csv:
             caminho_csv = os.path.join(mensagens_dir, arquivo_csv)
-            print(f"📄 Verificando arquivo: {arquivo_csv}")
             
             try:
-                df = pd.read_csv(caminho_csv)
+                banco = _banco_para_planilha(caminho_csv)
+                if not banco and localizacoes is not None and caminho_csv not in localizacoes:
+                    continue
+                print(f"📄 Verificando arquivo: {arquivo_csv}")
+                df = banco.buscar_calculo(data, hora) if banco else pd.read_csv(caminho_csv)
                 
                 # Verifica se tem as colunas necessárias
                 if 'DATA' not in df.columns or 'HORA' not in df.columns:
@@ -1900,8 +1697,12 @@ def dismiss_entry(data_hora):
                     # Marca como dismiss
                     df.loc[mask, 'VALIDADE'] = 'dismiss'
                     
-                    # Salva o arquivo atualizado
-                    df.to_csv(caminho_csv, index=False, quoting=1)
+                    # Salva as linhas alteradas (no banco, exportando o CSV) ou o arquivo atualizado
+                    if banco:
+                        banco.atualizar_calculo(df[mask])
+                        banco.exportar_calculo_csv(caminho_csv)
+                    else:
+                        _gravar_planilha_corrigida(df, caminho_csv, quoting=1)
                     
                     print(f"✅ {len(linhas_encontradas)} entrada(s) marcada(s) como 'dismiss' em {arquivo_csv}")
                     entradas_encontradas += len(linhas_encontradas)
@@ -1924,10 +1725,11 @@ def dismiss_entry(data_hora):
             
             # Regenera os relatórios automaticamente
             try:
-                from .reporter import gerar_relatorio_html, gerar_relatorios_mensais_html
+                from .reporter import gerar_relatorio_html, gerar_relatorios_mensais_html, ReportContext
                 from .env import ATTR_FIN_ARQ_CALCULO
-                gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO)
-                gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO)
+                contexto = ReportContext(ATTR_FIN_ARQ_CALCULO)
+                gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO, contexto=contexto)
+                gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO, contexto=contexto)
                 print("✅ Relatórios regenerados com sucesso!")
             except Exception as e:
                 print(f"⚠️  Erro ao regenerar relatórios: {str(e)}")
@@ -2067,24 +1869,24 @@ def re_submeter_para_chatgpt(arquivo_anexo):
         print(f"📝 Texto extraído via OCR: {ocr_text[:100]}...")
         
         # Re-submete para ChatGPT para extrair valor, descrição e classificação
-        from .ia import extract_total_value_with_chatgpt, generate_payment_description_with_chatgpt, classify_transaction_type_with_chatgpt
+        dados_ia = extrair_dados_comprovante_com_chatgpt(ocr_text)
         
         # Extrai valor total
-        valor_total = extract_total_value_with_chatgpt(ocr_text)
+        valor_total = dados_ia['valor']
         if valor_total:
             print(f"💰 Valor extraído via IA: R$ {valor_total}")
         else:
             print(f"⚠️  IA não conseguiu extrair valor")
         
         # Gera descrição
-        descricao = generate_payment_description_with_chatgpt(ocr_text)
+        descricao = dados_ia['descricao']
         if descricao:
             print(f"📝 Descrição gerada via IA: {descricao}")
         else:
             print(f"⚠️  IA não conseguiu gerar descrição")
         
         # Classifica transação
-        classificacao = classify_transaction_type_with_chatgpt(ocr_text)
+        classificacao = dados_ia['classificacao']
         if classificacao:
             print(f"🏷️  Classificação via IA: {classificacao}")
         else:
@@ -2100,86 +1902,3 @@ def re_submeter_para_chatgpt(arquivo_anexo):
     except Exception as e:
         print(f"❌ Erro na re-submissão para ChatGPT: {str(e)}")
         return False
-
-def process_image_with_ai_for_value(image_path, ocr_text):
-    """Processa uma imagem com IA para identificar valor quando OCR não conseguiu"""
-    try:
-        # Verifica se a chave da API está disponível
-        api_key = ATTR_FIN_OPENAI_API_KEY
-        if not api_key:
-            return "", "desconhecido"
-        
-        # Verifica se há texto para processar
-        if not ocr_text or ocr_text in ["Arquivo não encontrado", "Erro ao carregar imagem", "Nenhum texto detectado"]:
-            return "", "desconhecido"
-        
-        # Inicializa o cliente OpenAI
-        client = OpenAI(api_key=api_key)
-        
-        # Codifica a imagem em base64
-        with open(image_path, "rb") as image_file:
-            encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
-        
-        # Prompt para o ChatGPT com a imagem
-        prompt = f"""
-        Analise esta imagem de comprovante financeiro e o texto extraído via OCR.
-        
-        Texto OCR: {ocr_text}
-        
-        Instruções:
-        1. Identifique APENAS o valor total da transação
-        2. Se houver múltiplos valores, retorne o valor da transação principal
-        3. Se não conseguir identificar um valor, retorne "NENHUM"
-        4. Não inclua "R$" ou outros símbolos
-        5. Não retorne explicações, apenas o número
-        
-        Valor total:
-        """
-        
-        # Chama a API do ChatGPT com a imagem
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Usa modelo que suporta imagens
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=50,
-            temperature=0.1
-        )
-        
-        # Extrai a resposta
-        valor = response.choices[0].message.content.strip()
-        
-        # Limpa a resposta removendo caracteres indesejados
-        valor = re.sub(r'[^\d,.]', '', valor)
-        
-        # Se não encontrou valor válido, retorna vazio e classifica como desconhecido
-        if not valor or valor.upper() == "NENHUM" or len(valor) == 0:
-            return "", "desconhecido"
-        
-        # Converte para formato brasileiro padronizado
-        from .helper import normalize_value_to_brazilian_format
-        valor_brasileiro = normalize_value_to_brazilian_format(valor)
-        
-        return valor_brasileiro, "Pagamento"  # Assume como pagamento se encontrou valor
-        
-    except Exception as e:
-        print(f"Erro ao processar imagem com IA: {str(e)}")
-        return "", "desconhecido"
-
-
-
-
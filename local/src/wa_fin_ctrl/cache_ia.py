@@ -0,0 +1,217 @@
+# cache_ia.py
+# Caminho relativo ao projeto: cache_ia.py
+# Cache persistente (SQLite) das respostas de IA, com TTL, limite de tamanho e estatísticas
+
+import os
+import json
+import time
+import sqlite3
+import atexit
+import hashlib
+from collections import Counter
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Dict, Optional
+from .env import ATTR_FIN_ARQ_CACHE_IA, ATTR_FIN_IA_CACHE_TTL_DIAS, ATTR_FIN_IA_CACHE_MAX_MB
+
+# Ao ultrapassar o limite de tamanho, remove as entradas menos usadas até esta fração do limite
+FRACAO_APOS_EVICCAO = 0.9
+
+# Acertos/falhas acumulados em memória antes de serem gravados na tabela de estatísticas
+MAX_CONTAGENS_PENDENTES = 100
+
+ESQUEMA_CACHE_IA = """
+CREATE TABLE IF NOT EXISTS respostas (
+    chave TEXT PRIMARY KEY,
+    funcao TEXT NOT NULL,
+    resultado TEXT NOT NULL,
+    tamanho INTEGER NOT NULL,
+    criado_em REAL NOT NULL,
+    acessado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_respostas_acessado_em ON respostas (acessado_em);
+CREATE INDEX IF NOT EXISTS idx_respostas_criado_em ON respostas (criado_em);
+CREATE TABLE IF NOT EXISTS estatisticas (
+    funcao TEXT PRIMARY KEY,
+    acertos INTEGER NOT NULL DEFAULT 0,
+    falhas INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class CacheIA:
+    """Cache das respostas de IA em SQLite, chaveado por modelo, versão do prompt e hash da entrada
+
+    Cada obter/gravar é uma única transação. Acertos e falhas são contados em memória e gravados
+    junto com a próxima escrita (ou a cada MAX_CONTAGENS_PENDENTES consultas), e o volume do
+    cache é mantido em um total corrente, recalculado só quando parece exceder o limite."""
+
+    def __init__(self, caminho: str = ATTR_FIN_ARQ_CACHE_IA,
+                 ttl_dias: float = ATTR_FIN_IA_CACHE_TTL_DIAS,
+                 max_mb: float = ATTR_FIN_IA_CACHE_MAX_MB):
+        self.caminho = caminho
+        self.ttl_segundos = ttl_dias * 86400 if ttl_dias else None
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self._lock = Lock()
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.executescript(ESQUEMA_CACHE_IA)
+        self._contagens = Counter()
+        self._tamanho_total = self._somar_tamanhos()
+        atexit.register(self.gravar_estatisticas)
+
+    @staticmethod
+    def gerar_chave(funcao: str, modelo: str, versao_prompt: int, *entradas: Optional[str]) -> str:
+        """Gera a chave a partir do modelo, da versão do template do prompt e do hash das entradas"""
+        sha = hashlib.sha256()
+        for parte in (funcao, modelo, str(versao_prompt)) + entradas:
+            sha.update((parte or "").encode('utf-8'))
+            sha.update(b'\0')
+        return sha.hexdigest()
+
+    @contextmanager
+    def _transacao(self):
+        self._conexao.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conexao.execute("ROLLBACK")
+            raise
+        self._conexao.execute("COMMIT")
+
+    def _somar_tamanhos(self, condicao: str = "", parametros=()) -> int:
+        return self._conexao.execute(
+            f"SELECT COALESCE(SUM(tamanho), 0) FROM respostas {condicao}", parametros
+        ).fetchone()[0]
+
+    def _contar(self, funcao: str, coluna: str):
+        self._contagens[(funcao, coluna)] += 1
+
+    def _descarregar_contagens(self):
+        """Grava os acertos/falhas pendentes; chamado dentro de uma transação."""
+        for (funcao, coluna), quantidade in self._contagens.items():
+            self._conexao.execute("INSERT OR IGNORE INTO estatisticas (funcao) VALUES (?)", (funcao,))
+            self._conexao.execute(f"UPDATE estatisticas SET {coluna} = {coluna} + ? WHERE funcao = ?",
+                                  (quantidade, funcao))
+        self._contagens.clear()
+
+    def gravar_estatisticas(self):
+        """Grava os acertos/falhas ainda em memória (também executado ao final do processo)"""
+        with self._lock:
+            if self._contagens:
+                with self._transacao():
+                    self._descarregar_contagens()
+
+    def obter(self, chave: str, funcao: str) -> Optional[Any]:
+        """Retorna o resultado em cache (ou None), descartando entradas expiradas"""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT resultado, criado_em, tamanho FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            agora = time.time()
+            expirada = bool(linha and self.ttl_segundos and agora - linha[1] > self.ttl_segundos)
+            self._contar(funcao, 'falhas' if linha is None or expirada else 'acertos')
+            if linha is None:
+                # Falha sem escrita: a contagem segue com a gravação da resposta
+                if sum(self._contagens.values()) >= MAX_CONTAGENS_PENDENTES:
+                    with self._transacao():
+                        self._descarregar_contagens()
+                return None
+            with self._transacao():
+                if expirada:
+                    self._conexao.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                    self._tamanho_total -= linha[2]
+                else:
+                    self._conexao.execute("UPDATE respostas SET acessado_em = ? WHERE chave = ?", (agora, chave))
+                self._descarregar_contagens()
+            return None if expirada else json.loads(linha[0])
+
+    def gravar(self, chave: str, funcao: str, resultado: Any):
+        """Grava o resultado e aplica o limite de tamanho removendo as entradas menos usadas"""
+        conteudo = json.dumps(resultado, ensure_ascii=False)
+        tamanho = len(conteudo.encode('utf-8'))
+        agora = time.time()
+        with self._lock, self._transacao():
+            anterior = self._conexao.execute("SELECT tamanho FROM respostas WHERE chave = ?", (chave,)).fetchone()
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO respostas (chave, funcao, resultado, tamanho, criado_em, acessado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, funcao, conteudo, tamanho, agora, agora)
+            )
+            self._tamanho_total += tamanho - (anterior[0] if anterior else 0)
+            self._descarregar_contagens()
+            self._evictar()
+
+    def _evictar(self):
+        if self.ttl_segundos:
+            # Usa o índice de criado_em: percorre só as entradas expiradas
+            limite = (time.time() - self.ttl_segundos,)
+            expirado = self._somar_tamanhos("WHERE criado_em < ?", limite)
+            if expirado:
+                self._conexao.execute("DELETE FROM respostas WHERE criado_em < ?", limite)
+                self._tamanho_total -= expirado
+        if not self.max_bytes or self._tamanho_total <= self.max_bytes:
+            return
+        # O total corrente não vê as escritas de outros processos: confirma antes de remover
+        self._tamanho_total = self._somar_tamanhos()
+        if self._tamanho_total <= self.max_bytes:
+            return
+        alvo = self._tamanho_total - int(self.max_bytes * FRACAO_APOS_EVICCAO)
+        removidos = 0
+        chaves = []
+        for chave, tamanho in self._conexao.execute("SELECT chave, tamanho FROM respostas ORDER BY acessado_em"):
+            chaves.append((chave,))
+            removidos += tamanho
+            if removidos >= alvo:
+                break
+        self._conexao.executemany("DELETE FROM respostas WHERE chave = ?", chaves)
+        self._tamanho_total -= removidos
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Retorna acertos, falhas e taxa de acerto por função, além do volume do cache"""
+        self.gravar_estatisticas()
+        with self._lock:
+            entradas, tamanho = self._conexao.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM respostas"
+            ).fetchone()
+            por_funcao = {}
+            for funcao, acertos, falhas in self._conexao.execute(
+                "SELECT funcao, acertos, falhas FROM estatisticas ORDER BY funcao"
+            ):
+                por_funcao[funcao] = {"acertos": acertos, "falhas": falhas}
+        acertos = sum(f["acertos"] for f in por_funcao.values())
+        falhas = sum(f["falhas"] for f in por_funcao.values())
+        return {
+            "arquivo": self.caminho,
+            "entradas": entradas,
+            "tamanho_bytes": tamanho,
+            "acertos": acertos,
+            "falhas": falhas,
+            "taxa_acerto": round(acertos / (acertos + falhas), 4) if acertos + falhas else 0.0,
+            "por_funcao": por_funcao
+        }
+
+    def limpar(self):
+        """Remove todas as respostas e zera as estatísticas"""
+        with self._lock, self._transacao():
+            self._conexao.execute("DELETE FROM respostas")
+            self._conexao.execute("DELETE FROM estatisticas")
+            self._contagens.clear()
+            self._tamanho_total = 0
+        print(f"🗑️  Cache de IA limpo: {self.caminho}")
+
+
+_cache_ia = None
+_cache_ia_lock = Lock()
+
+
+def obter_cache_ia() -> CacheIA:
+    """Retorna a instância de cache compartilhada pelo processo"""
+    global _cache_ia
+    with _cache_ia_lock:
+        if _cache_ia is None:
+            _cache_ia = CacheIA()
+        return _cache_ia
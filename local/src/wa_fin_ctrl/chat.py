@@ -0,0 +1,89 @@
+# chat.py
+# Caminho relativo ao projeto: chat.py
+# Leitura em streaming do arquivo de chat exportado do WhatsApp, compartilhada pelas extrações de mensagens e anexos
+import re
+import heapq
+from collections import Counter
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+import pandas as pd
+
+# Cabeçalho de mensagem: "[DD/MM/AAAA, HH:MM:SS] Remetente: texto" (com possíveis caracteres invisíveis antes)
+PADRAO_MENSAGEM = re.compile(r'.*?\[([\d]{2}/[\d]{2}/\d{4}), (\d{2}:\d{2}:\d{2})\] ([^:]+): (.*)$')
+PADRAO_ANEXO = re.compile(r'<anexado:\s*([^>]+)>')
+
+COLUNAS_MENSAGEM = ['data', 'hora', 'remetente', 'mensagem', 'anexo']
+
+
+class MensagemChat(NamedTuple):
+    """Uma mensagem do chat; `anexo` é vazio quando a mensagem não traz arquivo anexado."""
+    data: str
+    hora: str
+    remetente: str
+    mensagem: str
+    anexo: str
+
+
+def _nova_mensagem(encontrado: re.Match) -> MensagemChat:
+    data, hora, remetente, mensagem = encontrado.groups()
+    anexo = PADRAO_ANEXO.search(mensagem)
+    return MensagemChat(data, hora, remetente, mensagem, anexo.group(1).strip() if anexo else '')
+
+
+def agrupar_mensagens_chat(linhas: Iterable[str]) -> Iterator[MensagemChat]:
+    """Percorre as linhas do chat uma única vez, gerando uma MensagemChat por mensagem.
+
+    Linhas sem cabeçalho de data/hora são continuação da mensagem anterior e são anexadas a ela;
+    linhas anteriores à primeira mensagem são ignoradas."""
+    atual: Optional[MensagemChat] = None
+    for linha in linhas:
+        linha = linha.rstrip('\r\n')
+        encontrado = PADRAO_MENSAGEM.match(linha)
+        if encontrado:
+            if atual is not None:
+                yield atual
+            atual = _nova_mensagem(encontrado)
+        elif atual is not None and linha:
+            atual = atual._replace(mensagem=f"{atual.mensagem}\n{linha}")
+    if atual is not None:
+        yield atual
+
+
+def ler_mensagens_chat(caminho: str) -> Iterator[MensagemChat]:
+    """Lê o chat do disco linha a linha (ver agrupar_mensagens_chat)."""
+    with open(caminho, 'r', encoding='utf-8') as f:
+        yield from agrupar_mensagens_chat(f)
+
+
+def _chave_cronologica(mensagem: MensagemChat):
+    dia, mes, ano = mensagem.data.split('/')
+    return ano, mes, dia, mensagem.hora
+
+
+def mesclar_mensagens_chat(fontes: List[List[MensagemChat]]) -> List[MensagemChat]:
+    """Intercala os chats de várias exportações em ordem de data/hora, sem duplicatas.
+
+    Exportações sobrepostas trazem as mesmas mensagens; cada mensagem idêntica aparece no resultado
+    tantas vezes quanto na fonte em que mais aparece, de modo que mensagens repetidas de propósito
+    dentro de um mesmo chat (o mesmo texto no mesmo segundo) são preservadas. Cada fonte já está em
+    ordem cronológica, como o WhatsApp exporta; a ordenação é estável entre fontes."""
+    maximos: Counter = Counter()
+    for fonte in fontes:
+        maximos |= Counter(fonte)
+    mescladas = []
+    for mensagem in heapq.merge(*fontes, key=_chave_cronologica):
+        if maximos[mensagem] > 0:
+            maximos[mensagem] -= 1
+            mescladas.append(mensagem)
+    return mescladas
+
+
+def escrever_mensagens_chat(mensagens: Iterable[MensagemChat], caminho: str):
+    """Grava as mensagens no formato de exportação do WhatsApp, legível por ler_mensagens_chat."""
+    with open(caminho, 'w', encoding='utf-8') as f:
+        for m in mensagens:
+            f.write(f"[{m.data}, {m.hora}] {m.remetente}: {m.mensagem}\n")
+
+
+def carregar_mensagens_chat(caminho: str) -> pd.DataFrame:
+    """DataFrame com as colunas data, hora, remetente, mensagem e anexo, montado direto do gerador."""
+    return pd.DataFrame.from_records(ler_mensagens_chat(caminho), columns=COLUNAS_MENSAGEM)
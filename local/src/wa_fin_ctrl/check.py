@@ -3,9 +3,53 @@
 # Módulo de validação de conformidade OCR para relatórios HTML
 import sys
 import pandas as pd
-import xml.etree.ElementTree as ET
 import os
 
+try:
+    from .ocr import carregar_mapa_ocr
+except ImportError:
+    # Executado como script (python check.py): torna o pacote importável
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from wa_fin_ctrl.ocr import carregar_mapa_ocr
+
+def validar_conformidade_ocr(df, ocr_map):
+    """Valida se todas as linhas do cálculo têm OCR associado, no CSV ou no registro de OCR.
+
+    Reaproveita o DataFrame e o mapa de OCR já carregados por quem chama (os relatórios).
+    Retorna True se a planilha está conforme; avisos sobre imagens sem texto não reprovam."""
+    # Verifica se a coluna OCR existe
+    if 'OCR' not in df.columns:
+        print("❌ Erro: coluna 'OCR' não encontrada no arquivo CSV")
+        return False
+    
+    anexos = df['ANEXO'] if 'ANEXO' in df.columns else pd.Series('', index=df.index, dtype=object)
+    
+    # Linhas que não têm OCR no CSV E não foram processadas no XML
+    ocr = df['OCR']
+    sem_ocr_csv = ocr.isna() | ocr.astype(str).isin(['', 'nan'])
+    faltantes = df[sem_ocr_csv & ~anexos.isin(set(ocr_map))]
+    
+    if not faltantes.empty:
+        print("❌ Falha: as seguintes linhas não têm OCR associado:")
+        for data, hora, anexo in zip(faltantes.get('DATA', ''), faltantes.get('HORA', ''), anexos[faltantes.index]):
+            print(f"{data} {hora} {anexo}")
+        print(f"\nTotal de linhas sem OCR: {len(faltantes)}")
+        return False
+    
+    # Verifica se há arquivos processados no XML mas sem texto (imagens ilegíveis)
+    anexos_csv = set(anexos.dropna())
+    imagens_sem_texto = [arquivo for arquivo, texto in ocr_map.items() if not texto and arquivo in anexos_csv]
+    
+    if imagens_sem_texto:
+        print(f"⚠️  Aviso: {len(imagens_sem_texto)} imagens foram processadas mas não têm texto legível:")
+        for arquivo in imagens_sem_texto:
+            print(f"  {arquivo}")
+        print("  (Isso é normal para imagens sem texto ou ilegíveis)")
+    
+    print("✅ OK: todas as linhas têm OCR processado.")
+    print(f"Total de linhas validadas: {len(df)}")
+    return True
+
 def main():
     """Valida se todas as linhas do CSV têm OCR associado."""
     arquivo_csv = sys.argv[1]
@@ -13,62 +57,10 @@ def main():
     try:
         df = pd.read_csv(arquivo_csv, dtype=str)
         
-        # Verifica se a coluna OCR existe
-        if 'OCR' not in df.columns:
-            print("❌ Erro: coluna 'OCR' não encontrada no arquivo CSV")
+        # Carrega uma única vez o OCR registrado (snapshot XML + journal)
+        if not validar_conformidade_ocr(df, carregar_mapa_ocr()):
             sys.exit(1)
         
-        # Carrega o XML de OCR para verificar se os arquivos foram processados
-        xml_file = 'ocr/extract.xml'
-        ocr_processed = set()
-        
-        if os.path.exists(xml_file):
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
-            for entry in root.findall('entry'):
-                arquivo = entry.get('arquivo')
-                ocr_processed.add(arquivo)
-        
-        # Filtra linhas que não têm OCR no CSV E não foram processadas no XML
-        faltantes = []
-        
-        for idx, row in df.iterrows():
-            anexo = row.get('ANEXO', '')
-            ocr = row.get('OCR', '')
-            
-            # Se não tem OCR no CSV E não foi processado no XML
-            if (pd.isna(ocr) or ocr == '' or ocr == 'nan') and anexo not in ocr_processed:
-                faltantes.append(row)
-        
-        if faltantes:
-            print("❌ Falha: as seguintes linhas não têm OCR associado:")
-            for row in faltantes:
-                print(f"{row['DATA']} {row['HORA']} {row['ANEXO']}")
-            print(f"\nTotal de linhas sem OCR: {len(faltantes)}")
-            sys.exit(1)
-        
-        # Verifica se há arquivos processados no XML mas sem texto (imagens ilegíveis)
-        imagens_sem_texto = []
-        if os.path.exists(xml_file):
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
-            for entry in root.findall('entry'):
-                arquivo = entry.get('arquivo')
-                texto = entry.text or ''
-                if not texto or texto == '':
-                    # Verifica se esse arquivo está no CSV
-                    if arquivo in df['ANEXO'].values:
-                        imagens_sem_texto.append(arquivo)
-        
-        if imagens_sem_texto:
-            print(f"⚠️  Aviso: {len(imagens_sem_texto)} imagens foram processadas mas não têm texto legível:")
-            for arquivo in imagens_sem_texto:
-                print(f"  {arquivo}")
-            print("  (Isso é normal para imagens sem texto ou ilegíveis)")
-        
-        print("✅ OK: todas as linhas têm OCR processado.")
-        print(f"Total de linhas validadas: {len(df)}")
-        
     except FileNotFoundError:
         print(f"❌ Erro: arquivo {arquivo_csv} não encontrado")
         sys.exit(1)
@@ -80,4 +72,4 @@ if __name__ == "__main__":
     if len(sys.argv) != 2:
         print("Uso: python check.py <arquivo_calculo.csv>")
         sys.exit(1)
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -12,15 +12,18 @@ import os
 import shutil
 from .env import (
     ATTR_FIN_DIR_INPUT,
-    ATTR_FIN_DIR_IMGS
-)
-from .app import (
-    processar_incremental,
-    verificar_totais,
-    corrigir_totalizadores_duplicados,
-    dismiss_entry,
-    fix_entry
+    ATTR_FIN_DIR_IMGS,
+    ATTR_FIN_OCR_WORKERS,
+    ATTR_FIN_WATCH_DEBOUNCE,
+    ATTR_FIN_WATCH_INTERVALO,
+    ATTR_FIN_ARQ_FIXTURES_IA,
+    ATTR_FIN_LLM_FAKE_LATENCIA,
+    ATTR_FIN_LLM_FAKE_JITTER,
+    ATTR_FIN_LLM_FAKE_ERROS,
+    ATTR_FIN_LLM_FAKE_SEMENTE
 )
+# O módulo app (pandas, relatórios, OCR e IA) é importado dentro de cada subcomando que o usa,
+# para que comandos leves como history iniciem sem carregá-lo
 
 
 @click.group()
@@ -33,19 +36,23 @@ def cli():
 @click.option('--force', is_flag=True, help=f'Reprocessa todos os arquivos de {ATTR_FIN_DIR_INPUT}/')
 @click.option('--entry', type=str, help='Reprocessa apenas a linha correspondente (formato: DD/MM/AAAA HH:MM:SS)')
 @click.option('--backup', is_flag=True, help='Cria arquivos de backup antes do processamento')
-def processar(force, entry, backup):
+@click.option('--workers', type=click.IntRange(min=1), default=ATTR_FIN_OCR_WORKERS, show_default=True,
+              help='Número de processos paralelos para a etapa de OCR')
+def processar(force, entry, backup, workers):
     """Executa o processamento incremental dos comprovantes (PDFs + imagens)."""
+    from .app import processar_incremental
     from .history import CommandHistory
 
     # Prepara argumentos para o histórico - inclui TODOS os argumentos
     arguments = {
         "force": force,
         "entry": entry,
-        "backup": backup
+        "backup": backup,
+        "workers": workers
     }
 
     try:
-        processar_incremental(force=force, entry=entry, backup=backup)
+        processar_incremental(force=force, entry=entry, backup=backup, workers=workers)
 
         # Se foi modo forçado, move arquivos de volta para {ATTR_FIN_DIR_IMGS}/
         if force:
@@ -139,12 +146,14 @@ def processar_img(force, entry, backup):
 @click.argument('csv_file', type=click.Path(exists=True))
 def verificar(csv_file):
     """Executa verificação dos totais no CSV informado."""
+    from .app import verificar_totais
     verificar_totais(csv_file)
 
 @cli.command()
 @click.argument('csv_file', type=click.Path(exists=True))
 def corrigir(csv_file):
     """Corrige totalizadores duplicados no CSV informado."""
+    from .app import corrigir_totalizadores_duplicados
     from .history import CommandHistory
 
     arguments = {
@@ -182,6 +191,7 @@ def prestacao():
 @click.option('--ia', is_flag=True, help='Re-submete a imagem para o ChatGPT após rotação')
 def fix(data_hora, value, classification, description, dismiss, rotate, ia):
     """Corrige uma entrada específica em todos os arquivos CSV."""
+    from .app import fix_entry
     from .history import CommandHistory
 
     # Prepara argumentos para o histórico - inclui TODOS os argumentos
@@ -208,6 +218,7 @@ def fix(data_hora, value, classification, description, dismiss, rotate, ia):
 @click.argument('data_hora', type=str)
 def dismiss(data_hora):
     """Marca uma entrada como desconsiderada (dismiss) em todos os arquivos CSV."""
+    from .app import dismiss_entry
     from .history import CommandHistory
 
     # Prepara argumentos para o histórico
@@ -224,6 +235,37 @@ def dismiss(data_hora):
 
     exit(0 if sucesso else 1)
 
+@cli.command()
+@click.option('--workers', type=click.IntRange(min=1), default=ATTR_FIN_OCR_WORKERS, show_default=True,
+              help='Número de processos paralelos para a etapa de OCR')
+@click.option('--debounce', type=click.FloatRange(min=0), default=ATTR_FIN_WATCH_DEBOUNCE, show_default=True,
+              help=f'Segundos sem alterações em {ATTR_FIN_DIR_INPUT}/ antes de processar')
+@click.option('--intervalo', type=click.FloatRange(min=0.1), default=ATTR_FIN_WATCH_INTERVALO, show_default=True,
+              help='Intervalo de verificação em segundos, quando o watchdog não está instalado')
+def watch(workers, debounce, intervalo):
+    """Observa o diretório de entrada e processa cada nova exportação do WhatsApp assim que chega."""
+    from .app import processar_incremental
+    from .history import CommandHistory
+    from .watch import observar_entrada
+
+    arguments = {
+        "force": False,
+        "entry": None,
+        "backup": False,
+        "workers": workers,
+        "watch": True
+    }
+
+    def processar():
+        sucesso = False
+        try:
+            processar_incremental(workers=workers)
+            sucesso = True
+        finally:
+            CommandHistory().record_command("processar", arguments, sucesso)
+
+    observar_entrada(processar, debounce=debounce, intervalo=intervalo)
+
 @cli.command()
 @click.option('--host', default='127.0.0.1', help='Host para servir a API (padrão: 127.0.0.1)')
 @click.option('--port', default=8000, help='Porta para servir a API (padrão: 8000)')
@@ -326,5 +368,62 @@ def history(command, limit, json, recent, stats, clear):
             print()
 
 
+@cli.command('cache-ia')
+@click.option('--json', is_flag=True, help='Saída em formato JSON')
+@click.option('--clear', is_flag=True, help='Limpar todas as respostas em cache')
+def cache_ia(json, clear):
+    """Exibe as estatísticas do cache de respostas de IA (acertos, falhas e volume)."""
+    from .cache_ia import obter_cache_ia
+
+    cache = obter_cache_ia()
+
+    if clear:
+        cache.limpar()
+        return
+
+    stats_data = cache.estatisticas()
+    if json:
+        import json as json_module
+        print(json_module.dumps(stats_data, ensure_ascii=False, indent=2))
+        return
+
+    print("📊 Estatísticas do Cache de IA:")
+    print(f"  Arquivo: {stats_data['arquivo']}")
+    print(f"  Entradas: {stats_data['entradas']}")
+    print(f"  Tamanho: {stats_data['tamanho_bytes'] / 1024:.1f} KB")
+    print(f"  Acertos: {stats_data['acertos']}")
+    print(f"  Falhas: {stats_data['falhas']}")
+    print(f"  Taxa de acerto: {stats_data['taxa_acerto']:.1%}")
+    if stats_data['por_funcao']:
+        print("\n  Por função:")
+        for funcao, contagem in stats_data['por_funcao'].items():
+            print(f"    {funcao}: {contagem['acertos']} acertos / {contagem['falhas']} falhas")
+
+
+@cli.command('fake-llm')
+@click.option('--host', default='127.0.0.1', help='Host para servir o stand-in (padrão: 127.0.0.1)')
+@click.option('--port', default=8010, help='Porta para servir o stand-in (padrão: 8010)')
+@click.option('--fixtures', default=ATTR_FIN_ARQ_FIXTURES_IA, show_default=True,
+              help='Arquivo JSONL com as respostas gravadas')
+@click.option('--latencia', type=click.FloatRange(min=0), default=ATTR_FIN_LLM_FAKE_LATENCIA, show_default=True,
+              help='Latência média por requisição, em ms')
+@click.option('--jitter', type=click.FloatRange(min=0), default=ATTR_FIN_LLM_FAKE_JITTER, show_default=True,
+              help='Variação máxima da latência, em ms')
+@click.option('--taxa-erro', type=click.FloatRange(0, 1), default=ATTR_FIN_LLM_FAKE_ERROS, show_default=True,
+              help='Fração de requisições respondidas com erro 429/500')
+@click.option('--semente', type=int, default=ATTR_FIN_LLM_FAKE_SEMENTE, show_default=True,
+              help='Semente do sorteio de latência e erros')
+def fake_llm(host, port, fixtures, latencia, jitter, taxa_erro, semente):
+    """Inicia um stand-in offline compatível com a API do OpenAI (respostas gravadas ou sintetizadas)."""
+    import uvicorn
+    from .fake_llm import criar_app_fake_llm
+
+    app = criar_app_fake_llm(fixtures, latencia, jitter, taxa_erro, semente)
+    print(f"🤖 Stand-in de IA em http://{host}:{port}/v1")
+    print(f"💡 Use OPENAI_BASE_URL=http://{host}:{port}/v1 para direcionar o processamento a ele")
+    print("⏹️  Pressione Ctrl+C para parar o servidor")
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,507 @@
+# db.py
+# Caminho relativo ao projeto: db.py
+# Camada de armazenamento em SQLite (WAL) com o esquema de db/db.ddl para o cálculo e o histórico; o calculo.csv passa a ser formato de exportação
+# pandas e numpy são importados nas funções de planilha: o histórico (comando history) não os carrega
+from __future__ import annotations
+import os
+import re
+import json
+import sqlite3
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+from .helper import normalize_value_to_brazilian_format
+from .env import ATTR_FIN_ARQ_DB, ATTR_FIN_ARQ_CALCULO
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Esquema das tabelas (pasta db/ na raiz do projeto)
+ARQ_DDL = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "db", "db.ddl")
+
+# Índices usados nas buscas pontuais (fix/dismiss por data e hora, recuperação por anexo) e no histórico
+ESQUEMA_INDICES = """
+CREATE INDEX IF NOT EXISTS idx_calculo_momento_mensagem ON calculo (momento_mensagem);
+CREATE INDEX IF NOT EXISTS idx_calculo_anexo ON calculo (anexo);
+CREATE INDEX IF NOT EXISTS idx_history_momento_mensagem ON history (momento_mensagem);
+CREATE INDEX IF NOT EXISTS idx_history_command ON history (command);
+CREATE INDEX IF NOT EXISTS idx_history_execution ON history (execution);
+"""
+
+# Controle das exportações: detecta CSV alterado fora do sistema antes de usar o banco
+ESQUEMA_CONTROLE = """
+CREATE TABLE IF NOT EXISTS exportacoes (
+    arquivo TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    tamanho INTEGER NOT NULL
+);
+"""
+
+# Índice (DATA, HORA) -> linha das demais planilhas CSV (mensagens/ e tmp/), validado pela assinatura do arquivo
+ESQUEMA_LOCALIZACOES = """
+CREATE TABLE IF NOT EXISTS planilhas_indexadas (
+    arquivo TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    tamanho INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS localizacoes (
+    arquivo TEXT NOT NULL,
+    momento_mensagem DATETIME NOT NULL,
+    linha INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_localizacoes_momento_mensagem ON localizacoes (momento_mensagem);
+CREATE INDEX IF NOT EXISTS idx_localizacoes_arquivo ON localizacoes (arquivo);
+"""
+
+# Contadores do histórico por comando, atualizados a cada registro: próximo índice e estatísticas
+# sem varrer a tabela history. São cumulativos, incluindo as entradas já arquivadas pela rotação.
+ESQUEMA_HISTORICO = """
+CREATE TABLE IF NOT EXISTS history_contadores (
+    command TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    sucesso INTEGER NOT NULL,
+    primeiro TEXT,
+    ultimo TEXT,
+    ultimo_index INTEGER NOT NULL
+);
+"""
+
+SQL_RECONSTRUIR_CONTADORES_HISTORICO = (
+    'INSERT INTO history_contadores (command, total, sucesso, primeiro, ultimo, ultimo_index) '
+    'SELECT command, COUNT(*), COALESCE(SUM(success), 0), MIN(execution), MAX(execution), COALESCE(MAX("index"), 0) '
+    'FROM history GROUP BY command'
+)
+
+# Colunas do calculo.csv e a coluna correspondente na tabela calculo (DATA e HORA formam momento_mensagem)
+COLUNAS_CALCULO = {
+    'REMETENTE': 'remetente',
+    'CLASSIFICACAO': 'classificacao',
+    'RICARDO': 'ricardo',
+    'RAFAEL': 'rafael',
+    'ANEXO': 'anexo',
+    'DESCRICAO': 'descricao',
+    'VALOR': 'valor',
+    'OCR': 'ocr',
+    'VALIDADE': 'validade',
+    'MOTIVO_ERRO': 'motivo_erro',
+}
+ORDEM_CSV_CALCULO = ['DATA', 'HORA', 'REMETENTE', 'CLASSIFICACAO', 'RICARDO', 'RAFAEL',
+                     'ANEXO', 'DESCRICAO', 'VALOR', 'OCR', 'VALIDADE', 'MOTIVO_ERRO']
+
+PADRAO_DATA = re.compile(r'^(\d{2})/(\d{2})/(\d{4})$')
+
+# Conversões de volta ao formato das planilhas, feitas pelo próprio SQLite na leitura:
+# momento_mensagem -> DATA (DD/MM/AAAA) e HORA; fora do padrão, separa no primeiro espaço, como foi guardado.
+# VALOR numérico -> formato brasileiro com duas casas; textos preservados voltam como estavam.
+MOMENTO_NO_PADRAO = "momento_mensagem GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]'"
+SQL_DATA = (f"CASE WHEN {MOMENTO_NO_PADRAO} THEN substr(momento_mensagem, 9, 2) || '/' || substr(momento_mensagem, 6, 2)"
+            " || '/' || substr(momento_mensagem, 1, 4)"
+            " ELSE NULLIF(substr(momento_mensagem, 1, instr(momento_mensagem || ' ', ' ') - 1), '') END")
+SQL_HORA = (f"CASE WHEN {MOMENTO_NO_PADRAO} THEN substr(momento_mensagem, 12)"
+            " ELSE NULLIF(substr(momento_mensagem, instr(momento_mensagem || ' ', ' ') + 1), '') END")
+SQL_VALOR = "CASE WHEN typeof(valor) = 'real' THEN replace(printf('%.2f', valor), '.', ',') ELSE valor END"
+
+
+def _ausente(valor: Any) -> bool:
+    """pd.isna para um valor, sem carregar o pandas quando o valor já é texto."""
+    if valor is None or isinstance(valor, str):
+        return valor is None
+    import pandas as pd
+    return bool(pd.isna(valor))
+
+
+def momento_mensagem(data: Any, hora: Any) -> Optional[str]:
+    """Converte DATA (DD/MM/AAAA) e HORA (HH:MM:SS) no DATETIME ordenável do esquema (AAAA-MM-DD HH:MM:SS)."""
+    data = '' if _ausente(data) else str(data).strip()
+    hora = '' if _ausente(hora) else str(hora).strip()
+    if not data and not hora:
+        return None
+    encontrado = PADRAO_DATA.match(data)
+    if encontrado and re.match(r'^\d{2}:\d{2}:\d{2}$', hora):
+        dia, mes, ano = encontrado.groups()
+        return f"{ano}-{mes}-{dia} {hora}"
+    # Fora do padrão: guarda como veio para exportar sem perdas
+    return f"{data} {hora}"
+
+
+def momentos_serie(datas: pd.Series, horas: pd.Series) -> pd.Series:
+    """Versão vetorizada de momento_mensagem para colunas inteiras de DATA e HORA."""
+    datas = datas.fillna('').astype(str).str.strip()
+    horas = horas.fillna('').astype(str).str.strip()
+    partes = datas.str.extract(r'^(\d{2})/(\d{2})/(\d{4})$')
+    convertidos = partes[2] + '-' + partes[1] + '-' + partes[0] + ' ' + horas
+    validos = partes[0].notna() & horas.str.match(r'^\d{2}:\d{2}:\d{2}$')
+    return convertidos.where(validos, datas + ' ' + horas)
+
+
+def _texto(valor: Any) -> Optional[str]:
+    return None if _ausente(valor) else str(valor)
+
+
+def _valor_para_banco(valor: Any) -> Any:
+    """VALOR é REAL no esquema; textos que não são números são preservados como vieram."""
+    if _ausente(valor) or str(valor).strip() == '':
+        return None
+    try:
+        return float(normalize_value_to_brazilian_format(valor).replace(',', '.'))
+    except ValueError:
+        return str(valor)
+
+
+def _coluna(linha: Dict[str, Any], nome: str) -> Any:
+    """Lê a coluna em maiúsculas ou minúsculas (calculo.csv usa DATA, mensagens.csv usa data)."""
+    if nome in linha:
+        return linha[nome]
+    return linha.get(nome.lower(), float('nan'))
+
+
+class BancoDados:
+    """Armazenamento em SQLite da planilha de cálculo e do histórico.
+
+    As tabelas mensagens e ocr_extract do esquema não são usadas: mensagens.csv e o journal do
+    OCR seguem como fonte de dados, e as demais planilhas têm apenas as posições indexadas."""
+
+    def __init__(self, caminho: str = ATTR_FIN_ARQ_DB, arquivo_ddl: str = ARQ_DDL):
+        self.caminho = caminho
+        self._lock = Lock()
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        with open(arquivo_ddl, 'r', encoding='utf-8') as f:
+            ddl = f.read()
+        # O DDL do projeto cria as tabelas sem IF NOT EXISTS: torna a aplicação idempotente
+        ddl = re.sub(r'CREATE TABLE (?!IF NOT EXISTS)', 'CREATE TABLE IF NOT EXISTS ', ddl, flags=re.IGNORECASE)
+        self._conexao.executescript(ddl + ESQUEMA_INDICES + ESQUEMA_CONTROLE + ESQUEMA_LOCALIZACOES + ESQUEMA_HISTORICO)
+        # Bancos anteriores aos contadores: monta-os uma única vez a partir da tabela history
+        if (self._conexao.execute("SELECT 1 FROM history LIMIT 1").fetchone()
+                and not self._conexao.execute("SELECT 1 FROM history_contadores LIMIT 1").fetchone()):
+            self._executar_em_transacao([(SQL_RECONSTRUIR_CONTADORES_HISTORICO, [()])])
+
+    def _executar_em_transacao(self, comandos: Iterable[Tuple[str, Iterable]]):
+        with self._lock:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, parametros in comandos:
+                    self._conexao.executemany(sql, parametros)
+                self._conexao.execute("COMMIT")
+            except Exception:
+                self._conexao.execute("ROLLBACK")
+                raise
+
+    # ==== calculo ====
+
+    @staticmethod
+    def _linhas_calculo(df: pd.DataFrame) -> List[Tuple]:
+        import numpy as np
+        linhas = []
+        for linha in df.to_dict('records'):
+            registro = [momento_mensagem(_coluna(linha, 'DATA'), _coluna(linha, 'HORA'))]
+            for coluna_csv, coluna_db in COLUNAS_CALCULO.items():
+                valor = linha.get(coluna_csv, np.nan)
+                registro.append(_valor_para_banco(valor) if coluna_db == 'valor' else _texto(valor))
+            linhas.append(tuple(registro))
+        return linhas
+
+    def _sql_inserir_calculo(self) -> str:
+        colunas = ['momento_mensagem'] + list(COLUNAS_CALCULO.values())
+        return f"INSERT INTO calculo ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})"
+
+    def inserir_calculo(self, df: pd.DataFrame):
+        """Acrescenta linhas à tabela calculo (na ordem do DataFrame)."""
+        self._executar_em_transacao([(self._sql_inserir_calculo(), self._linhas_calculo(df))])
+
+    def substituir_calculo(self, df: pd.DataFrame):
+        """Substitui todo o conteúdo da tabela calculo pelas linhas do DataFrame."""
+        self._executar_em_transacao([
+            ("DELETE FROM calculo", [()]),
+            (self._sql_inserir_calculo(), self._linhas_calculo(df)),
+        ])
+
+    def _consultar_calculo(self, where: str = "", parametros: Tuple = ()) -> pd.DataFrame:
+        import numpy as np
+        import pandas as pd
+        colunas = ', '.join(SQL_VALOR if coluna == 'valor' else coluna for coluna in COLUNAS_CALCULO.values())
+        with self._lock:
+            linhas = self._conexao.execute(
+                f"SELECT rowid, {SQL_DATA}, {SQL_HORA}, {colunas} FROM calculo {where} ORDER BY rowid", parametros
+            ).fetchall()
+        df = pd.DataFrame.from_records(linhas, columns=['rowid', 'DATA', 'HORA'] + list(COLUNAS_CALCULO),
+                                       index='rowid', coerce_float=False).astype(object)
+        return df[ORDEM_CSV_CALCULO].where(df[ORDEM_CSV_CALCULO].notna(), np.nan)
+
+    def carregar_calculo(self) -> pd.DataFrame:
+        """Retorna a tabela calculo com as colunas do calculo.csv (índice = rowid)."""
+        return self._consultar_calculo()
+
+    def buscar_calculo(self, data: str, hora: str) -> pd.DataFrame:
+        """Linhas de uma data/hora (DD/MM/AAAA, HH:MM:SS), pelo índice de momento_mensagem."""
+        return self._consultar_calculo("WHERE momento_mensagem = ?", (momento_mensagem(data, hora),))
+
+    def atualizar_calculo(self, df: pd.DataFrame):
+        """Grava de volta as linhas alteradas de um DataFrame obtido de buscar_calculo (pelo rowid)."""
+        atribuicoes = ', '.join(f"{coluna} = ?" for coluna in ['momento_mensagem'] + list(COLUNAS_CALCULO.values()))
+        linhas = [registro + (rowid,) for registro, rowid in zip(self._linhas_calculo(df), df.index)]
+        self._executar_em_transacao([(f"UPDATE calculo SET {atribuicoes} WHERE rowid = ?", linhas)])
+
+    def contar_calculo(self) -> int:
+        with self._lock:
+            return self._conexao.execute("SELECT COUNT(*) FROM calculo").fetchone()[0]
+
+    # ==== exportação ====
+
+    @staticmethod
+    def _assinatura(arquivo: str) -> Optional[Tuple[int, int]]:
+        try:
+            estado = os.stat(arquivo)
+        except OSError:
+            return None
+        return estado.st_mtime_ns, estado.st_size
+
+    def registrar_exportacao(self, arquivo: str):
+        """Guarda a assinatura (mtime, tamanho) do CSV recém-exportado a partir do banco."""
+        assinatura = self._assinatura(arquivo)
+        if assinatura is None:
+            return
+        self._executar_em_transacao([(
+            "INSERT OR REPLACE INTO exportacoes (arquivo, mtime_ns, tamanho) VALUES (?, ?, ?)",
+            [(os.path.abspath(arquivo),) + assinatura]
+        )])
+
+    def exportacao_em_dia(self, arquivo: str) -> bool:
+        """True se o CSV é exatamente o que o banco exportou por último (não foi alterado por fora)."""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT mtime_ns, tamanho FROM exportacoes WHERE arquivo = ?", (os.path.abspath(arquivo),)
+            ).fetchone()
+        return linha is not None and tuple(linha) == self._assinatura(arquivo)
+
+    def sincronizar_calculo(self, arquivo_csv: str = ATTR_FIN_ARQ_CALCULO):
+        """Reimporta o calculo.csv quando ele não corresponde à última exportação do banco."""
+        import pandas as pd
+        if not os.path.exists(arquivo_csv) or self.exportacao_em_dia(arquivo_csv):
+            return
+        self.substituir_calculo(pd.read_csv(arquivo_csv, dtype=str))
+        self.registrar_exportacao(arquivo_csv)
+        print(f"🗄️  Tabela calculo sincronizada a partir de {arquivo_csv}")
+
+    def exportar_calculo_csv(self, arquivo_csv: str = ATTR_FIN_ARQ_CALCULO):
+        """Exporta a tabela calculo para o CSV usado pelos relatórios."""
+        diretorio = os.path.dirname(arquivo_csv)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        self.carregar_calculo().to_csv(arquivo_csv, index=False, quoting=1)
+        self.registrar_exportacao(arquivo_csv)
+
+    # ==== localização de entradas nas planilhas CSV ====
+
+    def _gravar_assinatura_planilha(self, arquivo: str) -> List[Tuple[str, Iterable]]:
+        assinatura = self._assinatura(arquivo)
+        if assinatura is None:
+            return []
+        return [("INSERT OR REPLACE INTO planilhas_indexadas (arquivo, mtime_ns, tamanho) VALUES (?, ?, ?)",
+                 [(os.path.abspath(arquivo),) + assinatura])]
+
+    def indexar_planilha(self, arquivo: str, df: Optional[pd.DataFrame] = None):
+        """Reconstrói o índice (DATA, HORA) -> linha de um CSV; `df` evita reler o arquivo recém-gravado."""
+        import pandas as pd
+        if df is None:
+            df = pd.read_csv(arquivo, dtype=str, usecols=lambda c: c.lower() in ('data', 'hora'))
+        colunas = {c.lower(): c for c in df.columns}
+        linhas = []
+        if 'data' in colunas and 'hora' in colunas:
+            momentos = momentos_serie(df[colunas['data']], df[colunas['hora']])
+            caminho = os.path.abspath(arquivo)
+            linhas = [(caminho, momento, posicao) for posicao, momento in enumerate(momentos)]
+        self._executar_em_transacao([
+            ("DELETE FROM localizacoes WHERE arquivo = ?", [(os.path.abspath(arquivo),)]),
+            ("INSERT INTO localizacoes (arquivo, momento_mensagem, linha) VALUES (?, ?, ?)", linhas),
+        ] + self._gravar_assinatura_planilha(arquivo))
+
+    def atualizar_assinatura_planilha(self, arquivo: str):
+        """Após alterar apenas valores (não DATA/HORA) de um CSV indexado, as posições continuam válidas."""
+        self._executar_em_transacao(self._gravar_assinatura_planilha(arquivo))
+
+    def localizar_entrada(self, data: str, hora: str, arquivos: Iterable[str]) -> Dict[str, List[int]]:
+        """Retorna {arquivo: [linhas]} dos CSVs que contêm a data/hora; arquivos alterados fora do
+        sistema desde a última indexação são reindexados antes da consulta."""
+        caminhos = {os.path.abspath(arquivo): arquivo for arquivo in arquivos}
+        with self._lock:
+            assinaturas = dict(((a, (m, t)) for a, m, t in self._conexao.execute(
+                "SELECT arquivo, mtime_ns, tamanho FROM planilhas_indexadas")))
+        for caminho, arquivo in caminhos.items():
+            if assinaturas.get(caminho) != self._assinatura(arquivo):
+                self.indexar_planilha(arquivo)
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT arquivo, linha FROM localizacoes WHERE momento_mensagem = ? ORDER BY arquivo, linha",
+                (momento_mensagem(data, hora),)
+            ).fetchall()
+        encontradas: Dict[str, List[int]] = {}
+        for caminho, linha in linhas:
+            if caminho in caminhos:
+                encontradas.setdefault(caminhos[caminho], []).append(linha)
+        return encontradas
+
+    # ==== history ====
+
+    def registrar_historico(self, execution: str, command: str, arguments: Dict[str, Any], success: bool,
+                            momento: Optional[str] = None) -> int:
+        """Acrescenta um comando ao histórico; o índice é sequencial (1, 2, 3...). Retorna o índice.
+
+        O índice e as estatísticas vêm dos contadores por comando, com custo constante."""
+        with self._lock:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                indice = self._conexao.execute(
+                    'SELECT COALESCE(MAX(ultimo_index), 0) + 1 FROM history_contadores'
+                ).fetchone()[0]
+                self._conexao.execute(
+                    'INSERT INTO history ("index", execution, command, arguments, success, momento_mensagem) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (indice, execution, command, json.dumps(arguments, ensure_ascii=False), int(bool(success)), momento)
+                )
+                self._conexao.execute(
+                    'INSERT INTO history_contadores (command, total, sucesso, primeiro, ultimo, ultimo_index) '
+                    'VALUES (?, 1, ?, ?, ?, ?) ON CONFLICT(command) DO UPDATE SET '
+                    'total = total + 1, sucesso = sucesso + excluded.sucesso, '
+                    'ultimo = excluded.ultimo, ultimo_index = excluded.ultimo_index',
+                    (command, int(bool(success)), execution, execution, indice)
+                )
+                self._conexao.execute("COMMIT")
+            except Exception:
+                self._conexao.execute("ROLLBACK")
+                raise
+        return indice
+
+    def importar_historico(self, entradas: List[Dict[str, Any]]):
+        """Importa entradas no formato do history.json (migração) e recalcula os contadores."""
+        self._executar_em_transacao([(
+            'INSERT INTO history ("index", execution, command, arguments, success) VALUES (?, ?, ?, ?, ?)',
+            [(e.get('index'), e.get('execution'), e.get('command'),
+              json.dumps(e.get('arguments', {}), ensure_ascii=False), int(bool(e.get('success', False))))
+             for e in entradas]
+        ), ("DELETE FROM history_contadores", [()]), (SQL_RECONSTRUIR_CONTADORES_HISTORICO, [()])])
+
+    def consultar_historico(self, command: Optional[str] = None, desde: Optional[str] = None,
+                            limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Entradas do histórico em ordem de execução, filtradas por comando e/ou data ISO mínima."""
+        condicoes, parametros = [], []
+        if command:
+            condicoes.append("command = ?")
+            parametros.append(command)
+        if desde:
+            condicoes.append("execution >= ?")
+            parametros.append(desde)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        sql = f'SELECT "index", execution, command, arguments, success FROM history {where} ORDER BY rowid DESC'
+        if limit:
+            sql += " LIMIT ?"
+            parametros.append(int(limit))
+        with self._lock:
+            linhas = self._conexao.execute(sql, parametros).fetchall()
+        linhas.reverse()
+        return [
+            {"index": indice, "execution": execution, "command": command_, "arguments": json.loads(arguments or '{}'),
+             "success": bool(success)}
+            for indice, execution, command_, arguments, success in linhas
+        ]
+
+    def estatisticas_historico(self) -> Dict[str, Any]:
+        """Estatísticas lidas apenas dos contadores (uma linha por tipo de comando)."""
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT command, total, sucesso, primeiro, ultimo FROM history_contadores ORDER BY primeiro"
+            ).fetchall()
+        return {
+            "total": sum(total for _, total, _, _, _ in linhas),
+            "sucesso": sum(sucesso for _, _, sucesso, _, _ in linhas),
+            "tipos": {command: total for command, total, _, _, _ in linhas},
+            "primeiro": min((primeiro for _, _, _, primeiro, _ in linhas if primeiro), default=None),
+            "ultimo": max((ultimo for _, _, _, _, ultimo in linhas if ultimo), default=None),
+        }
+
+    def contar_historico_ativo(self) -> int:
+        """Entradas ainda na tabela history (as arquivadas pela rotação não contam), sem varrer a tabela."""
+        with self._lock:
+            minimo, maximo = self._conexao.execute("SELECT MIN(rowid), MAX(rowid) FROM history").fetchone()
+        return 0 if minimo is None else maximo - minimo + 1
+
+    def arquivar_historico(self, manter: int, arquivar: Callable[[List[Dict[str, Any]]], None]) -> int:
+        """Move as entradas mais antigas para `arquivar`, mantendo as `manter` mais recentes na tabela.
+
+        As entradas só são removidas se `arquivar` concluir sem erro. Os contadores não mudam: as
+        estatísticas continuam cumulativas. Retorna o número de entradas arquivadas."""
+        with self._lock:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                limite = self._conexao.execute(
+                    "SELECT rowid FROM history ORDER BY rowid DESC LIMIT 1 OFFSET ?", (max(0, manter - 1),)
+                ).fetchone()
+                linhas = [] if limite is None else self._conexao.execute(
+                    'SELECT "index", execution, command, arguments, success FROM history WHERE rowid < ? ORDER BY rowid',
+                    (limite[0],)
+                ).fetchall()
+                if linhas:
+                    arquivar([
+                        {"index": indice, "execution": execution, "command": command_,
+                         "arguments": json.loads(arguments or '{}'), "success": bool(success)}
+                        for indice, execution, command_, arguments, success in linhas
+                    ])
+                    self._conexao.execute("DELETE FROM history WHERE rowid < ?", (limite[0],))
+                self._conexao.execute("COMMIT")
+            except Exception:
+                self._conexao.execute("ROLLBACK")
+                raise
+        return len(linhas)
+
+    def limpar_historico(self):
+        self._executar_em_transacao([("DELETE FROM history", [()]), ("DELETE FROM history_contadores", [()])])
+
+
+_banco = None
+_banco_lock = Lock()
+
+
+def obter_banco() -> BancoDados:
+    """Retorna a instância do banco compartilhada pelo processo."""
+    global _banco
+    with _banco_lock:
+        if _banco is None:
+            _banco = BancoDados()
+        return _banco
+
+
+def _mesmo_arquivo(a: str, b: str) -> bool:
+    return os.path.abspath(a) == os.path.abspath(b)
+
+
+def gravar_planilha(df: pd.DataFrame, arquivo_csv: str, novos: Optional[pd.DataFrame] = None, **opcoes_csv):
+    """Grava a planilha no banco e exporta o CSV.
+
+    Para o calculo.csv, `novos` (as linhas recém-acrescentadas a `df`) evita regravar a tabela
+    inteira quando o banco já está em sincronia com o CSV anterior. Os demais CSVs (incluindo o
+    mensagens.csv) são gravados só em disco e têm suas posições (DATA, HORA) indexadas para as
+    correções pontuais."""
+    eh_calculo = _mesmo_arquivo(arquivo_csv, ATTR_FIN_ARQ_CALCULO)
+    banco = None
+    if eh_calculo:
+        try:
+            banco = obter_banco()
+            if (novos is not None and banco.exportacao_em_dia(arquivo_csv)
+                  and banco.contar_calculo() == len(df) - len(novos)):
+                banco.inserir_calculo(novos)
+            else:
+                banco.substituir_calculo(df)
+        except Exception as e:
+            print(f"⚠️  Banco de dados indisponível ({e}); exportando apenas {arquivo_csv}")
+            banco = None
+    df.to_csv(arquivo_csv, index=False, **opcoes_csv)
+    if banco is not None and eh_calculo:
+        banco.registrar_exportacao(arquivo_csv)
+    elif not eh_calculo:
+        try:
+            obter_banco().indexar_planilha(arquivo_csv, df)
+        except Exception as e:
+            print(f"⚠️  Erro ao indexar {arquivo_csv}: {e}")
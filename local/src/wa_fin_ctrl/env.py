@@ -2,6 +2,7 @@ import os
 
 # ==== VARIÁVEIS DE AMBIENTE ====
 ATTR_FIN_OPENAI_API_KEY     = os.getenv('OPENAI_API_KEY', None)
+ATTR_FIN_OPENAI_BASE_URL    = os.getenv('OPENAI_BASE_URL', None)
 ATTR_FIN_DIR_INPUT          = os.getenv('ATTR_FIN_DIR_INPUT', 'input')
 ATTR_FIN_DIR_IMGS           = os.getenv('ATTR_FIN_DIR_IMGS', 'imgs')
 ATTR_FIN_DIR_MASSA          = os.getenv('ATTR_FIN_DIR_MASSA', 'massa')
@@ -15,4 +16,22 @@ ATTR_FIN_ARQ_MENSAGENS      = os.getenv('ATTR_FIN_ARQ_MENSAGENS', 'mensagens/men
 ATTR_FIN_ARQ_DIAGNOSTICO    = os.getenv('ATTR_FIN_ARQ_DIAGNOSTICO', 'mensagens/diagnostico.csv')
 ATTR_FIN_ARQ_CHAT           = os.getenv('ATTR_FIN_ARQ_CHAT', '_chat.txt')
 ATTR_FIN_ARQ_OCR_XML        = os.getenv('ATTR_FIN_ARQ_OCR_XML', 'ocr/extract.xml')
-ATTR_FIN_ARQ_HISTORY        = os.getenv('ATTR_FIN_ARQ_HISTORY', 'data/history.json') 
\ No newline at end of file
+ATTR_FIN_ARQ_CACHE_IA       = os.getenv('ATTR_FIN_ARQ_CACHE_IA', 'ocr/ia-cache.db')
+ATTR_FIN_ARQ_FIXTURES_IA    = os.getenv('ATTR_FIN_ARQ_FIXTURES_IA', 'ocr/ia-fixtures.jsonl')
+ATTR_FIN_ARQ_HISTORY        = os.getenv('ATTR_FIN_ARQ_HISTORY', 'data/history.json')
+ATTR_FIN_HISTORY_MAX        = int(os.getenv('ATTR_FIN_HISTORY_MAX', 10000))
+ATTR_FIN_ARQ_DB             = os.getenv('ATTR_FIN_ARQ_DB', 'data/wa-fin.db')
+ATTR_FIN_ARQ_DIGESTS        = os.getenv('ATTR_FIN_ARQ_DIGESTS', 'data/report-digests.json')
+ATTR_FIN_OCR_WORKERS        = int(os.getenv('ATTR_FIN_OCR_WORKERS', os.cpu_count() or 1))
+ATTR_FIN_RELATORIO_WORKERS  = int(os.getenv('ATTR_FIN_RELATORIO_WORKERS', os.cpu_count() or 1))
+ATTR_FIN_WATCH_DEBOUNCE     = float(os.getenv('ATTR_FIN_WATCH_DEBOUNCE', 2))
+ATTR_FIN_WATCH_INTERVALO    = float(os.getenv('ATTR_FIN_WATCH_INTERVALO', 1))
+ATTR_FIN_IA_CONCORRENCIA    = int(os.getenv('ATTR_FIN_IA_CONCORRENCIA', 8))
+ATTR_FIN_IA_REQ_POR_MINUTO  = int(os.getenv('ATTR_FIN_IA_REQ_POR_MINUTO', 300))
+ATTR_FIN_IA_CACHE_TTL_DIAS  = float(os.getenv('ATTR_FIN_IA_CACHE_TTL_DIAS', 180))
+ATTR_FIN_IA_CACHE_MAX_MB    = float(os.getenv('ATTR_FIN_IA_CACHE_MAX_MB', 200))
+ATTR_FIN_IA_GRAVAR_FIXTURES = os.getenv('ATTR_FIN_IA_GRAVAR_FIXTURES', '0') == '1'
+ATTR_FIN_LLM_FAKE_LATENCIA  = float(os.getenv('ATTR_FIN_LLM_FAKE_LATENCIA', 0))
+ATTR_FIN_LLM_FAKE_JITTER    = float(os.getenv('ATTR_FIN_LLM_FAKE_JITTER', 0))
+ATTR_FIN_LLM_FAKE_ERROS     = float(os.getenv('ATTR_FIN_LLM_FAKE_ERROS', 0))
+ATTR_FIN_LLM_FAKE_SEMENTE   = int(os.getenv('ATTR_FIN_LLM_FAKE_SEMENTE', 42))
\ No newline at end of file
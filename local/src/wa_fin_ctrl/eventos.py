@@ -0,0 +1,133 @@
+# eventos.py
+# Caminho relativo ao projeto: eventos.py
+# Barramento de eventos de progresso do pipeline: etapa atual, itens concluídos, vazão e ETA
+import time
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from .jobs import JobCancelado, verificar_cancelamento
+
+ETAPA_UNZIP = 'unzip'
+ETAPA_PARSE = 'parse'
+ETAPA_OCR = 'ocr'
+ETAPA_IA = 'ai'
+ETAPA_TOTAIS = 'totals'
+ETAPA_RENDER = 'render'
+
+STATUS_INICIADA = 'started'
+STATUS_EM_ANDAMENTO = 'running'
+STATUS_CONCLUIDA = 'done'
+STATUS_FALHOU = 'failed'
+STATUS_CANCELADA = 'cancelled'
+
+# Intervalo mínimo entre eventos 'running' da mesma etapa, para não inundar os clientes
+INTERVALO_EVENTOS = 0.5
+
+
+class BarramentoEventos:
+    """Distribui os eventos publicados aos assinantes, na thread de quem publica.
+
+    Falhas de um assinante não interrompem o pipeline nem os demais assinantes."""
+
+    def __init__(self):
+        self._assinantes: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def assinar(self, callback: Callable[[Dict[str, Any]], None]):
+        with self._lock:
+            if callback not in self._assinantes:
+                self._assinantes.append(callback)
+        return callback
+
+    def cancelar_assinatura(self, callback: Callable[[Dict[str, Any]], None]):
+        with self._lock:
+            if callback in self._assinantes:
+                self._assinantes.remove(callback)
+
+    def publicar(self, evento: Dict[str, Any]):
+        with self._lock:
+            assinantes = list(self._assinantes)
+        for callback in assinantes:
+            try:
+                callback(evento)
+            except Exception as e:
+                print(f"⚠️  Erro ao entregar evento de progresso: {e}")
+
+
+barramento = BarramentoEventos()
+
+
+class Etapa:
+    """Acompanha o progresso de uma etapa e publica eventos no barramento.
+
+    Usada como gerenciador de contexto: publica 'started' na entrada e 'done', 'failed' ou
+    'cancelled' na saída. O total pode ser informado depois, quando a etapa descobre quantos
+    itens tem (definir_total), e cada item concluído é informado por avancar(), que pode ser
+    chamado de várias threads. avancar() é também um ponto de verificação de cancelamento do
+    job, de modo que um job cancelado para no próximo item, e não só entre etapas."""
+
+    def __init__(self, nome: str, total: Optional[int] = None, destino: Optional[BarramentoEventos] = None):
+        self.nome = nome
+        self.total = total
+        self.concluidos = 0
+        self._destino = destino or barramento
+        self._inicio = time.monotonic()
+        self._ultimo_evento = 0.0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._inicio = time.monotonic()
+        self._publicar(STATUS_INICIADA)
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, tb):
+        if excecao is None:
+            self._publicar(STATUS_CONCLUIDA)
+        elif isinstance(excecao, JobCancelado):
+            self._publicar(STATUS_CANCELADA)
+        else:
+            self._publicar(STATUS_FALHOU, erro=str(excecao))
+        return False
+
+    def definir_total(self, total: int):
+        self.total = total
+        self._publicar(STATUS_EM_ANDAMENTO)
+
+    def avancar(self, quantidade: int = 1):
+        with self._lock:
+            self.concluidos += quantidade
+            agora = time.monotonic()
+            completou = self.total is not None and self.concluidos >= self.total
+            publicar = completou or agora - self._ultimo_evento >= INTERVALO_EVENTOS
+            if publicar:
+                self._ultimo_evento = agora
+        if publicar:
+            self._publicar(STATUS_EM_ANDAMENTO)
+        verificar_cancelamento()
+
+    def _publicar(self, status: str, erro: Optional[str] = None):
+        self._ultimo_evento = time.monotonic()
+        decorrido = self._ultimo_evento - self._inicio
+        vazao = self.concluidos / decorrido if decorrido > 0 and self.concluidos else None
+        eta = None
+        if status == STATUS_EM_ANDAMENTO and vazao and self.total is not None:
+            eta = round(max(0, self.total - self.concluidos) / vazao, 1)
+        evento = {
+            "type": "progress",
+            "stage": self.nome,
+            "status": status,
+            "done": self.concluidos,
+            "total": self.total,
+            "elapsed_seconds": round(decorrido, 2),
+            "throughput_per_second": round(vazao, 2) if vazao else None,
+            "eta_seconds": eta,
+            "timestamp": datetime.now().isoformat(),
+        }
+        if erro:
+            evento["error"] = erro
+        self._destino.publicar(evento)
+
+
+def etapa(nome: str, total: Optional[int] = None) -> Etapa:
+    """Etapa do pipeline publicando no barramento global: `with etapa(ETAPA_OCR) as progresso: ...`"""
+    return Etapa(nome, total)
@@ -0,0 +1,118 @@
+# fake_llm.py
+# Caminho relativo ao projeto: fake_llm.py
+# Stand-in offline compatível com a API de chat do OpenAI para benchmarks determinísticos do pipeline
+import re
+import json
+import time
+import random
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from .helper import ler_linhas_jsonl
+from .ia import chave_requisicao_ia
+from .env import *
+
+# Valores monetários no texto do prompt (ex.: "R$ 29,90" ou "R$1.533,27")
+PADRAO_VALOR_PROMPT = re.compile(r'R\$\s*(\d{1,3}(?:\.\d{3})*,\d{2}|\d+(?:[.,]\d{2})?)')
+PALAVRAS_TRANSFERENCIA = ["pix", "transferência", "ted", "doc"]
+# Fim do texto OCR dentro dos prompts de ia.py (início das instruções)
+PADRAO_FIM_TEXTO = re.compile(r'\n\s*(?:Instruções:|Retorne um objeto JSON)')
+
+
+def carregar_fixtures(caminho):
+    """Carrega as respostas gravadas (chave da requisição -> conteúdo); a última gravação prevalece."""
+    registros, _ = ler_linhas_jsonl(caminho)
+    return {r['chave']: r['conteudo'] for r in registros if 'chave' in r and 'conteudo' in r}
+
+
+def _texto_usuario(parametros):
+    """Concatena o texto das mensagens do usuário (inclusive partes textuais de mensagens multimodais)."""
+    partes = []
+    for mensagem in parametros.get('messages') or []:
+        if mensagem.get('role') != 'user':
+            continue
+        conteudo = mensagem.get('content')
+        if isinstance(conteudo, str):
+            partes.append(conteudo)
+        elif isinstance(conteudo, list):
+            partes.extend(p.get('text', '') for p in conteudo if isinstance(p, dict))
+    return '\n'.join(partes)
+
+
+def sintetizar_resposta(parametros):
+    """Resposta determinística para requisições sem fixture gravada, derivada apenas do prompt."""
+    texto = _texto_usuario(parametros)
+    encontrado = PADRAO_VALOR_PROMPT.search(texto)
+    valor = encontrado.group(1) if encontrado else None
+    # Ignora as palavras das próprias instruções ao decidir a classificação
+    trecho = PADRAO_FIM_TEXTO.split(texto.split('Texto:', 1)[-1], 1)[0].lower()
+    classificacao = "Transferência" if any(p in trecho for p in PALAVRAS_TRANSFERENCIA) else "Pagamento"
+    if (parametros.get('response_format') or {}).get('type') == 'json_object':
+        return json.dumps({'valor': valor, 'descricao': "Pagamento", 'classificacao': classificacao}, ensure_ascii=False)
+    if 'classifique' in texto.lower():
+        return classificacao
+    if 'descrição' in texto.lower() and 'valor total' not in texto.lower():
+        return "Pagamento"
+    return valor or "NENHUM"
+
+
+def _resposta_chat(parametros, conteudo):
+    """Monta o corpo no formato chat.completion da API do OpenAI."""
+    return {
+        'id': f"chatcmpl-fake-{chave_requisicao_ia(parametros)[:24]}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': parametros.get('model') or '',
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': conteudo},
+            'finish_reason': 'stop'
+        }],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    }
+
+
+def criar_app_fake_llm(arquivo_fixtures=ATTR_FIN_ARQ_FIXTURES_IA,
+                       latencia_ms=ATTR_FIN_LLM_FAKE_LATENCIA,
+                       jitter_ms=ATTR_FIN_LLM_FAKE_JITTER,
+                       taxa_erro=ATTR_FIN_LLM_FAKE_ERROS,
+                       semente=ATTR_FIN_LLM_FAKE_SEMENTE):
+    """Cria o app FastAPI do stand-in.
+
+    Responde POST /v1/chat/completions com a fixture gravada para a requisição ou, na falta dela,
+    com uma resposta sintetizada. Latência (média e jitter, em ms) e a fração de erros 429/500
+    seguem um gerador com semente fixa, para que execuções repetidas sejam reproduzíveis."""
+    app = FastAPI(title="WA Fin Ctrl - LLM offline")
+    fixtures = carregar_fixtures(arquivo_fixtures)
+    sorteio = random.Random(semente)
+    contadores = {'requisicoes': 0, 'fixtures': 0, 'sintetizadas': 0, 'erros': 0}
+    print(f"🤖 Stand-in de IA: {len(fixtures)} fixture(s) carregada(s) de {arquivo_fixtures}")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "fixtures": len(fixtures), **contadores}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        parametros = await request.json()
+        contadores['requisicoes'] += 1
+        atraso = max(0.0, latencia_ms + sorteio.uniform(-jitter_ms, jitter_ms)) / 1000
+        falhar = sorteio.random() < taxa_erro
+        status = sorteio.choice([429, 500])
+        if atraso:
+            await asyncio.sleep(atraso)
+        if falhar:
+            contadores['erros'] += 1
+            return JSONResponse(status_code=status, content={'error': {
+                'message': "Erro simulado pelo stand-in de IA",
+                'type': 'rate_limit_error' if status == 429 else 'server_error'
+            }})
+        conteudo = fixtures.get(chave_requisicao_ia(parametros))
+        if conteudo is None:
+            contadores['sintetizadas'] += 1
+            conteudo = sintetizar_resposta(parametros)
+        else:
+            contadores['fixtures'] += 1
+        return _resposta_chat(parametros, conteudo)
+
+    return app
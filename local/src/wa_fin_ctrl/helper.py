@@ -3,10 +3,18 @@
 # Módulo de funções auxiliares para processamento de dados financeiros
 import re
 import os
-import pandas as pd
 import shutil
+import json
+import fcntl
+import hashlib
+import multiprocessing
+from contextlib import contextmanager
+from functools import lru_cache
 from .env import *
 
+# Tamanho do bloco lido ao calcular o hash de conteúdo dos anexos
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
 def normalize_value_to_brazilian_format(valor):
     """
     Converte qualquer formato de valor para o formato brasileiro (vírgula como decimal).
@@ -91,6 +99,33 @@ def normalize_value_to_brazilian_format(valor):
     except ValueError:
         return valor_str
 
+def converter_serie_para_float(serie):
+    """
+    Converte uma coluna de valores (pandas.Series) para float64 de uma só vez.
+    Segue as regras de normalize_value_to_brazilian_format: remove "R$" e espaços; com vírgula
+    e ponto, o ponto é milhar e a vírgula é decimal; só com vírgula, a vírgula é decimal;
+    o resultado é arredondado em centavos. Vazios e valores inválidos viram 0.0.
+    
+    Args:
+        serie: Series com valores em qualquer formato (string, float, int, NaN)
+        
+    Returns:
+        pandas.Series: Valores em float64, com o mesmo índice da entrada
+    """
+    import numpy as np
+    import pandas as pd
+    # Colunas de valores repetem muito (vazios, mesmos valores): converte cada valor distinto uma vez
+    codigos, distintos = pd.factorize(serie)
+    texto = pd.Series(distintos, dtype=object).astype(str).str.replace(r'[R$\s]', '', regex=True)
+    tem_virgula = texto.str.contains(',', regex=False)
+    tem_ponto = texto.str.contains('.', regex=False)
+    texto = texto.mask(tem_virgula & tem_ponto, texto.str.replace('.', '', regex=False))
+    numeros = pd.to_numeric(texto.str.replace(',', '.', regex=False), errors='coerce').to_numpy(dtype='float64')
+    numeros = np.round(np.where(np.isfinite(numeros), numeros, 0.0), 2)
+    # Código -1 indica vazio (NaN/None)
+    valores = np.where(codigos >= 0, numeros[codigos] if len(numeros) else 0.0, 0.0)
+    return pd.Series(valores, index=serie.index, dtype='float64')
+
 def normalize_value_to_american_format(valor):
     """
     Converte qualquer formato de valor para o formato americano (ponto como decimal).
@@ -258,6 +293,7 @@ def parse_value_from_input(valor_input):
         return valor_str
 
 def normalize_sender(remetente):
+    import pandas as pd
     if not remetente or pd.isna(remetente):
         return ""
     remetente_str = str(remetente).strip()
@@ -271,14 +307,7 @@ def normalize_sender(remetente):
 def adicionar_totalizacao_mensal(df):
     from datetime import datetime
     import calendar
-    def convert_to_float(value):
-        if pd.isna(value) or value == '':
-            return 0.0
-        try:
-            valor_brasileiro = normalize_value_to_brazilian_format(value)
-            return float(valor_brasileiro.replace(',', '.'))
-        except:
-            return 0.0
+    import pandas as pd
     df['DATA_DT'] = pd.to_datetime(df['DATA'], format='%d/%m/%Y', errors='coerce')
     df_sem_totais = df[df['REMETENTE'] != 'TOTAL MÊS'].copy()
     df_sem_totais = df_sem_totais.sort_values('DATA_DT').reset_index(drop=True)
@@ -287,8 +316,8 @@ def adicionar_totalizacao_mensal(df):
     meses_unicos = df_sem_totais['MES_ANO'].dropna().unique()
     for mes_periodo in sorted(meses_unicos):
         dados_mes = df_sem_totais[df_sem_totais['MES_ANO'] == mes_periodo]
-        total_ricardo = dados_mes['RICARDO'].apply(convert_to_float).sum()
-        total_rafael = dados_mes['RAFAEL'].apply(convert_to_float).sum()
+        total_ricardo = converter_serie_para_float(dados_mes['RICARDO']).sum()
+        total_rafael = converter_serie_para_float(dados_mes['RAFAEL']).sum()
         if total_ricardo > 0 or total_rafael > 0:
             ano = mes_periodo.year
             mes = mes_periodo.month
@@ -320,6 +349,7 @@ def adicionar_totalizacao_mensal(df):
     return df_combinado
 
 def incrementar_csv(novo_df, arquivo_csv):
+    import pandas as pd
     if os.path.exists(arquivo_csv):
         df_existente = pd.read_csv(arquivo_csv)
         eh_csv_anexos = 'VALOR' in novo_df.columns and 'DESCRICAO' in novo_df.columns
@@ -368,3 +398,86 @@ def mover_arquivos_processados():
     if arquivos_movidos > 0:
         print(f"Total de {arquivos_movidos} arquivos movidos para {ATTR_FIN_DIR_IMGS}/")
     return arquivos_movidos
+
+@lru_cache(maxsize=4096)
+def _hash_conteudo(caminho, mtime_ns, tamanho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def calcular_hash_arquivo(caminho):
+    """Retorna o SHA-256 (hex) do conteúdo do arquivo, ou None se ele não existir.
+
+    O resultado é memorizado por (caminho, mtime, tamanho), então o mesmo anexo não é
+    relido pelas etapas de OCR e IA; qualquer alteração no arquivo gera um novo hash."""
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    return _hash_conteudo(os.path.abspath(caminho), info.st_mtime_ns, info.st_size)
+
+@contextmanager
+def travar_arquivo(fd):
+    """Trava exclusiva entre processos (flock) sobre o arquivo aberto em `fd`, liberada na saída."""
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+def contexto_processos():
+    """Contexto multiprocessing dos pools de OCR e de renderização.
+
+    Os pools podem ser criados pela thread de um job dentro do processo multi-thread da API;
+    com 'fork' os filhos herdariam travas seguras por outras threads (stdout, barramento de
+    eventos) e poderiam travar. Usa 'forkserver' e, onde ele não existe, 'spawn'."""
+    metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(metodo)
+
+def anexar_linhas_jsonl(caminho, registros):
+    """Acrescenta registros a um arquivo JSON Lines com uma única escrita em modo append.
+
+    A escrita é feita sob travar_arquivo, de modo que quem compacta o arquivo (ocr.compactar_ocr)
+    não o esvazia entre a leitura e o truncamento perdendo linhas de outro processo."""
+    dados = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in registros).encode('utf-8')
+    diretorio = os.path.dirname(caminho)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+    fd = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        with travar_arquivo(fd):
+            # Se a última escrita foi interrompida no meio da linha, isola o trecho corrompido
+            tamanho = os.fstat(fd).st_size
+            if tamanho > 0:
+                with open(caminho, 'rb') as f:
+                    f.seek(tamanho - 1)
+                    if f.read(1) != b'\n':
+                        dados = b'\n' + dados
+            os.write(fd, dados)
+    finally:
+        os.close(fd)
+
+def ler_linhas_jsonl(caminho, offset=0):
+    """Lê as linhas completas de um arquivo JSON Lines a partir de `offset`.
+
+    Retorna (registros, novo_offset); linhas corrompidas são descartadas e uma linha final
+    sem quebra (escrita em andamento) fica para a próxima leitura."""
+    if not os.path.exists(caminho):
+        return [], offset
+    with open(caminho, 'rb') as f:
+        f.seek(offset)
+        dados = f.read()
+    fim = dados.rfind(b'\n')
+    if fim < 0:
+        return [], offset
+    registros = []
+    for linha in dados[:fim].split(b'\n'):
+        if not linha.strip():
+            continue
+        try:
+            registros.append(json.loads(linha))
+        except ValueError:
+            continue  # Linha corrompida por escrita interrompida: descarta só ela
+    return registros, offset + fim + 1
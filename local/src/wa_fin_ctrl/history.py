@@ -4,146 +4,95 @@
 
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
-from .env import ATTR_FIN_ARQ_HISTORY
+from .env import ATTR_FIN_ARQ_HISTORY, ATTR_FIN_HISTORY_MAX
+from .db import obter_banco, momento_mensagem
+from .helper import anexar_linhas_jsonl
 
 
 class CommandHistory:
-    """Classe para gerenciar o histórico de comandos executados"""
+    """Classe para gerenciar o histórico de comandos executados (tabela history do banco)
+
+    Acima de ATTR_FIN_HISTORY_MAX entradas, a metade mais antiga é movida para um arquivo JSON Lines
+    (history-arquivo.jsonl, ao lado do history.json); as estatísticas continuam cumulativas."""
 
     def __init__(self):
         self.history_file = ATTR_FIN_ARQ_HISTORY
-        self._ensure_data_directory()
-        self._ensure_history_file()
-
-    def _ensure_data_directory(self):
-        """Garante que o diretório data/ existe"""
-        data_dir = os.path.dirname(self.history_file)
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
-            print(f"📁 Diretório criado: {data_dir}")
-
-    def _ensure_history_file(self):
-        """Garante que o arquivo history.json existe"""
-        if not os.path.exists(self.history_file):
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
-            print(f"📄 Arquivo de histórico criado: {self.history_file}")
-
-    def _get_next_index(self) -> int:
-        """Obtém o próximo índice disponível"""
+        self.archive_file = f"{os.path.splitext(self.history_file)[0]}-arquivo.jsonl"
+        self.banco = obter_banco()
+        self._migrar_history_json()
+
+    def _migrar_history_json(self):
+        """Importa uma única vez o history.json legado para a tabela history"""
+        if not os.path.exists(self.history_file) or self.banco.estatisticas_historico()["total"]:
+            return
         try:
             with open(self.history_file, 'r', encoding='utf-8') as f:
                 history = json.load(f)
-                return len(history) + 1
-        except (FileNotFoundError, json.JSONDecodeError):
-            return 1
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ Erro ao ler histórico legado {self.history_file}: {str(e)}")
+            return
+        if history:
+            self.banco.importar_historico(history)
+        os.replace(self.history_file, f"{self.history_file}.migrado")
+        print(f"📦 Histórico migrado para o banco: {len(history)} comando(s) de {self.history_file}")
 
     def record_command(self, command: str, arguments: Dict[str, Any], success: bool = True):
         """Registra um comando executado no histórico"""
-        entry = {
-            "index": self._get_next_index(),
-            "execution": datetime.now().isoformat(),
-            "command": command,
-            "arguments": arguments,
-            "success": success
-        }
+        data_hora = str(arguments.get("data_hora") or "")
+        momento = momento_mensagem(*data_hora.split(' ', 1)) if ' ' in data_hora else None
 
         try:
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-
-            history.append(entry)
-
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
-
+            self.banco.registrar_historico(datetime.now().isoformat(), command, arguments, success, momento)
             print(f"📝 Comando registrado no histórico: {command}")
+            if ATTR_FIN_HISTORY_MAX > 0 and self.banco.contar_historico_ativo() > ATTR_FIN_HISTORY_MAX:
+                self._rotacionar()
 
         except Exception as e:
             print(f"⚠️ Erro ao registrar comando no histórico: {str(e)}")
 
+    def _rotacionar(self):
+        """Arquiva a metade mais antiga do histórico com uma única escrita em modo append"""
+        arquivadas = self.banco.arquivar_historico(
+            ATTR_FIN_HISTORY_MAX // 2, lambda entradas: anexar_linhas_jsonl(self.archive_file, entradas)
+        )
+        if arquivadas:
+            print(f"🗄️ Histórico rotacionado: {arquivadas} comando(s) arquivado(s) em {self.archive_file}")
+
     def get_history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Obtém o histórico de comandos"""
-        try:
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-
-            if limit:
-                return history[-limit:]
-            return history
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        return self.banco.consultar_historico(limit=limit)
 
     def get_command_history(self, command: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Obtém histórico de um comando específico"""
-        history = self.get_history()
-        filtered = [entry for entry in history if entry['command'] == command]
-
-        if limit:
-            return filtered[-limit:]
-        return filtered
+        return self.banco.consultar_historico(command=command, limit=limit)
 
     def get_recent_commands(self, hours: int = 24) -> List[Dict[str, Any]]:
         """Obtém comandos executados nas últimas N horas"""
-        try:
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-
-            cutoff_time = datetime.now().timestamp() - (hours * 3600)
-            recent = []
-
-            for entry in history:
-                try:
-                    entry_time = datetime.fromisoformat(entry['execution']).timestamp()
-                    if entry_time >= cutoff_time:
-                        recent.append(entry)
-                except (ValueError, TypeError):
-                    continue
-
-            return recent
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        # execution é ISO 8601 local, então a comparação textual respeita a ordem cronológica
+        cutoff_time = (datetime.now() - timedelta(hours=hours)).isoformat()
+        return self.banco.consultar_historico(desde=cutoff_time)
 
     def clear_history(self):
         """Limpa todo o histórico"""
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
+            self.banco.limpar_historico()
             print("🗑️ Histórico limpo com sucesso")
         except Exception as e:
             print(f"❌ Erro ao limpar histórico: {str(e)}")
 
     def get_statistics(self) -> Dict[str, Any]:
-        """Obtém estatísticas do histórico"""
-        history = self.get_history()
-
-        if not history:
-            return {
-                "total_commands": 0,
-                "successful_commands": 0,
-                "failed_commands": 0,
-                "command_types": {},
-                "first_command": None,
-                "last_command": None
-            }
-
-        successful = sum(1 for entry in history if entry.get('success', False))
-        failed = len(history) - successful
-
-        command_types = {}
-        for entry in history:
-            cmd = entry.get('command', 'unknown')
-            command_types[cmd] = command_types.get(cmd, 0) + 1
+        """Obtém estatísticas do histórico (somente dos contadores, sem ler as entradas)"""
+        estatisticas = self.banco.estatisticas_historico()
 
         return {
-            "total_commands": len(history),
-            "successful_commands": successful,
-            "failed_commands": failed,
-            "command_types": command_types,
-            "first_command": history[0]['execution'] if history else None,
-            "last_command": history[-1]['execution'] if history else None
+            "total_commands": estatisticas["total"],
+            "successful_commands": estatisticas["sucesso"],
+            "failed_commands": estatisticas["total"] - estatisticas["sucesso"],
+            "command_types": estatisticas["tipos"],
+            "first_command": estatisticas["primeiro"],
+            "last_command": estatisticas["ultimo"]
         }
 
 
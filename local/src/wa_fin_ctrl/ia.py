@@ -3,18 +3,120 @@
 # Módulo de funções de inteligência artificial para análise de comprovantes
 import os
 import re
-from openai import OpenAI
-from .helper import convert_to_brazilian_format
+import json
+import time
+import base64
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from threading import Lock
+from .helper import convert_to_brazilian_format, calcular_hash_arquivo, anexar_linhas_jsonl
+from .cache_ia import CacheIA, obter_cache_ia
+from .jobs import verificar_cancelamento
 from .env import *
 
+cliente_openai_lock = Lock()
+
+# Cliente OpenAI compartilhado pelo processo (reaproveita o pool de conexões HTTP)
+_cliente_openai = None
+
+# Modelos e versões dos templates de prompt: alterar a versão invalida as respostas em cache
+MODELO_TEXTO = "gpt-3.5-turbo"
+MODELO_IMAGEM = "gpt-4o-mini"
+VERSOES_PROMPT = {'valor': 1, 'descricao': 1, 'classificacao': 1, 'comprovante': 1, 'valor_imagem': 1}
+
+def chave_cache_ia(funcao, ocr_text, hash_imagem=None):
+    """Chave do cache de respostas: função, modelo, versão do prompt, hash do texto OCR (e da imagem)."""
+    modelo = MODELO_IMAGEM if funcao == 'valor_imagem' else MODELO_TEXTO
+    hash_texto = hashlib.sha256((ocr_text or "").encode('utf-8')).hexdigest()
+    # Respostas de um endpoint alternativo (ex.: stand-in offline) não se misturam às do OpenAI
+    extras = (ATTR_FIN_OPENAI_BASE_URL,) if ATTR_FIN_OPENAI_BASE_URL else ()
+    return CacheIA.gerar_chave(funcao, modelo, VERSOES_PROMPT[funcao], hash_texto, hash_imagem, *extras)
+
+def consultar_cache_ia(chave, funcao):
+    """Consulta o cache persistente antes de ir à rede; falhas no cache não interrompem o processamento."""
+    try:
+        return obter_cache_ia().obter(chave, funcao)
+    except Exception as e:
+        print(f"⚠️  Cache de IA indisponível: {e}")
+        return None
+
+def registrar_cache_ia(chave, funcao, resultado):
+    """Grava no cache persistente o resultado de uma resposta bem-sucedida da IA."""
+    try:
+        obter_cache_ia().gravar(chave, funcao, resultado)
+    except Exception as e:
+        print(f"⚠️  Cache de IA indisponível: {e}")
+
+def chave_api_ia():
+    """Chave da API; com um endpoint alternativo configurado (OPENAI_BASE_URL) a chave é opcional."""
+    return ATTR_FIN_OPENAI_API_KEY or ("offline" if ATTR_FIN_OPENAI_BASE_URL else None)
+
+def chave_requisicao_ia(parametros):
+    """Identifica uma requisição pelo modelo, mensagens e formato de resposta (chave das fixtures gravadas)."""
+    relevante = {k: parametros.get(k) for k in ('model', 'messages', 'response_format')}
+    return hashlib.sha256(json.dumps(relevante, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def gravar_fixture_ia(parametros, response):
+    """Com ATTR_FIN_IA_GRAVAR_FIXTURES=1, anexa a resposta recebida ao arquivo de fixtures do stand-in."""
+    if not ATTR_FIN_IA_GRAVAR_FIXTURES:
+        return
+    try:
+        anexar_linhas_jsonl(ATTR_FIN_ARQ_FIXTURES_IA, [{
+            'chave': chave_requisicao_ia(parametros),
+            'model': parametros.get('model'),
+            'conteudo': response.choices[0].message.content
+        }])
+    except Exception as e:
+        print(f"⚠️  Falha ao gravar fixture de IA: {e}")
+
+def _chamar_ia(parametros):
+    """Executa uma chamada síncrona à IA com o cliente compartilhado, gravando a fixture se habilitado."""
+    response = obter_cliente_openai().chat.completions.create(**parametros)
+    gravar_fixture_ia(parametros, response)
+    return response
+
+def obter_cliente_openai():
+    """Retorna o cliente OpenAI síncrono compartilhado, criado na primeira chamada."""
+    global _cliente_openai
+    with cliente_openai_lock:
+        if _cliente_openai is None:
+            from openai import OpenAI
+            _cliente_openai = OpenAI(api_key=chave_api_ia(), base_url=ATTR_FIN_OPENAI_BASE_URL)
+        return _cliente_openai
+
+class LimitadorTaxa:
+    """Token bucket assíncrono: repõe `por_minuto` fichas por minuto e cada requisição consome uma."""
+
+    def __init__(self, por_minuto, capacidade=None):
+        self.taxa = max(por_minuto, 1) / 60.0
+        self.capacidade = capacidade or max(1, int(self.taxa))
+        self.fichas = float(self.capacidade)
+        self.ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def adquirir(self):
+        async with self._lock:
+            while True:
+                agora = time.monotonic()
+                self.fichas = min(self.capacidade, self.fichas + (agora - self.ultimo) * self.taxa)
+                self.ultimo = agora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return
+                await asyncio.sleep((1 - self.fichas) / self.taxa)
+
 def extract_total_value_with_chatgpt(ocr_text):
     try:
-        api_key = ATTR_FIN_OPENAI_API_KEY
+        api_key = chave_api_ia()
         if not api_key:
             return ""
         if not ocr_text or ocr_text in ["Arquivo não encontrado", "Erro ao carregar imagem", "Nenhum texto detectado"]:
             return ""
-        client = OpenAI(api_key=api_key)
+        chave = chave_cache_ia('valor', ocr_text)
+        em_cache = consultar_cache_ia(chave, 'valor')
+        if em_cache is not None:
+            return em_cache
         prompt = f"""
         Analise o seguinte texto extraído de um comprovante financeiro e identifique APENAS o valor total da transação.
         Texto: {ocr_text}
@@ -26,33 +128,38 @@ def extract_total_value_with_chatgpt(ocr_text):
         - Não retorne explicações, apenas o número
         Valor total:
         """
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        response = _chamar_ia(dict(
+            model=MODELO_TEXTO,
             messages=[
                 {"role": "system", "content": "Você é um especialista em análise de comprovantes financeiros. Extraia apenas o valor total das transações."},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=50,
             temperature=0.1
-        )
+        ))
         valor = response.choices[0].message.content.strip()
         valor = re.sub(r'[^\d,.]', '', valor)
         if not valor or valor.upper() == "NENHUM" or len(valor) == 0:
+            registrar_cache_ia(chave, 'valor', "")
             return ""
         from .helper import normalize_value_to_brazilian_format
         valor_brasileiro = normalize_value_to_brazilian_format(valor)
+        registrar_cache_ia(chave, 'valor', valor_brasileiro)
         return valor_brasileiro
     except Exception as e:
         return ""
 
 def generate_payment_description_with_chatgpt(ocr_text):
     try:
-        api_key = ATTR_FIN_OPENAI_API_KEY
+        api_key = chave_api_ia()
         if not api_key:
             return ""
         if not ocr_text or ocr_text in ["Arquivo não encontrado", "Erro ao carregar imagem", "Nenhum texto detectado"]:
             return ""
-        client = OpenAI(api_key=api_key)
+        chave = chave_cache_ia('descricao', ocr_text)
+        em_cache = consultar_cache_ia(chave, 'descricao')
+        if em_cache is not None:
+            return em_cache
         prompt = f"""
         Analise o seguinte texto extraído de um comprovante financeiro e crie uma descrição concisa do pagamento.
         Texto: {ocr_text}
@@ -65,31 +172,35 @@ def generate_payment_description_with_chatgpt(ocr_text):
         - Se não conseguir identificar, retorne \"Pagamento\"
         Descrição:
         """
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        response = _chamar_ia(dict(
+            model=MODELO_TEXTO,
             messages=[
                 {"role": "system", "content": "Você é um especialista em análise de comprovantes financeiros. Crie descrições concisas e úteis para categorizações de gastos."},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=30,
             temperature=0.3
-        )
+        ))
         descricao = response.choices[0].message.content.strip()
         descricao = re.sub(r'["\']', '', descricao)
         if not descricao or len(descricao.strip()) == 0:
-            return "Pagamento"
+            descricao = "Pagamento"
+        registrar_cache_ia(chave, 'descricao', descricao.strip())
         return descricao.strip()
     except Exception as e:
         return "Pagamento"
 
 def classify_transaction_type_with_chatgpt(ocr_text):
     try:
-        api_key = ATTR_FIN_OPENAI_API_KEY
+        api_key = chave_api_ia()
         if not api_key:
             return ""
         if not ocr_text or ocr_text in ["Arquivo não encontrado", "Erro ao carregar imagem", "Nenhum texto detectado"]:
             return ""
-        client = OpenAI(api_key=api_key)
+        chave = chave_cache_ia('classificacao', ocr_text)
+        em_cache = consultar_cache_ia(chave, 'classificacao')
+        if em_cache is not None:
+            return em_cache
         prompt = f"""
         Analise o seguinte texto extraído de um comprovante financeiro e classifique o tipo de transação.
         Texto: {ocr_text}
@@ -100,28 +211,283 @@ def classify_transaction_type_with_chatgpt(ocr_text):
         - Não retorne explicações, apenas a classificação
         Classificação:
         """
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        response = _chamar_ia(dict(
+            model=MODELO_TEXTO,
             messages=[
                 {"role": "system", "content": "Você é um especialista em análise de comprovantes financeiros. Classifique transações como Transferência ou Pagamento."},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=10,
             temperature=0.1
-        )
+        ))
         classificacao = response.choices[0].message.content.strip()
         classificacao = re.sub(r'["\']', '', classificacao)
         if "transferência" in classificacao.lower():
-            return "Transferência"
+            classificacao = "Transferência"
         elif "pagamento" in classificacao.lower():
-            return "Pagamento"
+            classificacao = "Pagamento"
+        elif any(palavra in ocr_text.lower() for palavra in ["pix", "transferência", "ted", "doc"]):
+            classificacao = "Transferência"
         else:
-            if any(palavra in ocr_text.lower() for palavra in ["pix", "transferência", "ted", "doc"]):
-                return "Transferência"
-            else:
-                return "Pagamento"
+            classificacao = "Pagamento"
+        registrar_cache_ia(chave, 'classificacao', classificacao)
+        return classificacao
     except Exception as e:
         if any(palavra in ocr_text.lower() for palavra in ["pix", "transferência", "ted", "doc"]):
             return "Transferência"
         else:
             return "Pagamento"
+
+def _classificar_por_palavras_chave(ocr_text):
+    """Fallback de classificação baseado no conteúdo do texto OCR."""
+    if any(palavra in (ocr_text or "").lower() for palavra in ["pix", "transferência", "ted", "doc"]):
+        return "Transferência"
+    return "Pagamento"
+
+def _validar_dados_comprovante(dados, ocr_text):
+    """Valida o objeto JSON retornado pela IA aplicando os mesmos fallbacks das funções por campo."""
+    if not isinstance(dados, dict):
+        dados = {}
+    # Valor: apenas dígitos e separadores, no formato brasileiro; vazio se não identificado
+    valor = re.sub(r'[^\d,.]', '', str(dados.get('valor') or ''))
+    if valor:
+        from .helper import normalize_value_to_brazilian_format
+        valor = normalize_value_to_brazilian_format(valor)
+    # Descrição: sem aspas; "Pagamento" se vazia
+    descricao = re.sub(r'["\']', '', str(dados.get('descricao') or '')).strip() or "Pagamento"
+    # Classificação: apenas "Transferência" ou "Pagamento"
+    classificacao = str(dados.get('classificacao') or '').lower()
+    if "transfer" in classificacao:
+        classificacao = "Transferência"
+    elif "pagamento" in classificacao:
+        classificacao = "Pagamento"
+    else:
+        classificacao = _classificar_por_palavras_chave(ocr_text)
+    return {'valor': valor, 'descricao': descricao, 'classificacao': classificacao}
+
+def _texto_ocr_valido(ocr_text):
+    return bool(ocr_text) and ocr_text not in ["Arquivo não encontrado", "Erro ao carregar imagem", "Nenhum texto detectado"]
+
+def _parametros_dados_comprovante(ocr_text):
+    """Monta a requisição de extração estruturada (valor, descrição e classificação)."""
+    prompt = f"""
+    Analise o seguinte texto extraído de um comprovante financeiro.
+    Texto: {ocr_text}
+    Retorne um objeto JSON com exatamente estas chaves:
+    - "valor": valor total da transação principal, apenas o número (ex: "29.90" ou "1533,27"), sem "R$"; use null se não conseguir identificar
+    - "descricao": descrição de 3-5 palavras no formato "Tipo - Estabelecimento" (ex: "Compra - Padaria Bonanza", "Medicamentos - Drogaria", "Recarga celular"); use "Pagamento" se não conseguir identificar
+    - "classificacao": "Transferência" para PIX, TED, DOC ou transferência entre contas; "Pagamento" para débito, crédito ou compra direta em estabelecimento comercial
+    """
+    return {
+        'model': MODELO_TEXTO,
+        'messages': [
+            {"role": "system", "content": "Você é um especialista em análise de comprovantes financeiros. Responda apenas com JSON válido."},
+            {"role": "user", "content": prompt}
+        ],
+        'response_format': {"type": "json_object"},
+        'max_tokens': 100,
+        'temperature': 0.1
+    }
+
+def _interpretar_dados_comprovante(response, ocr_text, chave):
+    """Valida a resposta da extração estruturada e grava no cache quando ela veio em JSON."""
+    try:
+        dados = _validar_dados_comprovante(json.loads(response.choices[0].message.content), ocr_text)
+    except ValueError:
+        # Resposta fora do formato JSON: usa os fallbacks por campo e não grava no cache
+        return _validar_dados_comprovante({}, ocr_text)
+    registrar_cache_ia(chave, 'comprovante', dados)
+    return dados
+
+def _dados_comprovante_em_erro(ocr_text):
+    return {'valor': "", 'descricao': "Pagamento", 'classificacao': _classificar_por_palavras_chave(ocr_text)}
+
+def extrair_dados_comprovante_com_chatgpt(ocr_text):
+    """Extrai valor, descrição e classificação do comprovante com uma única chamada à IA.
+
+    Retorna {'valor', 'descricao', 'classificacao'} já validado. Sem chave ou sem texto útil
+    os três campos vêm vazios; em erro de API valem os fallbacks das funções individuais."""
+    try:
+        if not chave_api_ia() or not _texto_ocr_valido(ocr_text):
+            return {'valor': "", 'descricao': "", 'classificacao': ""}
+        chave = chave_cache_ia('comprovante', ocr_text)
+        em_cache = consultar_cache_ia(chave, 'comprovante')
+        if em_cache is not None:
+            return em_cache
+        response = _chamar_ia(_parametros_dados_comprovante(ocr_text))
+        return _interpretar_dados_comprovante(response, ocr_text, chave)
+    except Exception as e:
+        return _dados_comprovante_em_erro(ocr_text)
+
+def _parametros_valor_imagem(image_path, ocr_text):
+    """Monta a requisição multimodal (imagem + texto OCR) para identificar o valor."""
+    # Codifica a imagem em base64
+    with open(image_path, "rb") as image_file:
+        encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
+    
+    # Prompt para o ChatGPT com a imagem
+    prompt = f"""
+    Analise esta imagem de comprovante financeiro e o texto extraído via OCR.
+    
+    Texto OCR: {ocr_text}
+    
+    Instruções:
+    1. Identifique APENAS o valor total da transação
+    2. Se houver múltiplos valores, retorne o valor da transação principal
+    3. Se não conseguir identificar um valor, retorne "NENHUM"
+    4. Não inclua "R$" ou outros símbolos
+    5. Não retorne explicações, apenas o número
+    
+    Valor total:
+    """
+    return {
+        'model': MODELO_IMAGEM,  # Usa modelo que suporta imagens
+        'messages': [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{encoded_image}"
+                        }
+                    }
+                ]
+            }
+        ],
+        'max_tokens': 50,
+        'temperature': 0.1
+    }
+
+def _interpretar_valor_imagem(response, chave):
+    """Extrai o valor da resposta multimodal e grava o resultado no cache."""
+    # Extrai a resposta
+    valor = response.choices[0].message.content.strip()
+    
+    # Limpa a resposta removendo caracteres indesejados
+    valor = re.sub(r'[^\d,.]', '', valor)
+    
+    # Se não encontrou valor válido, retorna vazio e classifica como desconhecido
+    if not valor or valor.upper() == "NENHUM" or len(valor) == 0:
+        registrar_cache_ia(chave, 'valor_imagem', ["", "desconhecido"])
+        return "", "desconhecido"
+    
+    # Converte para formato brasileiro padronizado
+    from .helper import normalize_value_to_brazilian_format
+    valor_brasileiro = normalize_value_to_brazilian_format(valor)
+    
+    registrar_cache_ia(chave, 'valor_imagem', [valor_brasileiro, "Pagamento"])
+    return valor_brasileiro, "Pagamento"  # Assume como pagamento se encontrou valor
+
+def process_image_with_ai_for_value(image_path, ocr_text):
+    """Processa uma imagem com IA para identificar valor quando OCR não conseguiu"""
+    try:
+        # Verifica se a chave da API está disponível e se há texto para processar
+        if not chave_api_ia() or not _texto_ocr_valido(ocr_text):
+            return "", "desconhecido"
+        
+        # Consulta o cache de IA pelo hash do conteúdo da imagem
+        chave = chave_cache_ia('valor_imagem', ocr_text, calcular_hash_arquivo(image_path))
+        em_cache = consultar_cache_ia(chave, 'valor_imagem')
+        if em_cache is not None:
+            return tuple(em_cache)
+        
+        response = _chamar_ia(_parametros_valor_imagem(image_path, ocr_text))
+        return _interpretar_valor_imagem(response, chave)
+        
+    except Exception as e:
+        print(f"Erro ao processar imagem com IA: {str(e)}")
+        return "", "desconhecido"
+
+async def _chamar_ia_async(cliente, semaforo, limitador, parametros):
+    """Executa uma chamada à IA respeitando o limite de requisições simultâneas e a taxa."""
+    async with semaforo:
+        # Requisições ainda na fila do semáforo não chegam a ser enviadas se o job foi cancelado
+        verificar_cancelamento()
+        await limitador.adquirir()
+        response = await cliente.chat.completions.create(**parametros)
+    gravar_fixture_ia(parametros, response)
+    return response
+
+async def _dados_comprovante_async(cliente, semaforo, limitador, ocr_text):
+    if not _texto_ocr_valido(ocr_text):
+        return {'valor': "", 'descricao': "", 'classificacao': ""}
+    chave = chave_cache_ia('comprovante', ocr_text)
+    em_cache = consultar_cache_ia(chave, 'comprovante')
+    if em_cache is not None:
+        return em_cache
+    try:
+        response = await _chamar_ia_async(cliente, semaforo, limitador, _parametros_dados_comprovante(ocr_text))
+        return _interpretar_dados_comprovante(response, ocr_text, chave)
+    except Exception as e:
+        return _dados_comprovante_em_erro(ocr_text)
+
+async def _valor_imagem_async(cliente, semaforo, limitador, image_path, ocr_text):
+    if not _texto_ocr_valido(ocr_text):
+        return "", "desconhecido"
+    try:
+        chave = chave_cache_ia('valor_imagem', ocr_text, calcular_hash_arquivo(image_path))
+        em_cache = consultar_cache_ia(chave, 'valor_imagem')
+        if em_cache is not None:
+            return tuple(em_cache)
+        response = await _chamar_ia_async(cliente, semaforo, limitador, _parametros_valor_imagem(image_path, ocr_text))
+        return _interpretar_valor_imagem(response, chave)
+    except Exception as e:
+        print(f"Erro ao processar imagem com IA: {str(e)}")
+        return "", "desconhecido"
+
+async def _executar_lote_ia(tarefa, itens, max_concorrencia, progresso=None):
+    """Executa `tarefa` para cada item com um único cliente assíncrono; mantém a ordem dos itens.
+
+    `progresso` (eventos.Etapa) é avançado a cada resposta recebida."""
+    semaforo = asyncio.Semaphore(max(1, max_concorrencia))
+    limitador = LimitadorTaxa(ATTR_FIN_IA_REQ_POR_MINUTO)
+
+    async def executar_item(cliente, item):
+        resultado = await tarefa(cliente, semaforo, limitador, *item)
+        if progresso:
+            progresso.avancar()
+        return resultado
+
+    from openai import AsyncOpenAI
+    async with AsyncOpenAI(api_key=chave_api_ia(), base_url=ATTR_FIN_OPENAI_BASE_URL) as cliente:
+        return await asyncio.gather(*(executar_item(cliente, item) for item in itens))
+
+def _executar_corrotina(corrotina):
+    """Executa a corrotina até o fim, inclusive quando chamada de dentro de um event loop (API)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(corrotina)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, corrotina).result()
+
+def extrair_dados_comprovantes_em_lote(textos_ocr, max_concorrencia=None, progresso=None):
+    """Versão em lote de extrair_dados_comprovante_com_chatgpt.
+
+    Recebe uma lista de textos OCR e executa até `max_concorrencia` requisições simultâneas
+    (padrão: ATTR_FIN_IA_CONCORRENCIA) sob o limitador de taxa, consultando o cache antes.
+    Retorna os dicionários na mesma ordem dos textos."""
+    itens = [(ocr_text,) for ocr_text in textos_ocr]
+    if not chave_api_ia():
+        return [{'valor': "", 'descricao': "", 'classificacao': ""} for _ in itens]
+    if not itens:
+        return []
+    concorrencia = ATTR_FIN_IA_CONCORRENCIA if max_concorrencia is None else max_concorrencia
+    return _executar_corrotina(_executar_lote_ia(_dados_comprovante_async, itens, concorrencia, progresso))
+
+def processar_imagens_com_ia_em_lote(itens, max_concorrencia=None, progresso=None):
+    """Versão em lote de process_image_with_ai_for_value para uma lista de (image_path, ocr_text).
+
+    Retorna as tuplas (valor, classificacao) na mesma ordem dos itens."""
+    itens = list(itens)
+    if not chave_api_ia():
+        return [("", "desconhecido") for _ in itens]
+    if not itens:
+        return []
+    concorrencia = ATTR_FIN_IA_CONCORRENCIA if max_concorrencia is None else max_concorrencia
+    return _executar_corrotina(_executar_lote_ia(_valor_imagem_async, itens, concorrencia, progresso))
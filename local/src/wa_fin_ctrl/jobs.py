@@ -0,0 +1,149 @@
+# jobs.py
+# Caminho relativo ao projeto: jobs.py
+# Fila de jobs em segundo plano da API: executa o pipeline fora do event loop, com status e cancelamento
+import uuid
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+# Jobs concluídos mantidos em memória para consulta em GET /jobs/{id}
+MAX_JOBS_HISTORICO = 200
+
+STATUS_PENDENTE = 'pendente'
+STATUS_EXECUTANDO = 'executando'
+STATUS_CONCLUIDO = 'concluido'
+STATUS_FALHOU = 'falhou'
+STATUS_CANCELADO = 'cancelado'
+STATUS_FINAIS = (STATUS_CONCLUIDO, STATUS_FALHOU, STATUS_CANCELADO)
+
+_job_atual = threading.local()
+
+
+class JobCancelado(BaseException):
+    """Levantada em um ponto de verificação quando o job em execução teve o cancelamento solicitado.
+
+    Deriva de BaseException (como KeyboardInterrupt) para atravessar os `except Exception` do
+    pipeline, que tratariam o cancelamento como uma falha comum e seguiriam em frente."""
+
+
+def verificar_cancelamento():
+    """Ponto de verificação cooperativo: interrompe o job da thread atual se foi cancelado.
+
+    Fora de um job (CLI, testes) não faz nada."""
+    job = getattr(_job_atual, 'job', None)
+    if job is not None and job.cancelamento.is_set():
+        raise JobCancelado(f"Job {job.id} cancelado")
+
+
+class Job:
+    """Um pedido à API executado em segundo plano"""
+
+    def __init__(self, tipo: str, parametros: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.parametros = parametros
+        self.status = STATUS_PENDENTE
+        self.criado_em = datetime.now().isoformat()
+        self.iniciado_em: Optional[str] = None
+        self.concluido_em: Optional[str] = None
+        self.resultado: Any = None
+        self.erro: Optional[str] = None
+        self.cancelamento = threading.Event()
+        self.future = None
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.tipo,
+            "status": self.status,
+            "parameters": self.parametros,
+            "created_at": self.criado_em,
+            "started_at": self.iniciado_em,
+            "finished_at": self.concluido_em,
+            "cancel_requested": self.cancelamento.is_set(),
+            "result": self.resultado,
+            "error": self.erro,
+        }
+
+
+class FilaJobs:
+    """Executa os jobs um de cada vez em uma thread dedicada.
+
+    Um único worker serializa as execuções do pipeline, que compartilham planilhas, OCR e relatórios."""
+
+    def __init__(self, workers: int = 1):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wa-fin-job')
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submeter(self, tipo: str, funcao: Callable[[], Any], parametros: Optional[Dict[str, Any]] = None,
+                 ao_concluir: Optional[Callable[[Job], None]] = None) -> Job:
+        """Enfileira `funcao` e retorna o job imediatamente.
+
+        Um retorno False da função marca o job como falho; `ao_concluir` é chamado na thread do
+        worker ao final, qualquer que seja o status."""
+        job = Job(tipo, parametros or {})
+        with self._lock:
+            self._jobs[job.id] = job
+            # Descarta os jobs finalizados mais antigos
+            while len(self._jobs) > MAX_JOBS_HISTORICO:
+                antigo = next((j for j in self._jobs.values() if j.status in STATUS_FINAIS), None)
+                if antigo is None:
+                    break
+                del self._jobs[antigo.id]
+        job.future = self._executor.submit(self._executar, job, funcao, ao_concluir)
+        return job
+
+    def _executar(self, job: Job, funcao: Callable[[], Any], ao_concluir: Optional[Callable[[Job], None]]):
+        if job.cancelamento.is_set():
+            job.status = STATUS_CANCELADO
+            job.concluido_em = datetime.now().isoformat()
+            return
+        job.status = STATUS_EXECUTANDO
+        job.iniciado_em = datetime.now().isoformat()
+        _job_atual.job = job
+        try:
+            job.resultado = funcao()
+            if job.resultado is False:
+                job.status = STATUS_FALHOU
+                job.erro = "função retornou False (detalhes no log do servidor)"
+            else:
+                job.status = STATUS_CONCLUIDO
+        except JobCancelado:
+            job.status = STATUS_CANCELADO
+        except Exception as e:
+            job.status = STATUS_FALHOU
+            job.erro = str(e)
+            traceback.print_exc()
+        finally:
+            _job_atual.job = None
+            job.concluido_em = datetime.now().isoformat()
+        print(f"📋 Job {job.tipo} {job.id}: {job.status}")
+        if ao_concluir:
+            try:
+                ao_concluir(job)
+            except Exception as e:
+                print(f"⚠️  Erro ao notificar conclusão do job {job.id}: {e}")
+
+    def obter(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def listar(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancelar(self, job_id: str) -> Optional[Job]:
+        """Cancela um job: se ainda está na fila, não chega a executar; se está em execução, para no
+        próximo ponto de verificação do pipeline. Retorna None se o job não existe."""
+        job = self.obter(job_id)
+        if job is None or job.status in STATUS_FINAIS:
+            return job
+        job.cancelamento.set()
+        if job.future is not None and job.future.cancel():
+            job.status = STATUS_CANCELADO
+            job.concluido_em = datetime.now().isoformat()
+        return job
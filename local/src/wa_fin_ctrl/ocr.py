@@ -3,58 +3,154 @@
 # Módulo de processamento OCR para imagens e PDFs com suporte a extração incremental
 import os
 import re
-import cv2
-import pytesseract
-import numpy as np
 import xml.etree.ElementTree as ET
 from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
 from .env import *
+from .helper import calcular_hash_arquivo, anexar_linhas_jsonl, ler_linhas_jsonl, travar_arquivo, contexto_processos
+from .jobs import JobCancelado, verificar_cancelamento
 
 ocr_xml_lock = Lock()
 
-def process_image_ocr(image_path):
-    """Processa uma imagem ou PDF e extrai texto usando OCR, consultando o XML incremental antes."""
+# Sufixo do journal append-only que acompanha o XML de OCR (ex.: ocr/extract.jsonl)
+SUFIXO_JOURNAL_OCR = '.jsonl'
+
+# Estado em memória por XML de OCR:
+# {arq_xml: {'mtime_xml', 'offset_journal', 'entradas', 'hash_arquivo', 'texto_hash'}}
+_indices_ocr = {}
+
+def _caminho_journal(arq_xml):
+    """Retorna o caminho do journal append-only associado ao XML de OCR."""
+    return os.path.splitext(arq_xml)[0] + SUFIXO_JOURNAL_OCR
+
+def _novo_estado_ocr(mtime_xml):
+    return {'mtime_xml': mtime_xml, 'offset_journal': 0, 'entradas': {}, 'hash_arquivo': {}, 'texto_hash': {}}
+
+def _incluir_registro(estado, arquivo, texto, hash_conteudo=None):
+    """Inclui um registro no índice; a primeira ocorrência de cada arquivo e de cada hash prevalece."""
+    estado['entradas'].setdefault(arquivo, texto or "")
+    if hash_conteudo:
+        estado['hash_arquivo'].setdefault(arquivo, hash_conteudo)
+        estado['texto_hash'].setdefault(hash_conteudo, texto or "")
+
+def _ler_xml_ocr(estado, arq_xml):
+    """Lê o snapshot XML de OCR para o índice (arquivo -> texto e hash de conteúdo -> texto)."""
+    if not os.path.exists(arq_xml):
+        return
     try:
-        arq_xml = ATTR_FIN_ARQ_OCR_XML
-        # 1. Consulta o XML incremental
-        if os.path.exists(arq_xml):
-            try:
-                tree = ET.parse(arq_xml)
-                root = tree.getroot()
-                for entry in root.findall('entry'):
-                    if entry.get('arquivo') == os.path.basename(image_path):
-                        return entry.text or ""
-            except Exception:
-                pass  # Se falhar, ignora e tenta extrair normalmente
-        # 2. Resolve caminho real
-        if os.path.exists(image_path):
-            pass
-        elif not image_path.startswith((f'{ATTR_FIN_DIR_IMGS}/', f'{ATTR_FIN_DIR_INPUT}/')):
-            input_path = os.path.join(ATTR_FIN_DIR_INPUT, image_path)
-            if os.path.exists(input_path):
-                image_path = input_path
-            else:
-                imgs_path = os.path.join(ATTR_FIN_DIR_IMGS, image_path)
-                if os.path.exists(imgs_path):
-                    image_path = imgs_path
-                else:
-                    return "Arquivo não encontrado"
-        elif not os.path.exists(image_path):
-            return "Arquivo não encontrado"
-        # 3. Se for PDF, aplica pdfplumber e fallback com OCR via pdf2image
-        if image_path.lower().endswith('.pdf'):
+        root = ET.parse(arq_xml).getroot()
+        for entry in root.findall('entry'):
+            # Mantém a primeira ocorrência, como na busca linear original
+            _incluir_registro(estado, entry.get('arquivo'), entry.text, entry.get('hash'))
+    except Exception:
+        pass  # XML ilegível: trata como vazio e deixa o OCR extrair novamente
+
+def _carregar_indice_ocr(arq_xml=ATTR_FIN_ARQ_OCR_XML):
+    """Carrega (uma vez por processo) o índice do XML de OCR e do seu journal e retorna o estado.
+
+    O XML só é relido quando foi alterado por outro processo (mtime diferente) ou quando o
+    journal foi compactado; novas linhas do journal são lidas a partir do último offset."""
+    mtime_xml = os.path.getmtime(arq_xml) if os.path.exists(arq_xml) else None
+    arq_journal = _caminho_journal(arq_xml)
+    tamanho_journal = os.path.getsize(arq_journal) if os.path.exists(arq_journal) else 0
+    estado = _indices_ocr.get(arq_xml)
+    if estado is None or estado['mtime_xml'] != mtime_xml or tamanho_journal < estado['offset_journal']:
+        estado = _novo_estado_ocr(mtime_xml)
+        _ler_xml_ocr(estado, arq_xml)
+        _indices_ocr[arq_xml] = estado
+    if tamanho_journal > estado['offset_journal']:
+        registros, estado['offset_journal'] = ler_linhas_jsonl(arq_journal, estado['offset_journal'])
+        for registro in registros:
+            _incluir_registro(estado, registro.get('arquivo'), registro.get('texto'), registro.get('hash'))
+    return estado
+
+def consultar_ocr_registrado(arquivo, arq_xml=ATTR_FIN_ARQ_OCR_XML, hash_conteudo=None):
+    """Retorna o texto OCR já registrado para o arquivo (nome base) ou, se informado, para o
+    hash do seu conteúdo; None se não existir."""
+    with ocr_xml_lock:
+        estado = _carregar_indice_ocr(arq_xml)
+        texto = estado['entradas'].get(os.path.basename(arquivo))
+        if texto is None and hash_conteudo:
+            texto = estado['texto_hash'].get(hash_conteudo)
+        return texto
+
+def carregar_mapa_ocr(arq_xml=ATTR_FIN_ARQ_OCR_XML):
+    """Retorna uma cópia do mapeamento arquivo -> texto OCR registrado (XML + journal)."""
+    with ocr_xml_lock:
+        return dict(_carregar_indice_ocr(arq_xml)['entradas'])
+
+def compactar_ocr(arq_xml=ATTR_FIN_ARQ_OCR_XML):
+    """Consolida o journal no snapshot XML e trunca o journal. Retorna o total de registros.
+
+    Tudo é feito sob a trava do journal (travar_arquivo), a mesma usada por anexar_linhas_jsonl:
+    nenhum outro processo acrescenta linhas entre a leitura do journal e o seu truncamento."""
+    with ocr_xml_lock:
+        arq_journal = _caminho_journal(arq_xml)
+        if not os.path.exists(arq_journal) or os.path.getsize(arq_journal) == 0:
+            return len(_carregar_indice_ocr(arq_xml)['entradas'])
+        fd = os.open(arq_journal, os.O_RDWR)
+        try:
+            with travar_arquivo(fd):
+                estado = _carregar_indice_ocr(arq_xml)
+                root = ET.Element('ocr')
+                for nome, conteudo in estado['entradas'].items():
+                    atributos = {'arquivo': nome}
+                    if nome in estado['hash_arquivo']:
+                        atributos['hash'] = estado['hash_arquivo'][nome]
+                    entry = ET.SubElement(root, 'entry', atributos)
+                    entry.text = conteudo or None
+                # Grava em arquivo temporário e substitui atomicamente para não corromper o snapshot
+                arq_tmp = f"{arq_xml}.tmp"
+                ET.ElementTree(root).write(arq_tmp, encoding='utf-8', xml_declaration=True)
+                os.replace(arq_tmp, arq_xml)
+                os.ftruncate(fd, 0)
+                estado['mtime_xml'] = os.path.getmtime(arq_xml)
+                estado['offset_journal'] = 0
+                return len(estado['entradas'])
+        finally:
+            os.close(fd)
+
+def _resolver_caminho_ocr(image_path):
+    """Resolve o caminho real do anexo (como informado, em input/ ou em imgs/) ou None se não existir."""
+    if os.path.exists(image_path):
+        return image_path
+    if image_path.startswith((f'{ATTR_FIN_DIR_IMGS}/', f'{ATTR_FIN_DIR_INPUT}/')):
+        return None
+    for diretorio in (ATTR_FIN_DIR_INPUT, ATTR_FIN_DIR_IMGS):
+        caminho = os.path.join(diretorio, image_path)
+        if os.path.exists(caminho):
+            return caminho
+    return None
+
+def extrair_texto_ocr(image_path):
+    """Extrai o texto de uma imagem ou PDF sem consultar nem gravar o registro de OCR.
+
+    Não tem efeitos no registro de OCR, por isso pode rodar em processos filhos; a única escrita
+    é a cópia em JPG de um PDF, gravada em imgs/ por _converter_pdf_para_jpg (nome por PDF, sem
+    disputa entre processos). Retorna a tupla (texto, erro), em que erro é a mensagem de falha
+    ou None quando a extração foi concluída."""
+    try:
+        # 1. Resolve caminho real
+        caminho = _resolver_caminho_ocr(image_path)
+        if caminho is None:
+            return "", "Arquivo não encontrado"
+        # OpenCV e Tesseract são carregados só quando há extração (consultas ao registro não os usam)
+        import cv2
+        import pytesseract
+        # 2. Se for PDF, aplica pdfplumber e fallback com OCR via pdf2image
+        if caminho.lower().endswith('.pdf'):
             try:
                 import pdfplumber
                 from pdf2image import convert_from_path
             except ImportError:
-                return ("Erro: Suporte a PDF não disponível. "
-                        "Adicione as bibliotecas 'pdfplumber' e 'pdf2image' no Dockerfile para processar PDFs.")
+                return "", ("Erro: Suporte a PDF não disponível. "
+                            "Adicione as bibliotecas 'pdfplumber' e 'pdf2image' no Dockerfile para processar PDFs.")
             
             texto_pdf = ""
 
             # Método 1: pdfplumber
             try:
-                with pdfplumber.open(image_path) as pdf:
+                with pdfplumber.open(caminho) as pdf:
                     for page in pdf.pages:
                         texto_pagina = page.extract_text() or ''
                         texto_pdf += texto_pagina
@@ -68,7 +164,8 @@ def process_image_ocr(image_path):
             # Método 2: OCR com pdf2image se pdfplumber falhar ou retornar vazio
             if not texto_pdf:
                 try:
-                    imagens = convert_from_path(image_path)
+                    import numpy as np
+                    imagens = convert_from_path(caminho)
                     texto_ocr = []
                     for img in imagens:
                         img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
@@ -80,46 +177,160 @@ def process_image_ocr(image_path):
                     texto_pdf = re.sub(r'\n+', ' ', texto_pdf)
                     texto_pdf = re.sub(r'\s+', ' ', texto_pdf)
                 except Exception as e:
-                    return f"Erro ao processar PDF: {str(e)}"
+                    return "", f"Erro ao processar PDF: {str(e)}"
 
             # Converter PDF para JPG se ainda não foi convertido
-            _converter_pdf_para_jpg(image_path)
-
-            registrar_ocr_xml(os.path.basename(image_path), texto_pdf)
-            return texto_pdf if texto_pdf else "Nenhum texto detectado"
-        # 4. Caso contrário, processa como imagem
-        img = cv2.imread(image_path)
+            _converter_pdf_para_jpg(caminho)
+            return texto_pdf, None
+        # 3. Caso contrário, processa como imagem
+        img = cv2.imread(caminho)
         if img is None:
-            return "Erro ao carregar imagem"
+            return "", "Erro ao carregar imagem"
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         text = pytesseract.image_to_string(thresh, lang='eng')
         text = re.sub(r'\n+', ' ', text).strip()
         text = re.sub(r'\s+', ' ', text)
-        registrar_ocr_xml(os.path.basename(image_path), text)
-        return text if text else "Nenhum texto detectado"
+        return text, None
+    except Exception as e:
+        return "", f"Erro no OCR: {str(e)}"
+
+def process_image_ocr(image_path):
+    """Processa uma imagem ou PDF e extrai texto usando OCR, consultando o XML incremental antes.
+
+    A consulta é feita pelo nome do arquivo e, se não houver registro, pelo hash do conteúdo:
+    um anexo renomeado (reexportação, sufixos _1/_2) reaproveita o texto já extraído."""
+    try:
+        # 1. Consulta o índice do XML incremental pelo nome
+        texto_registrado = consultar_ocr_registrado(image_path)
+        if texto_registrado is not None:
+            return texto_registrado
+        # 2. Consulta pelo hash do conteúdo e registra o novo nome como alias
+        caminho = _resolver_caminho_ocr(image_path)
+        hash_conteudo = calcular_hash_arquivo(caminho) if caminho else None
+        texto_registrado = consultar_ocr_registrado(image_path, hash_conteudo=hash_conteudo)
+        if texto_registrado is not None:
+            registrar_ocr_xml(os.path.basename(image_path), texto_registrado, hash_conteudo=hash_conteudo)
+            return texto_registrado
+        # 3. Extrai o texto
+        texto, erro = extrair_texto_ocr(image_path)
+        if erro:
+            return erro
+        registrar_ocr_xml(os.path.basename(image_path), texto, hash_conteudo=hash_conteudo)
+        return texto if texto else "Nenhum texto detectado"
     except Exception as e:
         return f"Erro no OCR: {str(e)}"
 
-def registrar_ocr_xml(arquivo, texto, arq_xml=ATTR_FIN_ARQ_OCR_XML):
-    """Registra extração OCR no arquivo XML incrementalmente, sem sobrescrever entradas existentes."""
+def executar_ocr_em_lote(caminhos, workers=None, progresso=None):
+    """Executa o OCR de vários anexos em paralelo e retorna os textos na mesma ordem de `caminhos`.
+
+    Anexos já registrados (pelo nome ou pelo hash do conteúdo) são respondidos pelo índice;
+    os demais são distribuídos em um ProcessPoolExecutor com até `workers` processos
+    (padrão: ATTR_FIN_OCR_WORKERS) e gravados no journal com um único commit.
+    `progresso` (eventos.Etapa) recebe o total de extrações e cada extração concluída."""
+    caminhos = list(caminhos)
+    novos = []
+    registrados = {}
     with ocr_xml_lock:
-        dir_ocr = os.path.dirname(arq_xml)
-        if dir_ocr and not os.path.exists(dir_ocr):
-            os.makedirs(dir_ocr, exist_ok=True)
-        if os.path.exists(arq_xml):
-            tree = ET.parse(arq_xml)
-            root = tree.getroot()
+        estado = _carregar_indice_ocr()
+        for caminho in caminhos:
+            nome = os.path.basename(caminho)
+            if nome in estado['entradas']:
+                registrados[caminho] = estado['entradas'][nome]
+    # Como em process_image_ocr, o conteúdo só é lido e hasheado quando o nome não está no índice
+    hashes = {}
+    for caminho in caminhos:
+        if caminho not in registrados:
+            resolvido = _resolver_caminho_ocr(caminho)
+            hashes[caminho] = calcular_hash_arquivo(resolvido) if resolvido else None
+    with ocr_xml_lock:
+        estado = _carregar_indice_ocr()
+        for caminho, hash_conteudo in hashes.items():
+            if hash_conteudo in estado['texto_hash']:
+                # Mesmo conteúdo com outro nome: reaproveita e registra o alias
+                registrados[caminho] = estado['texto_hash'][hash_conteudo]
+                novos.append((os.path.basename(caminho), registrados[caminho], hash_conteudo))
+    # Um mesmo conteúdo (ou nome, quando não há hash) é extraído uma única vez
+    pendentes = {}
+    for caminho in caminhos:
+        if caminho not in registrados:
+            pendentes.setdefault(hashes[caminho] or os.path.basename(caminho), caminho)
+    pendentes = list(pendentes.values())
+    if progresso:
+        progresso.definir_total(len(pendentes))
+
+    extraidos = []
+    workers = max(1, int(ATTR_FIN_OCR_WORKERS if workers is None else workers))
+    if workers > 1 and len(pendentes) > 1:
+        print(f"🔍 OCR em paralelo: {len(pendentes)} arquivos com {min(workers, len(pendentes))} processos")
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pendentes)), mp_context=contexto_processos()) as executor:
+                try:
+                    for extraido in executor.map(extrair_texto_ocr, pendentes):
+                        extraidos.append(extraido)
+                        if progresso:
+                            progresso.avancar()
+                        verificar_cancelamento()
+                except JobCancelado:
+                    # Não espera os arquivos que ainda estão na fila do pool
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        except Exception as e:
+            print(f"⚠️  Falha no pool de OCR ({e}); processando sequencialmente")
+            extraidos = []
+    if len(extraidos) != len(pendentes):
+        extraidos = []
+        if progresso:
+            progresso.concluidos = 0
+        for caminho in pendentes:
+            verificar_cancelamento()
+            extraidos.append(extrair_texto_ocr(caminho))
+            if progresso:
+                progresso.avancar()
+
+    resultados = {}
+    for caminho, (texto, erro) in zip(pendentes, extraidos):
+        resultados[hashes[caminho] or os.path.basename(caminho)] = (texto, erro)
+
+    saida = []
+    for caminho in caminhos:
+        if caminho in registrados:
+            saida.append(registrados[caminho])
+            continue
+        texto, erro = resultados[hashes[caminho] or os.path.basename(caminho)]
+        if erro:
+            saida.append(erro)
         else:
-            root = ET.Element('ocr')
-            tree = ET.ElementTree(root)
-        # Não duplica entradas
-        for entry in root.findall('entry'):
-            if entry.get('arquivo') == arquivo:
-                return  # Já existe, não sobrescreve
-        entry = ET.SubElement(root, 'entry', {'arquivo': arquivo})
-        entry.text = texto
-        tree.write(arq_xml, encoding='utf-8', xml_declaration=True)
+            novos.append((os.path.basename(caminho), texto, hashes[caminho]))
+            saida.append(texto if texto else "Nenhum texto detectado")
+    registrar_ocr_lote(novos)
+    return saida
+
+def registrar_ocr_lote(registros, arq_xml=ATTR_FIN_ARQ_OCR_XML):
+    """Registra várias extrações (arquivo, texto[, hash]) no journal com uma única escrita, sem
+    sobrescrever entradas existentes. Retorna o número de registros gravados."""
+    with ocr_xml_lock:
+        indice = _carregar_indice_ocr(arq_xml)['entradas']
+        novos = {}
+        for registro in registros:
+            arquivo, texto = registro[0], registro[1]
+            hash_conteudo = registro[2] if len(registro) > 2 else None
+            # Não duplica entradas (nem no índice nem dentro do próprio lote)
+            if arquivo in indice or arquivo in novos:
+                continue
+            novos[arquivo] = {'arquivo': arquivo, 'texto': texto}
+            if hash_conteudo:
+                novos[arquivo]['hash'] = hash_conteudo
+        if not novos:
+            return 0
+        anexar_linhas_jsonl(_caminho_journal(arq_xml), list(novos.values()))
+        # Incorpora as linhas recém-gravadas (e eventuais linhas de outros processos) ao índice
+        _carregar_indice_ocr(arq_xml)
+    return len(novos)
+
+def registrar_ocr_xml(arquivo, texto, arq_xml=ATTR_FIN_ARQ_OCR_XML, hash_conteudo=None):
+    """Registra extração OCR no journal append-only do XML, sem sobrescrever entradas existentes."""
+    registrar_ocr_lote([(arquivo, texto, hash_conteudo)], arq_xml)
 
 def _converter_pdf_para_jpg(pdf_path):
     """Converte um PDF para JPG mantendo o mesmo nome do arquivo original."""
@@ -2,47 +2,74 @@
 # Caminho relativo ao projeto: reporter.py
 # Módulo de geração de relatórios HTML para prestação de contas
 import os
+import json
+import hashlib
 import pandas as pd
 import base64
-import subprocess
-import xml.etree.ElementTree as ET
 import re
+import time
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from .env import *
-from .template import TemplateRenderer
+from .template import TemplateRenderer, criar_ambiente, digest_templates
+from .ocr import carregar_mapa_ocr
+from .valores import extrair_valor_monetario
+from .helper import converter_serie_para_float, contexto_processos
+from .check import validar_conformidade_ocr
+from .jobs import JobCancelado, verificar_cancelamento
+
+NOMES_MESES = {
+    1: 'Janeiro', 2: 'Fevereiro', 3: 'Marco', 4: 'Abril',
+    5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
+    9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
+}
 
 def _carregar_ocr_map():
-    """Carrega o mapeamento de arquivos para textos OCR do arquivo extract.xml."""
+    """Carrega o mapeamento de arquivos para textos OCR (snapshot extract.xml + journal)."""
     ocr_map = {}
     try:
-        xml_path = os.path.join(ATTR_FIN_DIR_OCR, "extract.xml")
-        if os.path.exists(xml_path):
-            tree = ET.parse(xml_path)
-            root = tree.getroot()
-            for entry in root.findall('entry'):
-                arquivo = entry.get('arquivo', '')
-                texto = entry.text or ''
-                ocr_map[arquivo] = texto
-            print(f"📄 Carregados {len(ocr_map)} registros OCR de {xml_path}")
+        ocr_map = carregar_mapa_ocr(ATTR_FIN_ARQ_OCR_XML)
+        if ocr_map:
+            print(f"📄 Carregados {len(ocr_map)} registros OCR de {ATTR_FIN_ARQ_OCR_XML}")
         else:
-            print(f"⚠️  Arquivo OCR não encontrado: {xml_path}")
+            print(f"⚠️  Nenhum registro OCR encontrado em {ATTR_FIN_ARQ_OCR_XML}")
     except Exception as e:
         print(f"❌ Erro ao carregar OCR: {str(e)}")
     return ocr_map
 
-def _verificar_imagem_jpg_pdf(anexo):
-    """Verifica se existe uma imagem JPG correspondente ao PDF."""
+def _verificar_imagem_jpg_pdf(anexo, imagens=None):
+    """Verifica se existe uma imagem JPG correspondente ao PDF (em `imagens`, se informado, ou no disco)."""
     if not anexo or anexo.lower() == 'nan' or not anexo.lower().endswith('.pdf'):
         return None
     
     nome_base = os.path.splitext(anexo)[0]
+    if imagens is not None:
+        return f"{nome_base}.jpg" if f"{nome_base}.jpg" in imagens else None
     jpg_path = os.path.join(ATTR_FIN_DIR_IMGS, f"{nome_base}.jpg")
     
     if os.path.exists(jpg_path):
         return f"{nome_base}.jpg"
     return None
 
-def _preparar_linha(row, ocr_map, tem_motivo=False):
+class ReportContext:
+    """Dados de uma geração de relatórios, carregados uma única vez e compartilhados por todas as funções.
+
+    Lê o calculo.csv (colunas de texto como str, DATA_DT como datetime e ANO_MES como período mensal),
+    o mapa de OCR e o conjunto de arquivos existentes em imgs/."""
+
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self.df = pd.read_csv(csv_path, dtype=str)
+        self.df['DATA_DT'] = pd.to_datetime(self.df['DATA'], format='%d/%m/%Y', errors='coerce')
+        self.df['ANO_MES'] = self.df['DATA_DT'].dt.to_period('M')
+        self.ocr_map = _carregar_ocr_map()
+        self.imagens = set(os.listdir(ATTR_FIN_DIR_IMGS)) if os.path.isdir(ATTR_FIN_DIR_IMGS) else set()
+
+    def particoes_mensais(self):
+        """Lista de (período, linhas do mês) em ordem cronológica."""
+        return [(periodo, dados_mes.copy()) for periodo, dados_mes in self.df.groupby('ANO_MES')]
+
+def _preparar_linha(row, ocr_map, tem_motivo=False, imagens=None):
     """Prepara os dados de uma linha para o template - apenas dados puros, sem HTML."""
     data = str(row.get('DATA', ''))
     hora = str(row.get('HORA', ''))
@@ -60,7 +87,7 @@ def _preparar_linha(row, ocr_map, tem_motivo=False):
     anexo = str(row.get('ANEXO', ''))
     
     # Verificar se existe imagem JPG para PDF
-    imagem_jpg = _verificar_imagem_jpg_pdf(anexo)
+    imagem_jpg = _verificar_imagem_jpg_pdf(anexo, imagens)
     
     # 1) primeiro, tenta usar o que já veio no CSV (coluna "OCR")
     texto_csv = str(row.get('OCR', '') or '').strip()
@@ -84,72 +111,10 @@ def _preparar_linha(row, ocr_map, tem_motivo=False):
     
     if (not ricardo or ricardo.lower() in ['nan', '']) and (not rafael or rafael.lower() in ['nan', '']) and not tem_valor_corrigido:
         print(f"DEBUG: Campos RICARDO e RAFAEL estão vazios e não há valor corrigido, tentando extrair do OCR")
-        # Tentar extrair valor do texto OCR
-        import re
-        valor_ocr = None
-        
-        # Padrões para encontrar valores no texto OCR
-        padroes_valor = [
-            r'R\$\s*([0-9.,]+)',  # R$ 123,45
-            r'valor\s*R\$\s*([0-9.,]+)',  # valor R$ 123,45
-            r'([0-9.,]+)\s*reais',  # 123,45 reais
-            r'total\s*R\$\s*([0-9.,]+)',  # total R$ 123,45
-            r'pago\s*R\$\s*([0-9.,]+)',  # pago R$ 123,45
-            r'R\$\s*([0-9.,]+)\s*dados',  # R$ 123,45 dados
-            r'valor\s*:\s*R\$\s*([0-9.,]+)',  # valor: R$ 123,45
-            r'([0-9.,]+)\s*via\s*celular',  # 123,45 via celular
-            r'([0-9.,]+)\s*realizado',  # 123,45 realizado
-            r'VALOR\s*TOTAL\s*R\$\s*([0-9.,]+)',  # VALOR TOTAL R$ 123,45
-            r'VALOR\s*A\s*PAGAR\s*R\$\s*([0-9.,]+)',  # VALOR A PAGAR R$ 123,45
-            r'R\$\s*([0-9.,]+)\s*realizado',  # R$ 123,45 realizado
-            r'valor\s*R\$\s*([0-9.,]+)\s*realizado',  # valor R$ 123,45 realizado
-            r'([0-9.,]+)\s*R\$\s*realizado',  # 123,45 R$ realizado
-            r'VALOR\s*PAGO\s*R\$\s*([0-9.,]+)',  # VALOR PAGO R$ 123,45
-            r'VALOR\s*PAGO\s*([0-9.,]+)',  # VALOR PAGO 123,45
-            r'valor\s*R\$\s*([0-9.,]+)\s*dados',  # valor R$ 123,45 dados
-            r'([0-9.,]+)\s*R\$\s*dados',  # 123,45 R$ dados
-            r'R\$\s*([0-9.,]+)\s*via',  # R$ 123,45 via
-            r'valor\s*:\s*([0-9.,]+)',  # valor: 123,45
-            r'([0-9.,]+)\s*R\$\s*via',  # 123,45 R$ via
-            r'VALOR\s*TOTAL\s*([0-9.,]+)',  # VALOR TOTAL 123,45
-            r'VALOR\s*A\s*PAGAR\s*([0-9.,]+)',  # VALOR A PAGAR 123,45
-            r'R\$\s*([0-9.,]+)\s*realizado',  # R$ 123,45 realizado
-            r'valor\s*R\$\s*([0-9.,]+)\s*realizado',  # valor R$ 123,45 realizado
-            r'([0-9.,]+)\s*R\$\s*realizado',  # 123,45 R$ realizado
-            r'VALOR\s*PAGO\s*R\$\s*([0-9.,]+)',  # VALOR PAGO R$ 123,45
-            r'VALOR\s*PAGO\s*([0-9.,]+)',  # VALOR PAGO 123,45
-            r'valor\s*R\$\s*([0-9.,]+)\s*dados',  # valor R$ 123,45 dados
-            r'([0-9.,]+)\s*R\$\s*dados',  # 123,45 R$ dados
-            r'R\$\s*([0-9.,]+)\s*via',  # R$ 123,45 via
-            r'valor\s*:\s*([0-9.,]+)',  # valor: 123,45
-            r'([0-9.,]+)\s*R\$\s*via',  # 123,45 R$ via
-            r'VALOR\s*TOTAL\s*([0-9.,]+)',  # VALOR TOTAL 123,45
-            r'VALOR\s*A\s*PAGAR\s*([0-9.,]+)',  # VALOR A PAGAR 123,45
-            r'R\$\s*([0-9.,]+)\s*realizado',  # R$ 123,45 realizado
-            r'valor\s*R\$\s*([0-9.,]+)\s*realizado',  # valor R$ 123,45 realizado
-            r'([0-9.,]+)\s*R\$\s*realizado',  # 123,45 R$ realizado
-            r'VALOR\s*PAGO\s*R\$\s*([0-9.,]+)',  # VALOR PAGO R$ 123,45
-            r'VALOR\s*PAGO\s*([0-9.,]+)',  # VALOR PAGO 123,45
-            r'valor\s*R\$\s*([0-9.,]+)\s*dados',  # valor R$ 123,45 dados
-            r'([0-9.,]+)\s*R\$\s*dados',  # 123,45 R$ dados
-            r'R\$\s*([0-9.,]+)\s*via',  # R$ 123,45 via
-            r'valor\s*:\s*([0-9.,]+)',  # valor: 123,45
-            r'([0-9.,]+)\s*R\$\s*via',  # 123,45 R$ via
-            r'VALOR\s*TOTAL\s*([0-9.,]+)',  # VALOR TOTAL 123,45
-            r'VALOR\s*A\s*PAGAR\s*([0-9.,]+)',  # VALOR A PAGAR 123,45
-        ]
-        
-        for padrao in padroes_valor:
-            match = re.search(padrao, texto_ocr, re.IGNORECASE)
-            if match:
-                valor_encontrado = match.group(1)
-                try:
-                    from .helper import normalize_value_to_brazilian_format
-                    valor_ocr = normalize_value_to_brazilian_format(valor_encontrado)
-                    print(f"DEBUG: Valor extraído '{valor_ocr}' do texto OCR para remetente '{remetente}'")
-                    break
-                except ValueError:
-                    continue
+        # Tentar extrair valor do texto OCR (resultado em cache por texto entre renderizações)
+        valor_ocr = extrair_valor_monetario(texto_ocr, 'prioridade') if texto_ocr else None
+        if valor_ocr:
+            print(f"DEBUG: Valor extraído '{valor_ocr}' do texto OCR para remetente '{remetente}'")
         
         if valor_ocr:
             # Direcionar valor para coluna correta baseado no remetente
@@ -254,45 +219,25 @@ def _preparar_linha(row, ocr_map, tem_motivo=False):
 
 def _preparar_linhas_impressao(df_mes):
     """Prepara os dados para o template de impressão."""
-    def to_float(v):
-        try:
-            from .helper import normalize_value_to_brazilian_format
-            valor_brasileiro = normalize_value_to_brazilian_format(v)
-            return float(valor_brasileiro.replace(',', '.'))
-        except:
-            return 0.0
+    def coluna(nome, padrao=''):
+        return df_mes[nome] if nome in df_mes.columns else pd.Series(padrao, index=df_mes.index, dtype=object)
     
-    saldo = 0.0
-    rows = []
+    valores = converter_serie_para_float(coluna('VALOR', '0'))
+    # Transferências entram como receita; pagamentos, desconhecidos e outros tipos como despesa
+    eh_receita = coluna('CLASSIFICACAO').astype(str).str.lower() == 'transferência'
+    saldos = valores.where(eh_receita, -valores).cumsum()
     
-    for index, row in df_mes.iterrows():
-        data = row.get('DATA', '')
-        descricao = row.get('DESCRICAO', '')
-        valor = to_float(row.get('VALOR', '0'))
-        identificador_unico = f"{index}_{data}_{valor}"
-        
-        classificacao = str(row.get('CLASSIFICACAO', ''))
-        if classificacao.lower() == 'transferência':
-            receitas = f"{valor:.2f}".replace('.', ',')
-            despesas = ''
-            saldo += valor
-        elif classificacao.lower() == 'desconhecido':
-            # Registros desconhecidos são tratados como despesas (pagamentos não identificados)
-            receitas = ''
-            despesas = f"{valor:.2f}".replace('.', ',')
-            saldo -= valor
-        else:
-            # Pagamentos e outros tipos
-            receitas = ''
-            despesas = f"{valor:.2f}".replace('.', ',')
-            saldo -= valor
-        
+    rows = []
+    for index, data, descricao, valor, receita, saldo in zip(
+        df_mes.index, coluna('DATA'), coluna('DESCRICAO'), valores, eh_receita, saldos
+    ):
+        valor_formatado = f"{valor:.2f}".replace('.', ',')
         rows.append({
-            'identificador_unico': identificador_unico,
+            'identificador_unico': f"{index}_{data}_{float(valor)}",
             'data': data,
             'descricao': descricao,
-            'receitas': receitas,
-            'despesas': despesas,
+            'receitas': valor_formatado if receita else '',
+            'despesas': '' if receita else valor_formatado,
             'saldo': f"{saldo:.2f}".replace('.', ',')
         })
     
@@ -300,32 +245,9 @@ def _preparar_linhas_impressao(df_mes):
 
 def _calcular_totalizadores_pessoas(rows):
     """Calcula totalizadores por pessoa, excluindo registros com 'dismiss'."""
-    def parse_valor(valor_str):
-        """Converte string de valor para float."""
-        if not valor_str or valor_str.lower() in ['nan', '']:
-            return 0.0
-        try:
-            from .helper import normalize_value_to_brazilian_format
-            valor_brasileiro = normalize_value_to_brazilian_format(valor_str)
-            return float(valor_brasileiro.replace(',', '.'))
-        except (ValueError, TypeError):
-            return 0.0
-    
-    total_ricardo = 0.0
-    total_rafael = 0.0
-    
-    for row in rows:
-        # Pula registros marcados como dismiss
-        if row.get('row_class', '').find('dismiss-row') != -1:
-            continue
-        
-        # Soma valores de Ricardo
-        valor_ricardo = parse_valor(row.get('ricardo', ''))
-        total_ricardo += valor_ricardo
-        
-        # Soma valores de Rafael
-        valor_rafael = parse_valor(row.get('rafael', ''))
-        total_rafael += valor_rafael
+    ativos = [row for row in rows if row.get('row_class', '').find('dismiss-row') == -1]
+    total_ricardo = float(converter_serie_para_float(pd.Series([row.get('ricardo', '') for row in ativos], dtype=object)).sum())
+    total_rafael = float(converter_serie_para_float(pd.Series([row.get('rafael', '') for row in ativos], dtype=object)).sum())
     
     return {
         'ricardo': f"{total_ricardo:.2f}".replace('.', ','),
@@ -334,57 +256,192 @@ def _calcular_totalizadores_pessoas(rows):
         'rafael_float': total_rafael
     }
 
-def gerar_relatorio_html(csv_path, backup=True):
-    print(f"DEBUG: Iniciando gerar_relatorio_html com csv_path: {csv_path}")
+def _carregar_digests():
+    """Carrega o manifesto {relatório HTML: digest do conteúdo usado na última renderização}."""
     try:
-        if not os.path.exists(csv_path):
-            print(f"❌ O relatório report.html não foi gerado pela ausência da planilha de cálculos ({csv_path})")
-            return
-        
-        report_path = os.path.join(ATTR_FIN_DIR_DOCS, "report.html")
-        if os.path.exists(report_path) and backup:
-            timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
-            arquivo_backup = f"report-{timestamp}.bak"
-            os.rename(report_path, arquivo_backup)
-            print(f"📁 Relatório anterior renomeado para: {arquivo_backup}")
-        elif os.path.exists(report_path) and not backup:
-            os.remove(report_path)
-            print("🗑️ Relatório anterior removido (backup desabilitado)")
-        print(f"📊 Gerando novo relatório HTML baseado em {csv_path}...")
-        
-        # Carregar dados OCR
-        ocr_map = _carregar_ocr_map()
-        
-        df = pd.read_csv(csv_path)
-        tem_motivo = False  # Removendo a coluna "Motivo do Erro" de todos os relatórios
-        
-        # Preparar dados para o template
-        rows = []
-        for _, row in df.iterrows():
-            rows.append(_preparar_linha(row, ocr_map, tem_motivo))
-        
-        # Calcular totalizadores por pessoa
-        totalizadores = _calcular_totalizadores_pessoas(rows)
-        
+        with open(ATTR_FIN_ARQ_DIGESTS, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _salvar_digests(digests):
+    """Grava o manifesto de digests de forma atômica."""
+    diretorio = os.path.dirname(ATTR_FIN_ARQ_DIGESTS)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+    temporario = f"{ATTR_FIN_ARQ_DIGESTS}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(digests, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(temporario, ATTR_FIN_ARQ_DIGESTS)
+
+def _digest_conteudo(*partes):
+    """Digest das entradas de uma renderização (dados da partição, templates, variante)."""
+    h = hashlib.sha256()
+    for parte in partes:
+        h.update(json.dumps(parte, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def _entradas_particao(df):
+    """Células de uma partição do cálculo, sem as colunas auxiliares de agrupamento."""
+    colunas = [c for c in df.columns if c not in ('DATA_DT', 'ANO_MES')]
+    return [colunas, df[colunas].astype(str).values.tolist()]
+
+def _entradas_anexos(df, contexto):
+    """O que _preparar_linha lê fora do CSV para cada anexo: o texto OCR e a imagem JPG de PDFs."""
+    if 'ANEXO' not in df.columns:
+        return {}
+    anexos = df['ANEXO'].dropna().astype(str).unique()
+    return {anexo: [contexto.ocr_map.get(anexo, ''), _verificar_imagem_jpg_pdf(anexo, contexto.imagens)] for anexo in anexos}
+
+def _relatorio_em_dia(caminho, digest, digests):
+    """True se o HTML existe e foi renderizado a partir exatamente das mesmas entradas."""
+    return os.path.exists(caminho) and digests.get(caminho) == digest
+
+# Environment do Jinja2 do processo de renderização (criado pelo inicializador do pool)
+_ambiente_worker = None
+
+def _iniciar_worker_relatorios():
+    """Inicializador dos processos do pool: cada um usa seu próprio Environment do Jinja2."""
+    global _ambiente_worker
+    _ambiente_worker = criar_ambiente()
+
+def _renderizar_particao(tarefa):
+    """Prepara as linhas de um mês e renderiza suas variantes pendentes.
+
+    Executa no processo do pool (ou no principal, quando há um único mês). Retorna os
+    pares (caminho, digest) gravados e o tempo gasto no mês, em segundos."""
+    inicio = time.perf_counter()
+    tem_motivo = False  # Removendo a coluna "Motivo do Erro" de todos os relatórios
+    rows = []
+    for _, row in tarefa["dados"].iterrows():
+        rows.append(_preparar_linha(row, tarefa["ocr_map"], tem_motivo, tarefa["imagens"]))
+    
+    # Calcular totalizadores por pessoa para este mês
+    totalizadores = _calcular_totalizadores_pessoas(rows)
+    
+    gerados = []
+    for variante in tarefa["variantes"]:
         context = {
+            "periodo": tarefa["periodo"],
             "timestamp": pd.Timestamp.now().strftime('%d/%m/%Y às %H:%M:%S'),
             "rows": rows,
             "tem_motivo": tem_motivo,
             "totalizadores": totalizadores,
-            "is_editable": False,  # Relatório geral é apenas para visualização
             "attrs": {
                 "INPUT_DIR_PATH": ATTR_FIN_DIR_INPUT,
                 "IMGS_DIR_PATH": ATTR_FIN_DIR_IMGS
-            }
+            },
+            **variante["contexto"]
         }
+        TemplateRenderer.render("unified_report.html.j2", context, variante["caminho"], ambiente=_ambiente_worker)
+        gerados.append((variante["caminho"], variante["digest"]))
+    return gerados, time.perf_counter() - inicio
+
+def _renderizar_particoes(tarefas, workers=None, progresso=None):
+    """Distribui a renderização dos meses em um ProcessPoolExecutor com até `workers` processos
+    (padrão: ATTR_FIN_RELATORIO_WORKERS). Retorna os resultados na ordem das tarefas.
+
+    `progresso` (eventos.Etapa) recebe o número de meses e cada mês renderizado."""
+    if progresso:
+        progresso.definir_total(len(tarefas))
+    if not tarefas:
+        return []
+    workers = max(1, int(ATTR_FIN_RELATORIO_WORKERS if workers is None else workers))
+    inicio = time.perf_counter()
+    resultados = []
+    if workers > 1 and len(tarefas) > 1:
+        processos = min(workers, len(tarefas))
+        print(f"🧵 Renderizando {len(tarefas)} mês(es) com {processos} processos")
+        try:
+            with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker_relatorios,
+                                     mp_context=contexto_processos()) as executor:
+                try:
+                    for resultado in executor.map(_renderizar_particao, tarefas):
+                        resultados.append(resultado)
+                        if progresso:
+                            progresso.avancar()
+                        verificar_cancelamento()
+                except JobCancelado:
+                    # Não espera os meses que ainda estão na fila do pool
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        except Exception as e:
+            print(f"⚠️  Falha no pool de renderização ({e}); renderizando sequencialmente")
+            resultados = []
+    if len(resultados) != len(tarefas):
+        resultados = []
+        if progresso:
+            progresso.concluidos = 0
+        for tarefa in tarefas:
+            verificar_cancelamento()
+            resultados.append(_renderizar_particao(tarefa))
+            if progresso:
+                progresso.avancar()
+    total = time.perf_counter() - inicio
+    soma = sum(segundos for _, segundos in resultados)
+    print(f"⏱️  Renderização mensal: {total:.2f}s ({soma:.2f}s somando os meses)")
+    return resultados
+
+def gerar_relatorio_html(csv_path, backup=True, contexto=None):
+    print(f"DEBUG: Iniciando gerar_relatorio_html com csv_path: {csv_path}")
+    try:
+        if contexto is None:
+            if not os.path.exists(csv_path):
+                print(f"❌ O relatório report.html não foi gerado pela ausência da planilha de cálculos ({csv_path})")
+                return
+            contexto = ReportContext(csv_path)
         
-        print(f"DEBUG: Chamando TemplateRenderer.render com output_path: {report_path}")
-        TemplateRenderer.render(
-            template_name="unified_report.html.j2",
-            context=context,
-            output_path=report_path
-        )
-        print("✅ Relatório HTML gerado: report.html")
+        report_path = os.path.join(ATTR_FIN_DIR_DOCS, "report.html")
+        ocr_map = contexto.ocr_map
+        df = contexto.df
+        tem_motivo = False  # Removendo a coluna "Motivo do Erro" de todos os relatórios
+        
+        # Re-renderiza apenas se os dados, o OCR ou os templates mudaram desde a última geração
+        digests = _carregar_digests()
+        templates = digest_templates()
+        digest_relatorio = _digest_conteudo('report', templates, _entradas_particao(df), _entradas_anexos(df, contexto))
+        if _relatorio_em_dia(report_path, digest_relatorio, digests):
+            print("⏭️  report.html sem alterações - renderização ignorada")
+        else:
+            if os.path.exists(report_path) and backup:
+                timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
+                arquivo_backup = f"report-{timestamp}.bak"
+                os.rename(report_path, arquivo_backup)
+                print(f"📁 Relatório anterior renomeado para: {arquivo_backup}")
+            elif os.path.exists(report_path) and not backup:
+                os.remove(report_path)
+                print("🗑️ Relatório anterior removido (backup desabilitado)")
+            print(f"📊 Gerando novo relatório HTML baseado em {csv_path}...")
+            
+            # Preparar dados para o template
+            rows = []
+            for _, row in df.iterrows():
+                rows.append(_preparar_linha(row, ocr_map, tem_motivo, contexto.imagens))
+            
+            # Calcular totalizadores por pessoa
+            totalizadores = _calcular_totalizadores_pessoas(rows)
+            
+            context = {
+                "timestamp": pd.Timestamp.now().strftime('%d/%m/%Y às %H:%M:%S'),
+                "rows": rows,
+                "tem_motivo": tem_motivo,
+                "totalizadores": totalizadores,
+                "is_editable": False,  # Relatório geral é apenas para visualização
+                "attrs": {
+                    "INPUT_DIR_PATH": ATTR_FIN_DIR_INPUT,
+                    "IMGS_DIR_PATH": ATTR_FIN_DIR_IMGS
+                }
+            }
+            
+            print(f"DEBUG: Chamando TemplateRenderer.render com output_path: {report_path}")
+            TemplateRenderer.render(
+                template_name="unified_report.html.j2",
+                context=context,
+                output_path=report_path
+            )
+            digests[report_path] = digest_relatorio
+            print("✅ Relatório HTML gerado: report.html")
         
         # Gera o index.html a partir do template
         print("📄 Gerando página de entrada: index.html")
@@ -414,133 +471,125 @@ def gerar_relatorio_html(csv_path, backup=True):
             "monthly_reports": monthly_reports
         }
         
-        # Renderiza o template
+        # Renderiza o template (apenas se a lista de relatórios ou os templates mudaram)
         index_path = os.path.join(ATTR_FIN_DIR_DOCS, "index.html")
-        TemplateRenderer.render(
-            template_name="index.html.j2",
-            context=index_context,
-            output_path=index_path
-        )
-        print("✅ Página de entrada gerada: index.html")
+        digest_index = _digest_conteudo('index', templates, index_context)
+        if _relatorio_em_dia(index_path, digest_index, digests):
+            print("⏭️  index.html sem alterações - renderização ignorada")
+        else:
+            TemplateRenderer.render(
+                template_name="index.html.j2",
+                context=index_context,
+                output_path=index_path
+            )
+            digests[index_path] = digest_index
+            print("✅ Página de entrada gerada: index.html")
+        _salvar_digests(digests)
         
-        # Validação OCR
+        # Validação OCR (no próprio processo, com a planilha e o OCR já carregados)
         print("🔍 Validando conformidade OCR...")
         try:
-            # Executa o check.py usando o caminho correto
-            import sys
-            from pathlib import Path
-            check_script = Path(__file__).parent / 'check.py'
-            subprocess.run([sys.executable, str(check_script), csv_path], check=True)
-            print("✅ Validação OCR concluída com sucesso")
-        except subprocess.CalledProcessError:
-            print("❌ Falha na validação OCR - verifique as linhas sem OCR")
+            if validar_conformidade_ocr(contexto.df, contexto.ocr_map):
+                print("✅ Validação OCR concluída com sucesso")
+            else:
+                print("❌ Falha na validação OCR - verifique as linhas sem OCR")
         except Exception as e:
             print(f"⚠️  Erro na validação OCR: {str(e)}")
     except Exception as e:
         print(f"❌ Erro ao gerar relatório HTML: {str(e)}")
 
-def gerar_relatorios_mensais_html(csv_path, backup=True):
+def gerar_relatorios_mensais_html(csv_path, backup=True, contexto=None, progresso=None):
     print(f"📅 Gerando relatórios mensais HTML baseado em {csv_path}...")
     try:
-        if not os.path.exists(csv_path):
-            print(f"❌ Relatórios mensais não foram gerados pela ausência da planilha de cálculos ({csv_path})")
-            return
-        
-        # Carregar dados OCR
-        ocr_map = _carregar_ocr_map()
-        
-        # Carregar dados
-        df = pd.read_csv(csv_path)
-        df['DATA_DT'] = pd.to_datetime(df['DATA'], format='%d/%m/%Y', errors='coerce')
-        df['ANO_MES'] = df['DATA_DT'].dt.to_period('M')
-        
-        # Agrupar por mês
-        grupos_mensais = df.groupby('ANO_MES')
-        
-        nomes_meses = {
-            1: 'Janeiro', 2: 'Fevereiro', 3: 'Marco', 4: 'Abril',
-            5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
-            9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
-        }
+        if contexto is None:
+            if not os.path.exists(csv_path):
+                print(f"❌ Relatórios mensais não foram gerados pela ausência da planilha de cálculos ({csv_path})")
+                return
+            contexto = ReportContext(csv_path)
         
-        relatorios_gerados = 0
+        relatorios_em_dia = 0
+        digests = _carregar_digests()
+        templates = digest_templates()
+        tarefas = []
         
-        for periodo, dados_mes in grupos_mensais:
+        for periodo, dados_mes in contexto.particoes_mensais():
             ano = periodo.year
             mes = periodo.month
-            nome_mes = nomes_meses[mes]
+            nome_mes = NOMES_MESES[mes]
             dados_mes = dados_mes[dados_mes['DATA_DT'].dt.month == mes].copy()
             
-            # Relatório mensal normal
             nome_arquivo = f"report-{ano}-{mes:02d}-{nome_mes}.html"
             arquivo_path = os.path.join(ATTR_FIN_DIR_DOCS, nome_arquivo)
-            if os.path.exists(arquivo_path) and backup:
-                timestamp = pd.Timestamp.now().strftime('%Y%m%d')
-                arquivo_backup = f"report-{ano}-{mes:02d}-{nome_mes}-{timestamp}.bak"
-                os.rename(arquivo_path, arquivo_backup)
-                print(f"📁 Relatório mensal anterior renomeado para: {arquivo_backup}")
-            elif os.path.exists(arquivo_path) and not backup:
-                os.remove(arquivo_path)
-                print(f"🗑️ Relatório mensal anterior removido: {nome_arquivo} (backup desabilitado)")
+            nome_arquivo_edit = f"report-edit-{ano}-{mes:02d}-{nome_mes}.html"
+            arquivo_edit_path = os.path.join(ATTR_FIN_DIR_DOCS, nome_arquivo_edit)
             
-            tem_motivo = False  # Removendo a coluna "Motivo do Erro" de todos os relatórios
-            rows = []
-            for _, row in dados_mes.iterrows():
-                rows.append(_preparar_linha(row, ocr_map, tem_motivo))
+            # Digest da partição do mês: só os meses alterados (ou com template alterado) são re-renderizados
+            anexos_mes = _entradas_anexos(dados_mes, contexto)
+            entradas_mes = [templates, _entradas_particao(dados_mes), anexos_mes]
+            digest_normal = _digest_conteudo('mensal', *entradas_mes)
+            digest_edit = _digest_conteudo('mensal-edit', *entradas_mes)
+            variantes = []
             
-            # Calcular totalizadores por pessoa para este mês
-            totalizadores = _calcular_totalizadores_pessoas(rows)
+            # Relatório mensal normal
+            if not _relatorio_em_dia(arquivo_path, digest_normal, digests):
+                if os.path.exists(arquivo_path) and backup:
+                    timestamp = pd.Timestamp.now().strftime('%Y%m%d')
+                    arquivo_backup = f"report-{ano}-{mes:02d}-{nome_mes}-{timestamp}.bak"
+                    os.rename(arquivo_path, arquivo_backup)
+                    print(f"📁 Relatório mensal anterior renomeado para: {arquivo_backup}")
+                elif os.path.exists(arquivo_path) and not backup:
+                    os.remove(arquivo_path)
+                    print(f"🗑️ Relatório mensal anterior removido: {nome_arquivo} (backup desabilitado)")
+                variantes.append({
+                    "caminho": arquivo_path,
+                    "digest": digest_normal,
+                    "contexto": {
+                        "edit_link": nome_arquivo_edit,
+                        "is_editable": False  # Relatório mensal normal é apenas para visualização
+                    }
+                })
             
-            context = {
-                "periodo": f"{nome_mes} {ano}",
-                "timestamp": pd.Timestamp.now().strftime('%d/%m/%Y às %H:%M:%S'),
-                "rows": rows,
-                "tem_motivo": tem_motivo,
-                "totalizadores": totalizadores,
-                "edit_link": f"report-edit-{ano}-{mes:02d}-{nome_mes}.html",
-                "is_editable": False,  # Relatório mensal normal é apenas para visualização
-                "attrs": {
-                    "INPUT_DIR_PATH": ATTR_FIN_DIR_INPUT,
-                    "IMGS_DIR_PATH": ATTR_FIN_DIR_IMGS
-                }
-            }
+            # Relatório mensal editável (sem botão de edição)
+            if not _relatorio_em_dia(arquivo_edit_path, digest_edit, digests):
+                variantes.append({
+                    "caminho": arquivo_edit_path,
+                    "digest": digest_edit,
+                    "contexto": {
+                        "is_editable": True  # Relatório editável tem funcionalidades de edição
+                    }
+                })
             
-            TemplateRenderer.render("unified_report.html.j2", context, arquivo_path)
-            relatorios_gerados += 1
-            print(f"✅ Relatório mensal gerado: {nome_arquivo}")
+            if not variantes:
+                relatorios_em_dia += 1
+                print(f"⏭️  {nome_arquivo} sem alterações - renderização ignorada")
+                continue
             
-            # Relatório mensal editável (sem botão de edição)
-            nome_arquivo_edit = f"report-edit-{ano}-{mes:02d}-{nome_mes}.html"
-            arquivo_edit_path = os.path.join(ATTR_FIN_DIR_DOCS, nome_arquivo_edit)
-            context_edit = {
+            tarefas.append({
                 "periodo": f"{nome_mes} {ano}",
-                "timestamp": pd.Timestamp.now().strftime('%d/%m/%Y às %H:%M:%S'),
-                "rows": rows,
-                "tem_motivo": tem_motivo,
-                "totalizadores": totalizadores,
-                # Não incluir edit_link para relatórios de edição
-                "is_editable": True,  # Relatório editável tem funcionalidades de edição
-                "attrs": {
-                    "INPUT_DIR_PATH": ATTR_FIN_DIR_INPUT,
-                    "IMGS_DIR_PATH": ATTR_FIN_DIR_IMGS
-                }
-            }
-            TemplateRenderer.render("unified_report.html.j2", context_edit, arquivo_edit_path)
-            print(f"✅ Relatório mensal editável gerado: {nome_arquivo_edit}")
+                "dados": dados_mes.drop(columns=['DATA_DT', 'ANO_MES']),
+                # Apenas o OCR dos anexos do mês segue para o processo de renderização
+                "ocr_map": {anexo: ocr for anexo, (ocr, _) in anexos_mes.items() if ocr},
+                "imagens": {jpg for _, jpg in anexos_mes.values() if jpg},
+                "variantes": variantes
+            })
         
-        print(f"📅 Total de relatórios mensais gerados: {relatorios_gerados}")
+        relatorios_gerados = 0
+        for gerados, segundos in _renderizar_particoes(tarefas, progresso=progresso):
+            for caminho, digest in gerados:
+                digests[caminho] = digest
+                relatorios_gerados += 1
+                print(f"✅ Relatório mensal gerado: {os.path.basename(caminho)} ({segundos:.2f}s no mês)")
+        
+        _salvar_digests(digests)
+        print(f"📅 Total de relatórios mensais gerados: {relatorios_gerados} ({relatorios_em_dia} mês(es) sem alterações)")
         
-        # Validação OCR
+        # Validação OCR (no próprio processo, com a planilha e o OCR já carregados)
         print("🔍 Validando conformidade OCR...")
         try:
-            # Executa o check.py usando o caminho correto
-            import sys
-            from pathlib import Path
-            check_script = Path(__file__).parent / 'check.py'
-            subprocess.run([sys.executable, str(check_script), csv_path], check=True)
-            print("✅ Validação OCR concluída com sucesso")
-        except subprocess.CalledProcessError:
-            print("❌ Falha na validação OCR - verifique as linhas sem OCR")
+            if validar_conformidade_ocr(contexto.df, contexto.ocr_map):
+                print("✅ Validação OCR concluída com sucesso")
+            else:
+                print("❌ Falha na validação OCR - verifique as linhas sem OCR")
         except Exception as e:
             print(f"⚠️  Erro na validação OCR: {str(e)}")
     except Exception as e:
@@ -563,6 +612,7 @@ def gerar_html_impressao(df_mes, nome_arquivo, nome_mes, ano):
 
 if __name__ == "__main__":
     print("🚀 Iniciando geração de relatórios...")
-    gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO)
-    gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO)
+    contexto = ReportContext(ATTR_FIN_ARQ_CALCULO)
+    gerar_relatorio_html(ATTR_FIN_ARQ_CALCULO, contexto=contexto)
+    gerar_relatorios_mensais_html(ATTR_FIN_ARQ_CALCULO, contexto=contexto)
     print("✅ Geração de relatórios concluída!")
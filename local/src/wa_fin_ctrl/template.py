@@ -1,19 +1,36 @@
 # template.py
 import os
+import hashlib
 from jinja2 import Environment, FileSystemLoader
 
 # Define onde os templates estão (pasta templates/ na raiz do projeto)
 TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "templates")
-env = Environment(
-    loader=FileSystemLoader(TEMPLATES_DIR),
-    autoescape=True
-)
+
+def criar_ambiente() -> Environment:
+    """Cria um Environment do Jinja2 para os templates do projeto (um por processo de renderização)."""
+    return Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True
+    )
+
+env = criar_ambiente()
+
+def digest_templates() -> str:
+    """Digest de todos os templates: heranças e inclusões alteram o resultado de qualquer relatório."""
+    h = hashlib.sha256()
+    for raiz, _, arquivos in sorted(os.walk(TEMPLATES_DIR)):
+        for nome in sorted(arquivos):
+            caminho = os.path.join(raiz, nome)
+            h.update(os.path.relpath(caminho, TEMPLATES_DIR).encode('utf-8'))
+            with open(caminho, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
 
 class TemplateRenderer:
     @staticmethod
-    def render(template_name: str, context: dict, output_path: str):
-        """Renderiza um template Jinja2 e salva em arquivo."""
-        template = env.get_template(template_name)
+    def render(template_name: str, context: dict, output_path: str, ambiente: Environment = None):
+        """Renderiza um template Jinja2 e salva em arquivo (no `ambiente` informado ou no padrão do módulo)."""
+        template = (ambiente or env).get_template(template_name)
         html = template.render(**context)
         # Cria o diretório apenas se o output_path tiver um diretório
         output_dir = os.path.dirname(output_path)
@@ -5,6 +5,8 @@ Arquivo de testes para o sistema de processamento de comprovantes
 
 import os
 import sys
+import tempfile
+import subprocess
 from pathlib import Path
 
 # Adiciona o diretório atual ao path para importar módulos
@@ -13,10 +15,20 @@ sys.path.insert(0, str(Path(__file__).parent))
 from .app import (
     ATTR_FIN_DIR_IMGS, ATTR_FIN_DIR_INPUT, ATTR_FIN_DIR_MASSA,
     ATTR_FIN_OPENAI_API_KEY, process_image_ocr, extract_total_value_with_chatgpt,
-    generate_payment_description_with_chatgpt, classify_transaction_type_with_chatgpt
+    generate_payment_description_with_chatgpt, classify_transaction_type_with_chatgpt,
+    extrair_dados_comprovante_com_chatgpt
 )
 from .ocr import process_image_ocr as ocr_process_image
 from .history import CommandHistory
+from .valores import extrair_valor_monetario, extrair_valores_serie
+from . import db
+from .chat import agrupar_mensagens_chat, mesclar_mensagens_chat
+from .helper import anexar_linhas_jsonl, ler_linhas_jsonl
+
+# Orçamento de importação dos comandos leves (CLI + histórico), medido com python -X importtime
+ORCAMENTO_IMPORTACAO_MS = 150
+# Dependências pesadas que só os subcomandos de processamento podem carregar
+MODULOS_PESADOS = ('cv2', 'pytesseract', 'openai', 'PIL')
 
 
 def testar_ocr_individual():
@@ -86,11 +98,21 @@ def testar_funcoes_chatgpt():
         classificacao = classify_transaction_type_with_chatgpt(texto_teste)
         sucesso_classificacao = classificacao in ["Transferência", "Pagamento"]
 
+        # Testa extração estruturada (uma única chamada)
+        print("Testando extração estruturada...")
+        dados = extrair_dados_comprovante_com_chatgpt(texto_teste)
+        sucesso_estruturado = (
+            set(dados) == {"valor", "descricao", "classificacao"}
+            and bool(dados["valor"]) and bool(dados["descricao"])
+            and dados["classificacao"] in ["Transferência", "Pagamento"]
+        )
+
         print(f"Valor extraído: {valor}")
         print(f"Descrição gerada: {descricao}")
         print(f"Classificação: {classificacao}")
+        print(f"Extração estruturada: {dados}")
 
-        sucesso_geral = sucesso_valor and sucesso_descricao and sucesso_classificacao
+        sucesso_geral = sucesso_valor and sucesso_descricao and sucesso_classificacao and sucesso_estruturado
         print(f"Funções ChatGPT: {'✅ PASSOU' if sucesso_geral else '❌ FALHOU'}")
         return sucesso_geral
 
@@ -99,6 +121,45 @@ def testar_funcoes_chatgpt():
         return False
 
 
+def testar_extracao_valores():
+    """Testa a extração de valores monetários do texto OCR (sem API)"""
+    print("\n--- Testando Extração de Valores ---")
+
+    try:
+        import pandas as pd
+
+        casos = [
+            ("PIX Banco do Brasil R$ 29,90 Padaria Bonanza", 'maior', "29,90"),
+            ("VALOR A PAGAR R$ 1.533,27 desconto R$ 2,00", 'maior', "1533,27"),
+            ("R$ 10,00 R$ 20,00", 'prioridade', "10,00"),
+            ("Transferência 45,00 reais realizado", 'prioridade', "45,00"),
+            ("Data 01/04/2025 protocolo 123456", 'maior', ""),
+            # Data seguida de "R$": o relatório não pode tomar o ano como valor
+            ("1.533,27 01/04/2025 R$", 'prioridade', ""),
+            ("Pix 01/04/2025 R$ 45,00", 'prioridade', "45,00"),
+            ("Transferência 87,10 R$ realizado", 'prioridade', "87,10"),
+            ("Total 12,50 R$", 'maior', "12,50"),
+        ]
+        sucesso = True
+        for texto, criterio, esperado in casos:
+            obtido = extrair_valor_monetario(texto, criterio)
+            if obtido != esperado:
+                print(f"❌ '{texto}' ({criterio}): esperado '{esperado}', obtido '{obtido}'")
+                sucesso = False
+
+        serie = extrair_valores_serie(pd.Series([casos[0][0], None, casos[0][0]]))
+        if serie.tolist() != ["29,90", "", "29,90"]:
+            print(f"❌ Extração em lote: {serie.tolist()}")
+            sucesso = False
+
+        print(f"Extração de valores: {'✅ PASSOU' if sucesso else '❌ FALHOU'}")
+        return sucesso
+
+    except Exception as e:
+        print(f"❌ Erro no teste de extração de valores: {e}")
+        return False
+
+
 def testar_processamento_completo():
     """Testa o processamento completo de uma imagem"""
     print("\n--- Testando Processamento Completo ---")
@@ -234,6 +295,251 @@ def testar_sistema_historico():
         return False
 
 
+def _linha_calculo(data, hora, ricardo, descricao):
+    return {'DATA': data, 'HORA': hora, 'REMETENTE': 'Ricardo', 'CLASSIFICACAO': 'Pagamento',
+            'RICARDO': ricardo, 'RAFAEL': '', 'ANEXO': '', 'DESCRICAO': descricao, 'VALOR': '',
+            'OCR': f'Comprovante R$ {ricardo}', 'VALIDADE': '', 'MOTIVO_ERRO': ''}
+
+
+def testar_banco_dados():
+    """Testa a camada SQLite das planilhas: gravação, sincronização, correções e índice de localização"""
+    print("\n--- Testando Banco de Dados ---")
+
+    import pandas as pd
+    from .app import ATTR_FIN_ARQ_CALCULO, fix_entry, dismiss_entry
+
+    diretorio_original = os.getcwd()
+    banco_original = db._banco
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Os caminhos do projeto são relativos: tudo (banco, CSVs, relatórios) fica no diretório temporário
+            os.chdir(tmp)
+            os.makedirs(os.path.dirname(ATTR_FIN_ARQ_CALCULO), exist_ok=True)
+            db._banco = None
+            banco = db.obter_banco()
+            chamadas = []
+            for nome in ('inserir_calculo', 'substituir_calculo'):
+                metodo = getattr(banco, nome)
+                setattr(banco, nome, lambda df, nome=nome, metodo=metodo: (chamadas.append(nome), metodo(df))[1])
+
+            # 1. Primeira gravação substitui a tabela; um acréscimo em sincronia só insere as linhas novas
+            df = pd.DataFrame([_linha_calculo('01/02/2024', '10:00:00', '10,00', 'Mercado'),
+                               _linha_calculo('02/02/2024', '11:00:00', '20,00', 'Farmácia')])
+            db.gravar_planilha(df, ATTR_FIN_ARQ_CALCULO, quoting=1)
+            novos = pd.DataFrame([_linha_calculo('03/02/2024', '12:00:00', '30,00', 'Padaria')])
+            df = pd.concat([df, novos], ignore_index=True)
+            db.gravar_planilha(df, ATTR_FIN_ARQ_CALCULO, novos=novos, quoting=1)
+            if chamadas != ['substituir_calculo', 'inserir_calculo'] or banco.contar_calculo() != 3:
+                print(f"❌ gravar_planilha: chamadas {chamadas}, {banco.contar_calculo()} linhas (esperado: substituir, inserir, 3)")
+                return False
+
+            # 2. Um CSV alterado por fora impede o acréscimo incremental e é reimportado
+            editado = pd.read_csv(ATTR_FIN_ARQ_CALCULO, dtype=str)
+            editado.loc[0, 'DESCRICAO'] = 'Mercado editado'
+            editado.to_csv(ATTR_FIN_ARQ_CALCULO, index=False, quoting=1)
+            if banco.exportacao_em_dia(ATTR_FIN_ARQ_CALCULO):
+                print("❌ CSV editado por fora ainda consta como em dia com o banco")
+                return False
+            banco.sincronizar_calculo(ATTR_FIN_ARQ_CALCULO)
+            if banco.buscar_calculo('01/02/2024', '10:00:00')['DESCRICAO'].tolist() != ['Mercado editado']:
+                print("❌ sincronizar_calculo não reimportou o CSV editado")
+                return False
+            chamadas.clear()
+            mais = pd.DataFrame([_linha_calculo('04/02/2024', '13:00:00', '40,00', 'Feira')])
+            editado.loc[1, 'DESCRICAO'] = 'Farmácia editada'
+            editado.to_csv(ATTR_FIN_ARQ_CALCULO, index=False, quoting=1)
+            db.gravar_planilha(pd.concat([editado, mais], ignore_index=True), ATTR_FIN_ARQ_CALCULO, novos=mais, quoting=1)
+            if chamadas != ['substituir_calculo'] or banco.buscar_calculo('02/02/2024', '11:00:00')['DESCRICAO'].tolist() != ['Farmácia editada']:
+                print(f"❌ gravar_planilha com CSV fora de sincronia: chamadas {chamadas} (esperado: substituir)")
+                return False
+
+            # 3. buscar -> atualizar -> exportar altera só a linha da data/hora
+            linhas = banco.buscar_calculo('03/02/2024', '12:00:00')
+            linhas['CLASSIFICACAO'] = 'Transferência'
+            banco.atualizar_calculo(linhas)
+            banco.exportar_calculo_csv(ATTR_FIN_ARQ_CALCULO)
+            csv = pd.read_csv(ATTR_FIN_ARQ_CALCULO, dtype=str)
+            if (csv['CLASSIFICACAO'].tolist() != ['Pagamento', 'Pagamento', 'Transferência', 'Pagamento']
+                    or not banco.exportacao_em_dia(ATTR_FIN_ARQ_CALCULO)):
+                print(f"❌ Ida e volta buscar/atualizar/exportar incorreta: {csv['CLASSIFICACAO'].tolist()}")
+                return False
+
+            # 4. dismiss seguido de fix na mesma entrada: banco e CSV refletem as duas correções
+            if not dismiss_entry('02/02/2024 11:00:00'):
+                print("❌ dismiss_entry não encontrou a entrada")
+                return False
+            if pd.read_csv(ATTR_FIN_ARQ_CALCULO, dtype=str).loc[1, 'VALIDADE'] != 'dismiss':
+                print("❌ dismiss não chegou ao CSV")
+                return False
+            if not fix_entry('02/02/2024 11:00:00', novo_valor='25,50', nova_descricao='Farmácia corrigida', dismiss=True):
+                print("❌ fix_entry não encontrou a entrada")
+                return False
+            csv = pd.read_csv(ATTR_FIN_ARQ_CALCULO, dtype=str)
+            do_banco = banco.carregar_calculo().reset_index(drop=True).fillna('')
+            if (len(csv) != 4 or csv.loc[1, 'DESCRICAO'] != 'Farmácia corrigida' or csv.loc[1, 'VALIDADE'] != 'dismiss'
+                    or csv.loc[1, 'RICARDO'] != '25,50' or csv.loc[0, 'DESCRICAO'] != 'Mercado editado'
+                    or do_banco['DESCRICAO'].tolist() != csv['DESCRICAO'].fillna('').tolist()):
+                print(f"❌ dismiss + fix incorretos: {csv.loc[1].to_dict()}")
+                return False
+
+            # 5. Índice de localização: reindexa quando o CSV muda de tamanho/mtime fora do sistema
+            extra = os.path.join('mensagens', 'extra.csv')
+            pd.DataFrame({'DATA': ['05/02/2024'], 'HORA': ['09:00:00']}).to_csv(extra, index=False)
+            if banco.localizar_entrada('05/02/2024', '09:00:00', [extra]) != {extra: [0]}:
+                print("❌ localizar_entrada não encontrou a linha do CSV")
+                return False
+            pd.DataFrame({'DATA': ['04/02/2024', '05/02/2024'], 'HORA': ['08:00:00', '09:00:00']}).to_csv(extra, index=False)
+            if banco.localizar_entrada('05/02/2024', '09:00:00', [extra]) != {extra: [1]}:
+                print("❌ localizar_entrada usou o índice antigo de um CSV alterado")
+                return False
+
+        print("✅ Banco de dados funcionando corretamente!")
+        return True
+
+    except Exception as e:
+        print(f"❌ Erro no teste do banco de dados: {e}")
+        return False
+    finally:
+        os.chdir(diretorio_original)
+        if db._banco is not None and db._banco is not banco_original:
+            db._banco._conexao.close()
+        db._banco = banco_original
+
+
+def testar_mescla_chats():
+    """Testa a mescla de exportações sobrepostas do chat (ordem, duplicatas e mensagens de várias linhas)"""
+    print("\n--- Testando Mescla de Chats ---")
+
+    try:
+        janeiro = list(agrupar_mensagens_chat([
+            "[30/01/2024, 09:00:00] Ricardo: ok\n",
+            "[30/01/2024, 09:00:00] Ricardo: ok\n",
+            "[31/01/2024, 18:00:00] Rafael: pagamento do aluguel\n",
+            "referente a fevereiro\n",
+            "[31/01/2024, 19:00:00] Ricardo: \u200e<anexado: 00000001-PHOTO.jpg>\n",
+        ]))
+        # A exportação seguinte começa no meio do mesmo segundo: só uma das duas mensagens "ok"
+        fevereiro = list(agrupar_mensagens_chat([
+            "[30/01/2024, 09:00:00] Ricardo: ok\n",
+            "[31/01/2024, 18:00:00] Rafael: pagamento do aluguel\n",
+            "referente a fevereiro\n",
+            "[31/01/2024, 19:00:00] Ricardo: \u200e<anexado: 00000001-PHOTO.jpg>\n",
+            "[01/02/2024, 08:00:00] Rafael: conta de luz\n",
+        ]))
+        mescladas = mesclar_mensagens_chat([fevereiro, janeiro])
+        esperado = [
+            ('30/01/2024', '09:00:00', 'ok'),
+            ('30/01/2024', '09:00:00', 'ok'),
+            ('31/01/2024', '18:00:00', 'pagamento do aluguel\nreferente a fevereiro'),
+            ('31/01/2024', '19:00:00', '\u200e<anexado: 00000001-PHOTO.jpg>'),
+            ('01/02/2024', '08:00:00', 'conta de luz'),
+        ]
+        obtido = [(m.data, m.hora, m.mensagem) for m in mescladas]
+        if obtido != esperado:
+            print(f"❌ Mescla incorreta: {obtido}")
+            return False
+        if mescladas[3].anexo != '00000001-PHOTO.jpg':
+            print(f"❌ Anexo perdido na mescla: {mescladas[3].anexo!r}")
+            return False
+        print("✅ Mescla de chats funcionando corretamente!")
+        return True
+
+    except Exception as e:
+        print(f"❌ Erro no teste de mescla de chats: {e}")
+        return False
+
+
+def testar_journal_jsonl():
+    """Testa a leitura incremental do journal JSON Lines com escrita interrompida e linha corrompida"""
+    print("\n--- Testando Journal JSONL ---")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = os.path.join(tmp, 'extract.jsonl')
+            anexar_linhas_jsonl(journal, [{'arquivo': 'a.jpg'}, {'arquivo': 'b.jpg'}])
+            # Escrita em andamento: a última linha ainda não tem a quebra final
+            with open(journal, 'ab') as f:
+                f.write(b'{"arquivo": "c.j')
+            registros, offset = ler_linhas_jsonl(journal)
+            if [r['arquivo'] for r in registros] != ['a.jpg', 'b.jpg']:
+                print(f"❌ Leitura com linha final incompleta: {registros}")
+                return False
+            if ler_linhas_jsonl(journal, offset) != ([], offset):
+                print("❌ Linha incompleta não ficou pendente para a próxima leitura")
+                return False
+
+            # A escrita foi interrompida: o próximo acréscimo isola o trecho corrompido em sua própria linha
+            anexar_linhas_jsonl(journal, [{'arquivo': 'd.jpg'}, {'arquivo': 'e.jpg'}])
+            registros, novo_offset = ler_linhas_jsonl(journal, offset)
+            if [r['arquivo'] for r in registros] != ['d.jpg', 'e.jpg'] or novo_offset != os.path.getsize(journal):
+                print(f"❌ Linha corrompida no meio do journal não foi descartada: {registros}")
+                return False
+            registros, _ = ler_linhas_jsonl(journal)
+            if [r['arquivo'] for r in registros] != ['a.jpg', 'b.jpg', 'd.jpg', 'e.jpg']:
+                print(f"❌ Releitura completa do journal incorreta: {registros}")
+                return False
+
+        print("✅ Journal JSONL funcionando corretamente!")
+        return True
+
+    except Exception as e:
+        print(f"❌ Erro no teste do journal JSONL: {e}")
+        return False
+
+
+def _medir_importacao(codigo):
+    """Executa `codigo` em um interpretador novo com -X importtime.
+
+    Retorna o tempo acumulado (ms) dos módulos do pacote importados no nível superior e o
+    conjunto de todos os módulos carregados."""
+    raiz_src = str(Path(__file__).resolve().parent.parent)
+    ambiente = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [raiz_src, os.environ.get('PYTHONPATH')])))
+    saida = subprocess.run([sys.executable, '-X', 'importtime', '-c', codigo],
+                           capture_output=True, text=True, env=ambiente, check=True).stderr
+    total_us = 0
+    modulos = set()
+    for linha in saida.splitlines():
+        if not linha.startswith('import time:') or '|' not in linha:
+            continue
+        _, acumulado, nome = linha.split('|', 2)
+        if not acumulado.strip().isdigit():
+            continue
+        modulos.add(nome.strip())
+        # Sem recuo: importação de nível superior; o acumulado já inclui as dependências
+        if nome.startswith(' wa_fin_ctrl'):
+            total_us += int(acumulado)
+    return total_us / 1000, modulos
+
+
+def testar_tempo_importacao():
+    """Testa o tempo de inicialização dos comandos leves e que OpenCV, Tesseract e OpenAI não são carregados"""
+    print("\n--- Testando Tempo de Importação ---")
+
+    try:
+        tempo_ms, modulos = _medir_importacao("import wa_fin_ctrl.cli, wa_fin_ctrl.history")
+        pesados = sorted(m for m in modulos if m.split('.')[0] in MODULOS_PESADOS + ('pandas', 'numpy'))
+        if pesados:
+            print(f"❌ CLI/history carregaram dependências pesadas: {pesados[:5]}")
+            return False
+        if tempo_ms > ORCAMENTO_IMPORTACAO_MS:
+            print(f"❌ Importação da CLI/history levou {tempo_ms:.0f} ms (orçamento: {ORCAMENTO_IMPORTACAO_MS} ms)")
+            return False
+        print(f"✅ CLI/history importados em {tempo_ms:.0f} ms (orçamento: {ORCAMENTO_IMPORTACAO_MS} ms)")
+
+        # dismiss e verificar usam o módulo app: pandas sim, OCR e IA não
+        _, modulos = _medir_importacao("import wa_fin_ctrl.app")
+        pesados = sorted(m for m in modulos if m.split('.')[0] in MODULOS_PESADOS)
+        if pesados:
+            print(f"❌ wa_fin_ctrl.app carregou dependências de OCR/IA: {pesados[:5]}")
+            return False
+        print("✅ wa_fin_ctrl.app não carrega OpenCV, Tesseract, PIL nem OpenAI")
+        return True
+
+    except Exception as e:
+        print(f"❌ Erro no teste de tempo de importação: {e}")
+        return False
+
+
 def executar_todos_testes():
     """Executa todos os testes disponíveis"""
     print("🧪 Iniciando testes do sistema...")
@@ -241,8 +547,13 @@ def executar_todos_testes():
     testes = [
         testar_ocr_individual,
         testar_funcoes_chatgpt,
+        testar_extracao_valores,
         testar_processamento_completo,
-        testar_sistema_historico
+        testar_sistema_historico,
+        testar_tempo_importacao,
+        testar_banco_dados,
+        testar_mescla_chats,
+        testar_journal_jsonl
     ]
 
     resultados = []
@@ -259,7 +570,7 @@ def executar_todos_testes():
     print("📊 RESUMO DOS TESTES")
     print("="*50)
 
-    nomes_testes = ["OCR Individual", "Funções ChatGPT", "Processamento Completo", "Histórico"]
+    nomes_testes = ["OCR Individual", "Funções ChatGPT", "Extração de Valores", "Processamento Completo", "Histórico", "Tempo de Importação", "Banco de Dados", "Mescla de Chats", "Journal JSONL"]
     for i, (nome, resultado) in enumerate(zip(nomes_testes, resultados)):
         status = "✅ PASSOU" if resultado else "❌ FALHOU"
         print(f"{i+1}. {nome}: {status}")
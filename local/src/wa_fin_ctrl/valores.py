@@ -0,0 +1,104 @@
+# valores.py
+# Caminho relativo ao projeto: valores.py
+# Extração de valores monetários do texto OCR em uma única varredura, compartilhada pelo processamento e pelos relatórios
+import re
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+import pandas as pd
+from .helper import normalize_value_to_brazilian_format
+
+# Um número candidato com o contexto que o qualifica como valor monetário: um prefixo
+# ("R$", "valor pago", "valor total", "valor a pagar", "valor:") e/ou um sufixo verificado
+# sem consumir o texto ("reais", "via celular", "realizado", "R$ dados"/"R$ via"/"R$ realizado", "R$").
+# Números sem contexto são ignorados.
+PADRAO_VALOR_MONETARIO = re.compile(r"""
+    (?:
+        (?P<prefixo_rs>R\$)
+      | (?P<prefixo_pago>valor\s*pago)
+      | (?P<prefixo_total>valor\s*total)
+      | (?P<prefixo_a_pagar>valor\s*a\s*pagar)
+      | (?P<prefixo_valor>valor\s*:)
+    )?
+    \s*(?P<numero>[.,]*\d[\d.,]*)
+    (?=\s*(?:
+        (?P<sufixo_reais>reais)
+      | (?P<sufixo_celular>via\s*celular)
+      | (?P<sufixo_realizado>realizado)
+      | (?P<sufixo_rs_realizado>R\$\s*realizado)
+      | (?P<sufixo_rs_dados>R\$\s*dados)
+      | (?P<sufixo_rs_via>R\$\s*via)
+      | (?P<sufixo_rs>R\$)
+    )?)
+""", re.IGNORECASE | re.VERBOSE)
+
+# Prioridade de cada contexto no critério 'prioridade' (menor vence; empate pela posição no texto),
+# na ordem em que o relatório sempre testou os padrões. Um "R$" isolado depois do número não conta
+# para o relatório (em "01/04/2025 R$" pegaria o ano): só vale seguido de "realizado", "dados" ou
+# "via". O critério 'maior' aceita qualquer contexto.
+PRIORIDADE_CONTEXTO = {
+    'prefixo_rs': 0,
+    'sufixo_reais': 1,
+    'sufixo_celular': 2,
+    'sufixo_realizado': 3,
+    'sufixo_rs_realizado': 4,
+    'prefixo_pago': 5,
+    'sufixo_rs_dados': 6,
+    'prefixo_valor': 7,
+    'sufixo_rs_via': 8,
+    'prefixo_total': 9,
+    'prefixo_a_pagar': 10,
+}
+
+CRITERIOS = ('maior', 'prioridade')
+
+
+class CandidatoValor(NamedTuple):
+    """Valor encontrado no texto: formato brasileiro, numérico, prioridade do contexto (None se
+    nenhum contexto vale para o critério 'prioridade') e posição."""
+    valor: str
+    numero: float
+    prioridade: Optional[int]
+    posicao: int
+
+
+def encontrar_candidatos_valor(texto: str) -> List[CandidatoValor]:
+    """Percorre o texto uma única vez e retorna todos os valores monetários candidatos."""
+    candidatos = []
+    for encontrado in PADRAO_VALOR_MONETARIO.finditer(texto or ''):
+        contextos = [nome for nome, trecho in encontrado.groupdict().items() if trecho and nome != 'numero']
+        if not contextos:
+            continue
+        valor = normalize_value_to_brazilian_format(re.sub(r'[^\d,.]', '', encontrado.group('numero')))
+        try:
+            numero = float(valor.replace(',', '.'))
+        except ValueError:
+            continue
+        prioridade = min((PRIORIDADE_CONTEXTO[nome] for nome in contextos if nome in PRIORIDADE_CONTEXTO), default=None)
+        candidatos.append(CandidatoValor(valor, numero, prioridade, encontrado.start('numero')))
+    return candidatos
+
+
+@lru_cache(maxsize=4096)
+def extrair_valor_monetario(texto: str, criterio: str = 'maior') -> str:
+    """Escolhe o valor do comprovante entre os candidatos do texto OCR.
+
+    'maior' retorna o maior valor (geralmente o total); 'prioridade' retorna o primeiro valor do
+    contexto mais confiável ("R$ 123,45" antes de "123,45 reais", e assim por diante).
+    Retorna o valor no formato brasileiro ("1533,27") ou "" se nada for encontrado."""
+    if criterio not in CRITERIOS:
+        raise ValueError(f"Critério inválido: {criterio} (use {', '.join(CRITERIOS)})")
+    candidatos = encontrar_candidatos_valor(texto)
+    if criterio == 'prioridade':
+        candidatos = [c for c in candidatos if c.prioridade is not None]
+    if not candidatos:
+        return ""
+    if criterio == 'maior':
+        return f"{max(c.numero for c in candidatos):.2f}".replace('.', ',')
+    return min(candidatos, key=lambda c: (c.prioridade, c.posicao)).valor
+
+
+def extrair_valores_serie(textos: pd.Series, criterio: str = 'maior') -> pd.Series:
+    """Versão em lote para uma Series de textos OCR; cada texto distinto é analisado uma única vez."""
+    textos = textos.fillna('').astype(str)
+    valores = {texto: extrair_valor_monetario(texto, criterio) for texto in textos.unique()}
+    return textos.map(valores)
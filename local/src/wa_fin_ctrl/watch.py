@@ -0,0 +1,133 @@
+# watch.py
+# Caminho relativo ao projeto: watch.py
+# Modo watch: processa as exportações do WhatsApp assim que chegam em input/, sem execução manual
+import os
+import time
+import threading
+from typing import Dict, Optional, Tuple
+from .env import ATTR_FIN_DIR_INPUT, ATTR_FIN_ARQ_CHAT, ATTR_FIN_WATCH_DEBOUNCE, ATTR_FIN_WATCH_INTERVALO
+
+# Arquivos que indicam uma exportação pronta para processar (o ZIP exportado ou o chat já extraído)
+SUFIXOS_EXPORTACAO = ('.zip', ATTR_FIN_ARQ_CHAT)
+
+
+def _fotografar_diretorio(diretorio: str) -> Dict[str, Tuple[int, int]]:
+    """Nome -> (tamanho, mtime_ns) dos arquivos do diretório, para o monitoramento por polling."""
+    try:
+        with os.scandir(diretorio) as entradas:
+            return {e.name: (e.stat().st_size, e.stat().st_mtime_ns) for e in entradas if e.is_file()}
+    except FileNotFoundError:
+        return {}
+
+
+def exportacoes_pendentes(diretorio: str = ATTR_FIN_DIR_INPUT) -> Dict[str, Tuple[int, int]]:
+    """ZIPs e arquivos de chat aguardando processamento em `diretorio`, com tamanho e mtime_ns."""
+    return {nome: assinatura for nome, assinatura in _fotografar_diretorio(diretorio).items()
+            if nome.lower().endswith(SUFIXOS_EXPORTACAO)}
+
+
+class MonitorEntrada:
+    """Sinaliza alterações no diretório de entrada.
+
+    Usa o watchdog (inotify no Linux) quando instalado; sem ele, compara a cada `intervalo`
+    segundos o nome, o tamanho e o mtime dos arquivos."""
+
+    def __init__(self, diretorio: str = ATTR_FIN_DIR_INPUT, intervalo: float = ATTR_FIN_WATCH_INTERVALO):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self.modo: Optional[str] = None
+        self._alterado = threading.Event()
+        self._parar = threading.Event()
+        self._observador = None
+        self._thread = None
+
+    def iniciar(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            self.modo = 'polling'
+            self._thread = threading.Thread(target=self._monitorar_por_polling, name='wa-fin-watch', daemon=True)
+            self._thread.start()
+            return
+
+        alterado = self._alterado
+
+        class _Sinalizador(FileSystemEventHandler):
+            def on_any_event(self, event):
+                alterado.set()
+
+        self.modo = 'watchdog'
+        self._observador = Observer()
+        self._observador.schedule(_Sinalizador(), self.diretorio, recursive=False)
+        self._observador.start()
+
+    def _monitorar_por_polling(self):
+        anterior = _fotografar_diretorio(self.diretorio)
+        while not self._parar.wait(self.intervalo):
+            atual = _fotografar_diretorio(self.diretorio)
+            if atual != anterior:
+                anterior = atual
+                self._alterado.set()
+
+    def aguardar_alteracao(self, timeout: Optional[float] = None) -> bool:
+        """Espera a próxima alteração; retorna False se `timeout` expirou sem nenhuma."""
+        if not self._alterado.wait(timeout):
+            return False
+        self._alterado.clear()
+        return True
+
+    def descartar_alteracoes(self):
+        """Ignora as alterações acumuladas (por exemplo, as feitas pelo próprio processamento)."""
+        self._alterado.clear()
+
+    def parar(self):
+        self._parar.set()
+        if self._observador is not None:
+            self._observador.stop()
+            self._observador.join()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def observar_entrada(processar, debounce: float = ATTR_FIN_WATCH_DEBOUNCE, intervalo: float = ATTR_FIN_WATCH_INTERVALO,
+                     diretorio: str = ATTR_FIN_DIR_INPUT):
+    """Executa `processar()` sempre que uma exportação chega em `diretorio`, até Ctrl+C.
+
+    Cada alteração reinicia a espera de `debounce` segundos, de modo que um ZIP ainda em cópia
+    (ou vários arquivos chegando juntos) dispara um único processamento, depois que o diretório
+    fica estável. As alterações feitas pelo próprio processamento (extração, arquivos movidos
+    para imgs/) são descartadas; uma exportação que chegou durante a execução é processada em seguida."""
+    monitor = MonitorEntrada(diretorio, intervalo)
+    monitor.iniciar()
+    print(f"👀 Observando {diretorio}/ ({monitor.modo}, debounce de {debounce:g}s). Ctrl+C para encerrar.")
+    try:
+        pendente = bool(exportacoes_pendentes(diretorio))
+        while True:
+            if not pendente:
+                # Timeout curto para que Ctrl+C seja atendido mesmo sem alterações
+                while not monitor.aguardar_alteracao(timeout=1):
+                    pass
+            # Debounce: só segue quando o diretório fica `debounce` segundos sem alterações
+            while monitor.aguardar_alteracao(timeout=debounce):
+                pass
+            antes = exportacoes_pendentes(diretorio)
+            if not antes:
+                pendente = False
+                continue
+            print(f"📥 Nova exportação em {diretorio}/: {', '.join(sorted(antes))} - iniciando processamento")
+            inicio = time.perf_counter()
+            try:
+                processar()
+                print(f"✅ Exportação processada em {time.perf_counter() - inicio:.1f}s")
+            except Exception as e:
+                print(f"❌ Erro ao processar exportação: {e}")
+            monitor.descartar_alteracoes()
+            # Só repete se chegou (ou mudou) algo durante a execução; o que já estava lá e não foi
+            # consumido espera uma nova alteração, para não repetir uma falha em laço
+            pendente = any(assinatura != antes.get(nome) for nome, assinatura in exportacoes_pendentes(diretorio).items())
+    except KeyboardInterrupt:
+        print("\n👋 Modo watch encerrado")
+    finally:
+        monitor.parar()
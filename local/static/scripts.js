@@ -215,6 +215,34 @@ function finishRowEditing(row) {
   });
 }
 
+// Status finais de um job em segundo plano (GET /jobs/{id})
+const JOB_STATUS_FINAIS = ['concluido', 'falhou', 'cancelado'];
+const JOB_INTERVALO_POLLING_MS = 1000;
+
+// Função para aguardar o job enfileirado por /fix ou /process chegar a um status final.
+// A resposta 202 só confirma o enfileiramento; o resultado vem de data.status_url.
+async function aguardarJob(response) {
+  const result = await response.json();
+  const statusUrl = result.data && result.data.status_url;
+  if (!statusUrl) return result;
+
+  while (true) {
+    const statusResponse = await fetch(statusUrl);
+    if (!statusResponse.ok) {
+      throw new Error(`HTTP ${statusResponse.status} ao consultar ${statusUrl}`);
+    }
+    const job = await statusResponse.json();
+    if (JOB_STATUS_FINAIS.includes(job.status)) {
+      console.log(`Job ${job.id} finalizado: ${job.status}`);
+      if (job.status !== 'concluido') {
+        throw new Error(job.error || `job ${job.status}`);
+      }
+      return job;
+    }
+    await new Promise(resolve => setTimeout(resolve, JOB_INTERVALO_POLLING_MS));
+  }
+}
+
 // Função para salvar alterações de uma linha
 async function saveRowChanges(dataHora) {
   const row = document.querySelector(`tr[data-data-hora="${dataHora}"]`);
@@ -274,13 +302,13 @@ async function saveRowChanges(dataHora) {
     console.log('Resposta da API:', response.status, response.statusText);
     
     if (response.ok) {
-      const result = await response.json();
+      const result = await aguardarJob(response);
       console.log('Resultado da API:', result);
       // Sucesso
       row.classList.add('row-saved');
       console.log('Alterações salvas com sucesso, aguardando recarregamento...');
       
-      // Aguarda um pouco para o WebSocket processar e depois recarrega
+      // Mostra a confirmação por um instante e depois recarrega
       setTimeout(() => {
         row.classList.remove('row-saved');
         finishRowEditing(row);
@@ -348,6 +376,7 @@ async function dismissRow(dataHora) {
     });
     
     if (response.ok) {
+      await aguardarJob(response);
       row.classList.add('dismiss-row');
       row.querySelector('.descricao-cell').textContent = 'desconsiderado';
       console.log('Linha marcada como desconsiderada, recarregando página...');
@@ -361,7 +390,9 @@ async function dismissRow(dataHora) {
     }
   } catch (error) {
     console.error('Erro ao desconsiderar:', error);
-    alert('Erro ao desconsiderar linha');
+    row.classList.add('row-error');
+    setTimeout(() => row.classList.remove('row-error'), 500);
+    alert(`Erro ao desconsiderar linha: ${error.message}`);
   } finally {
     row.classList.remove('row-saving');
   }
@@ -388,6 +419,7 @@ async function rotateImage(dataHora) {
     });
     
     if (response.ok) {
+      await aguardarJob(response);
       alert('Imagem rotacionada com sucesso!');
       // Recarregar a página para mostrar a imagem rotacionada
       location.reload();
@@ -396,7 +428,9 @@ async function rotateImage(dataHora) {
     }
   } catch (error) {
     console.error('Erro ao rotacionar:', error);
-    alert('Erro ao rotacionar imagem');
+    row.classList.add('row-error');
+    setTimeout(() => row.classList.remove('row-error'), 500);
+    alert(`Erro ao rotacionar imagem: ${error.message}`);
   } finally {
     row.classList.remove('row-saving');
   }
@@ -422,7 +456,8 @@ async function reprocessAI(dataHora) {
     });
     
     if (response.ok) {
-      alert('Reprocessamento com IA iniciado!');
+      await aguardarJob(response);
+      alert('Reprocessamento com IA concluído!');
       // Recarregar a página para mostrar os novos dados
       location.reload();
     } else {
@@ -430,7 +465,9 @@ async function reprocessAI(dataHora) {
     }
   } catch (error) {
     console.error('Erro ao reprocessar:', error);
-    alert('Erro ao reprocessar com IA');
+    row.classList.add('row-error');
+    setTimeout(() => row.classList.remove('row-error'), 500);
+    alert(`Erro ao reprocessar com IA: ${error.message}`);
   } finally {
     row.classList.remove('row-saving');
   }
@@ -449,9 +486,20 @@ function setupWebSocket() {
             if (event.data === 'reload') {
                 console.log('Recebido comando de reload via WebSocket');
                 location.reload();
+            } else if (event.data.startsWith('{')) {
+                // Evento de progresso do pipeline: etapa, itens concluídos/total e ETA
+                const evento = JSON.parse(event.data);
+                if (evento.type === 'progress') {
+                    const total = evento.total === null ? '?' : evento.total;
+                    const eta = evento.eta_seconds === null ? '' : ` (ETA ${evento.eta_seconds}s)`;
+                    console.log(`Progresso ${evento.stage}: ${evento.status} ${evento.done}/${total}${eta}`);
+                } else if (evento.type === 'job' && evento.job.status !== 'concluido') {
+                    // Falha ou cancelamento de um job em segundo plano (o sucesso chega como 'reload')
+                    console.error(`Job ${evento.job.type} ${evento.job.id} ${evento.job.status}: ${evento.job.error || ''}`);
+                }
             }
         };
-        
+
         ws.onclose = function() {
             console.log('WebSocket fechado, tentando reconectar...');
             setTimeout(setupWebSocket, 1000);
@@ -507,8 +555,8 @@ async function processAndReload(force = false, backup = false) {
         });
         
         if (response.ok) {
-            const result = await response.json();
-            console.log('Processamento concluído:', result.message);
+            const result = await aguardarJob(response);
+            console.log('Processamento concluído:', result.status);
             
             // Aguarda um pouco antes de recarregar para dar tempo do WebSocket
             setTimeout(() => {
@@ -519,7 +567,7 @@ async function processAndReload(force = false, backup = false) {
         }
     } catch (error) {
         console.error('Erro ao processar:', error);
-        alert('Erro ao processar arquivos');
+        alert(`Erro ao processar arquivos: ${error.message}`);
     }
 }
 